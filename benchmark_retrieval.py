@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+知识库检索性能基准测试
+Retrieval benchmark on synthetic PXI-domain corpora
+
+生成中英文混合、带产品型号的合成语料（默认1k/10k/100k文档），测量搜索引擎
+fit_documents 耗时和峰值内存，以及 search / get_relevant_content 的 p50/p95/p99 延迟，
+结果以JSON输出，用于在切换搜索引擎或修改索引代码前发现性能回退。
+
+用法:
+    python benchmark_retrieval.py                          # 默认规模，TF-IDF引擎
+    python benchmark_retrieval.py --sizes 1000 10000 --engine bm25 --output bench.json
+
+每个语料规模在独立的子进程中运行，峰值内存（ru_maxrss）互不影响。
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+# 添加src目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# 合成语料词表：(型号前缀, 中文产品类别, 英文产品类别)
+PRODUCT_FAMILIES = [
+    ('PXIe-5', '高速示波器', 'oscilloscope'),
+    ('PXIe-4', '源测量单元', 'source measure unit'),
+    ('PXIe-6', '多功能数据采集卡', 'multifunction DAQ'),
+    ('JY55', '数据采集卡', 'data acquisition card'),
+    ('PXIe-2', '矩阵开关模块', 'switch matrix'),
+    ('PXIe-1', '机箱', 'chassis'),
+    ('JY83', '数字IO卡', 'digital I/O module'),
+    ('PXIe-8', '嵌入式控制器', 'embedded controller'),
+]
+
+FEATURES = [
+    ('同步触发', 'trigger synchronization'),
+    ('采样率', 'sample rate'),
+    ('通道隔离', 'channel isolation'),
+    ('串扰', 'crosstalk'),
+    ('校准', 'calibration'),
+    ('驱动安装', 'driver installation'),
+    ('LabVIEW编程', 'LabVIEW programming'),
+    ('Python接口', 'Python API'),
+    ('固件升级', 'firmware update'),
+    ('温度漂移', 'temperature drift'),
+    ('模拟带宽', 'analog bandwidth'),
+    ('垂直分辨率', 'vertical resolution'),
+    ('DMA传输', 'DMA transfer'),
+    ('多卡同步', 'multi-card synchronization'),
+    ('参考时钟', 'reference clock'),
+    ('故障排查', 'troubleshooting'),
+]
+
+CATEGORIES = ['product', 'manual', 'support', 'application', 'general']
+DOC_TYPES = ['pdf', 'word', 'excel', 'text']
+
+SENTENCES_ZH = [
+    "{model}{family}支持{channels}通道{feature}，最高采样率{rate} MS/s。",
+    "使用{model}进行{feature}时，请先在测控平台中完成{other}配置。",
+    "{model}的{feature}指标在{temp}℃环境下保持稳定，误差小于{error}%。",
+    "如果{model}出现{feature}异常，建议检查{other}并重新启动{family}。",
+    "在PXI系统中，{family}通过背板总线实现{feature}，延迟约{latency}微秒。",
+]
+
+SENTENCES_EN = [
+    "The {model} {family_en} provides {channels} channels with {feature_en} up to {rate} MS/s.",
+    "Configure {other_en} before enabling {feature_en} on the {model}.",
+    "{feature_en} on the {model} stays within {error}% across {temp} degrees Celsius.",
+    "See the {model} user manual for {feature_en} and {other_en} examples.",
+]
+
+def make_model_numbers(rng: random.Random, count: int) -> list:
+    """生成不重复的产品型号及其所属产品族"""
+    models = {}
+    while len(models) < count:
+        family = rng.choice(PRODUCT_FAMILIES)
+        models.setdefault(f"{family[0]}{rng.randint(100, 999)}", family)
+    return list(models.items())
+
+def make_sentence(rng: random.Random, model: str, family: tuple) -> str:
+    """生成一个中文或英文句子"""
+    feature, feature_en = rng.choice(FEATURES)
+    other, other_en = rng.choice(FEATURES)
+    template = rng.choice(SENTENCES_ZH if rng.random() < 0.7 else SENTENCES_EN)
+    return template.format(
+        model=model, family=family[1], family_en=family[2],
+        feature=feature, feature_en=feature_en, other=other, other_en=other_en,
+        channels=rng.choice([2, 4, 8, 16, 32, 64]), rate=rng.choice([1, 10, 100, 250, 1000]),
+        temp=rng.randint(0, 55), error=round(rng.uniform(0.01, 0.5), 2), latency=rng.randint(1, 50)
+    )
+
+def generate_corpus(size: int, seed: int, content_store):
+    """
+    生成合成语料（正文写入内容存储，与线上索引的内存形态一致）
+
+    Returns:
+        (增强文档列表, 型号列表)
+    """
+    from models.enhanced_knowledge import EnhancedDocument
+
+    rng = random.Random(seed)
+    models = make_model_numbers(rng, max(50, size // 50))
+    documents = []
+
+    for idx in range(size):
+        model, family = rng.choice(models)
+        feature, _ = rng.choice(FEATURES)
+        content = "\n".join(
+            make_sentence(rng, model if rng.random() < 0.8 else rng.choice(models)[0], family)
+            for _ in range(rng.randint(8, 30))
+        )
+        doc = EnhancedDocument(
+            # 使用不会与真实文档冲突的ID
+            doc_id=10_000_000 + idx,
+            filename=f"{model}_{idx}.txt",
+            content=content,
+            doc_type=rng.choice(DOC_TYPES),
+            category=rng.choice(CATEGORIES),
+            title=f"{model} {family[1]}{feature}说明",
+            description=f"{family[2]} {model}",
+            keywords=[],
+            summary=content[:200]
+        )
+        doc.attach_content_store(content_store)
+        documents.append(doc)
+
+    return documents, [model for model, _ in models]
+
+def generate_queries(count: int, seed: int, models: list) -> list:
+    """生成查询：型号、中文问题、英文短语和中英混合"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        model = rng.choice(models)
+        feature, feature_en = rng.choice(FEATURES)
+        queries.append(rng.choice([
+            model,
+            f"{model} {feature}",
+            f"如何解决{feature}问题？",
+            f"{feature_en} {rng.choice(PRODUCT_FAMILIES)[2]}",
+            f"{model}的{feature}和{rng.choice(FEATURES)[0]}",
+        ]))
+    return queries
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），平台不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def latency_summary(latencies: list) -> dict:
+    """延迟统计（毫秒）"""
+    import numpy as np
+
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'mean': round(float(values.mean()), 3),
+        'max': round(float(values.max()), 3)
+    }
+
+def time_calls(func, queries: list) -> list:
+    """逐个查询计时"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_single(size: int, engine_name: str, query_count: int, seed: int) -> dict:
+    """在当前进程中对一个语料规模运行基准测试"""
+    import shutil
+    from config.knowledge_config import knowledge_config
+
+    work_dir = tempfile.mkdtemp(prefix='ruishi-bench-')
+    # 索引文件写入临时目录；不持久化、不监听文档变更、不使用全文索引，只测量搜索引擎本身
+    knowledge_config.update({
+        'index_dir': work_dir,
+        'persist_index': False,
+        'incremental_index': False,
+        'hybrid_search': False,
+        'background_build': False,
+        'retrieval_cache_size': 0
+    })
+
+    from models.content_store import ContentStore
+    from models.enhanced_knowledge import enhanced_knowledge_base, create_search_engine, IndexSnapshot
+
+    try:
+        content_store = ContentStore.create(os.path.join(work_dir, 'content'))
+
+        start = time.perf_counter()
+        documents, models = generate_corpus(size, seed, content_store)
+        corpus_seconds = time.perf_counter() - start
+        queries = generate_queries(query_count, seed, models)
+        rss_before_fit = peak_rss_mb()
+
+        engine = create_search_engine(engine_name)
+        start = time.perf_counter()
+        engine.fit_documents(documents)
+        fit_seconds = time.perf_counter() - start
+        if not engine.is_fitted:
+            raise RuntimeError(f"搜索引擎训练失败: {engine_name}")
+
+        snapshot = IndexSnapshot(engine, {doc.doc_id: doc for doc in documents}, 1)
+
+        # 预热（首次查询会加载jieba词典、建立映射等）
+        for query in queries[:5]:
+            engine.search(query, top_k=5)
+
+        search_latencies = time_calls(lambda query: engine.search(query, top_k=5), queries)
+        content_budget = knowledge_config['context_token_budget']
+        content_latencies = time_calls(
+            lambda query: enhanced_knowledge_base._assemble_context(snapshot, query, 3, 3, content_budget), queries
+        )
+
+        return {
+            'documents': size,
+            'chunks': int(len(engine.chunk_doc_rows)),
+            'corpus_bytes': content_store.size(),
+            'corpus_seconds': round(corpus_seconds, 3),
+            'fit_seconds': round(fit_seconds, 3),
+            'peak_rss_mb_before_fit': rss_before_fit,
+            'peak_rss_mb': peak_rss_mb(),
+            'search_ms': latency_summary(search_latencies),
+            'get_relevant_content_ms': latency_summary(content_latencies)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_in_subprocess(size: int, args) -> dict:
+    """在子进程中运行一个语料规模，解析其输出的JSON"""
+    command = [
+        sys.executable, os.path.abspath(__file__), '--single', str(size),
+        '--engine', args.engine, '--queries', str(args.queries), '--seed', str(args.seed)
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'documents': size, 'error': (completed.stderr.strip().splitlines() or ['unknown'])[-1]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='知识库检索性能基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='语料文档数')
+    parser.add_argument('--engine', default='tfidf', help='搜索引擎名称（tfidf / bm25 / hashing）')
+    parser.add_argument('--queries', type=int, default=200, help='每项测量的查询数')
+    parser.add_argument('--seed', type=int, default=42, help='语料随机种子')
+    parser.add_argument('--output', help='结果JSON文件路径（默认只输出到标准输出）')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_single(args.single, args.engine, args.queries, args.seed), ensure_ascii=False))
+        return
+
+    results = []
+    for size in args.sizes:
+        print(f"基准测试: {size} 文档, 引擎 {args.engine} ...", file=sys.stderr)
+        results.append(run_in_subprocess(size, args))
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'engine': args.engine,
+        'queries': args.queries,
+        'seed': args.seed,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"结果已保存: {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+文档批量导入命令行工具
+Command-line bulk import of documents from a zip/tar archive or a directory
+
+用法: python bulk_import.py <压缩包或目录> [--category 分类] [--username 上传者]
+
+导入结束后更新并持久化知识库索引，服务启动时直接加载。服务运行期间请使用管理后台的
+批量导入接口（POST /admin/documents/import），由服务进程更新其内存中的索引。
+"""
+
+import sys
+import json
+import logging
+import argparse
+
+from models.database import user_manager, document_manager
+from models.bulk_import import BulkImporter
+from models.upload_stream import UploadRejected
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='批量导入文档到知识库')
+    parser.add_argument('source', help='zip/tar压缩包或目录')
+    parser.add_argument('--category', default='general', help='文档分类（默认 general）')
+    parser.add_argument('--username', default='admin', help='记录为上传者的用户名（默认 admin）')
+    parser.add_argument('--workers', type=int, default=None, help='并行提取的线程数（默认按配置）')
+    parser.add_argument('--no-index', action='store_true', help='只导入数据库，不更新知识库索引（服务下次启动时重建）')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    user = user_manager.get_user_by_username(args.username)
+    if not user:
+        print(f"用户不存在: {args.username}", file=sys.stderr)
+        return 1
+
+    knowledge_base = None
+    if not args.no_index:
+        # 加载知识库（注册文档变更监听器），导入结束时一次增量更新并持久化索引
+        from models.enhanced_knowledge import enhanced_knowledge_base as knowledge_base
+        knowledge_base.wait_until_ready()
+
+    try:
+        summary = BulkImporter(document_manager, user['id'], args.category, workers=args.workers).run(args.source)
+    except UploadRejected as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    # 新增文档较多时索引会在后台重新训练，等待完成后再退出
+    if knowledge_base is not None and knowledge_base.refit_thread is not None:
+        knowledge_base.refit_thread.join()
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if not summary['failed'] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
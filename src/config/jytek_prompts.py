@@ -302,13 +302,23 @@ def get_prompt_template(prompt_type: str) -> str:
     return templates.get(prompt_type, JYTEK_COMPANY_CONTEXT)
 
 # 组合提示词
-def build_enhanced_prompt(question: str, context_type: str = 'company', additional_context: str = '') -> str:
-    """构建增强的提示词"""
+def build_enhanced_prompt(question: str, context_type: str = 'company', additional_context: str = '',
+                          knowledge_context=None) -> str:
+    """
+    构建增强的提示词
     
-    # 如果有知识库内容，优先使用知识库内容回答
-    if additional_context and "相关知识库内容：" in additional_context:
+    knowledge_context 为知识库上下文组装器的输出（AssembledContext），
+    已按提供商/模型的令牌预算截取并去除近似重复的片段。
+    """
+    
+    knowledge_content = ""
+    if knowledge_context:
+        knowledge_content = knowledge_context.text
+    elif additional_context and "相关知识库内容：" in additional_context:
         knowledge_content = additional_context.replace("相关知识库内容：\n", "")
-        
+    
+    # 如果有知识库内容，优先使用知识库内容回答
+    if knowledge_content:
         enhanced_prompt = f"""你是简仪科技（JYTEK）锐视测控平台的专业AI助手。
 
 ## 重要：请优先基于以下知识库内容回答用户问题
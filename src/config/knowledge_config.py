@@ -0,0 +1,134 @@
+"""
+知识库索引配置
+Knowledge index configuration
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 默认配置，可在 config.json 的 "knowledge_index" 段中覆盖
+DEFAULT_KNOWLEDGE_CONFIG = {
+    # 增量索引：上传/删除文档时只追加或标记单个文档，而不是全量重建
+    'incremental_index': True,
+    # 增量变更数占已训练文档数的比例超过该阈值时，后台重新计算词表和IDF
+    'refit_drift_threshold': 0.2,
+    # 索引持久化：启动时语料指纹未变化则直接映射加载，无需重新提取和训练
+    'persist_index': True,
+    # 索引文件目录（相对于 src 目录）
+    'index_dir': 'data/index',
+    # 增量变更的索引持久化（每次写入都导出整个索引）：未保存的变更累计达到 persist_batch_changes 个时
+    # 立即写入，否则在第一个未保存的变更之后 persist_delay 秒写入一次；进程退出时写入剩余变更
+    'persist_batch_changes': 50,
+    'persist_delay': 30,
+    # 提取缓存：按文件SHA-256和提取器版本缓存提取结果（data/extraction_cache.db）
+    'extraction_cache': True,
+    # 片段索引：检索时以重叠片段为单位，片段最大字符数和相邻片段重叠字符数
+    'chunk_size': 500,
+    'chunk_overlap': 100,
+    # 搜索引擎：'tfidf'（TF-IDF余弦相似度）、'bm25'（倒排索引BM25）
+    # 或 'hashing'（哈希向量流式索引，分片写入磁盘，适用于超出内存的语料）
+    'search_engine': 'tfidf',
+    # 检索缓存：按规范化查询和索引代数缓存检索结果的最大条目数（0表示关闭）
+    'retrieval_cache_size': 1024,
+    # 检索缓存条目有效期（秒），None表示只依赖索引代数失效
+    'retrieval_cache_ttl': None,
+    # 索引构建时并行提取和分词的工作进程数（0表示使用全部CPU核心，1表示串行）
+    'index_workers': 0,
+    # 索引工作进程处理一个分块的时间上限（秒，None表示不限）：超时的进程被结束，该分块改为在主进程中串行处理
+    'index_worker_timeout': 600,
+    # 后台构建索引：启动时不阻塞，构建完成前问答使用数据库SQL搜索
+    'background_build': True,
+    # 正文LRU缓存上限（MB，按UTF-8编码字节数计）：文档正文保存在内存映射的内容存储中，只有热点文档的正文
+    # 常驻内存；检索片段按字节偏移只解码片段本身，不读取整篇正文
+    'content_cache_mb': 64,
+    # 混合检索：文档搜索融合SQLite FTS5全文检索与搜索引擎的排名
+    'hybrid_search': True,
+    # 倒数排名融合常数k：score = Σ 1 / (k + rank)
+    'rrf_k': 60,
+    # 索引构建时每批从数据库读取、并行准备和写入索引的文档数
+    'index_batch_size': 500,
+    # 哈希向量维度（hashing 引擎），修改后需要重建索引
+    'hashing_features': 2 ** 20,
+    # 知识库上下文令牌预算（估算值）：默认预算，以及按 "提供商" 或 "提供商:模型" 覆盖
+    'context_token_budget': 2000,
+    'context_token_budgets': {
+        'claude': 3000,
+        'gemini': 3000,
+        'volcesDeepseek': 2000,
+        'qwen-plus': 2000,
+    },
+    # 组装上下文时与已选片段shingle相似度不低于该值的片段视为近似重复而丢弃
+    'context_dedup_threshold': 0.6,
+    # MMR权衡系数：越大越偏重相关度，越小越偏重与已选片段的差异
+    'context_mmr_lambda': 0.7,
+    # 保存文档时用MinHash签名检测近似重复，与新文档估计Jaccard相似度不低于阈值的旧文档被取代（移出索引）
+    'dedup_enabled': True,
+    'dedup_threshold': 0.85,
+    # 文档导入任务的后台工作线程数（上传请求只保存文件并返回任务ID）
+    'ingestion_workers': 2,
+    # 处理中的导入任务每隔 ingestion_heartbeat_interval 秒更新心跳；心跳超过 ingestion_stale_seconds 秒
+    # 未更新的任务视为所属进程已退出，由下一个启动的服务进程重新排队
+    'ingestion_heartbeat_interval': 30,
+    'ingestion_stale_seconds': 300,
+    # Excel只读流式提取：每个工作表最多读取的行数、整个工作簿最多读取的单元格数（None表示不限）
+    'excel_max_rows': 100000,
+    'excel_max_cells': 2000000,
+    # Excel按工作表分块建立片段索引（每块不超过chunk_size个字符，片段不跨工作表）
+    'excel_sheet_chunks': True,
+    # PDF分页并行提取的工作进程数（0表示使用全部CPU核心，1表示串行）；页数少于下限的PDF串行提取
+    'pdf_workers': 0,
+    'pdf_parallel_min_pages': 32,
+    # 每个提取任务处理的连续页数（每个任务都要重新打开PDF）
+    'pdf_pages_per_task': 8,
+    # 文档提取沙箱：在独立的沙箱进程中提取，超过时间（秒）或内存增长上限（MB）时结束进程并标记提取失败；
+    # 内存上限只在Linux上生效（读取/proc），Windows上只限制提取时间
+    'extraction_sandbox': True,
+    'extraction_timeout': 120,
+    'extraction_memory_mb': 1024,
+    # 批量导入：并行提取的线程数（0表示CPU核心数）、每个事务插入的文档数、单次导入的文件数上限
+    'bulk_import_workers': 0,
+    'bulk_import_batch_size': 200,
+    'bulk_import_max_files': 10000,
+    # 管理后台上传的导入压缩包大小上限（MB），以及允许按服务器路径导入的目录（为空时只能上传压缩包）
+    'bulk_import_max_archive_mb': 2048,
+    'bulk_import_roots': [],
+    # 大文本列（文档正文、AI回答）透明压缩：编码器 zlib 或 zstd（需安装zstandard）、
+    # 参与压缩的最小字节数、服务启动后在后台压缩已有数据时每批改写的行数。
+    # 默认关闭：开启后新写入的文本被压缩，旧版本程序不能读取；关闭后已压缩的文本仍可读取
+    'text_compression': False,
+    'text_compression_codec': 'zlib',
+    'text_compression_min_bytes': 512,
+    'text_compression_batch_size': 200,
+    # 数据库连接池：保留的空闲连接数、等待写锁的秒数、每个连接的页缓存（KB）和内存映射大小（MB）、
+    # 每个连接缓存的预编译语句数
+    'db_pool_size': 8,
+    'db_busy_timeout': 30,
+    'db_cache_size_kb': 8192,
+    'db_mmap_size_mb': 256,
+    'db_statement_cache_size': 256,
+}
+
+
+def load_knowledge_config(config_path: str = None) -> dict:
+    """加载知识库索引配置（默认值 + config.json 中的 knowledge_index 段）"""
+    if config_path is None:
+        config_path = os.path.join(os.path.dirname(__file__), '..', 'config.json')
+
+    config = dict(DEFAULT_KNOWLEDGE_CONFIG)
+
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                overrides = json.load(f).get('knowledge_index', {})
+            config.update(overrides)
+        except Exception as e:
+            logger.error(f"加载知识库索引配置失败: {e}")
+
+    return config
+
+
+# 全局知识库索引配置
+knowledge_config = load_knowledge_config()
@@ -0,0 +1,14 @@
+"""
+数据目录配置
+Data directory for databases, uploaded files and caches
+"""
+
+import os
+
+# 数据目录：默认为 src/data，可用环境变量 RUISHI_DATA_DIR 指定（如测试使用临时目录）
+DATA_DIR = os.environ.get('RUISHI_DATA_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def data_path(*parts: str) -> str:
+    """数据目录下的路径"""
+    return os.path.join(DATA_DIR, *parts)
@@ -0,0 +1,61 @@
+"""
+数据库维护命令行工具
+Command-line database maintenance: compress existing text, reclaim free pages, remove unreferenced uploads
+
+用法: python db_maintenance.py compress | vacuum [--min-ratio 比例] | collect-files
+
+compress 把已有的未压缩大文本改写为压缩格式（需在配置中开启 text_compression）；
+vacuum 执行VACUUM收缩数据库文件，执行期间服务进程不能写入数据库，建议在维护窗口执行。
+两者与服务进程的压缩迁移通过维护租约互斥。
+collect-files 删除不再被有效文档引用的上传文件（已删除文档的原文件）。
+"""
+
+import sys
+import json
+import logging
+import argparse
+
+from config.knowledge_config import knowledge_config
+from models.database import db_manager, document_manager
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='数据库维护')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('compress', help='压缩已有的大文本')
+    vacuum = subparsers.add_parser('vacuum', help='执行VACUUM收缩数据库文件')
+    vacuum.add_argument('--min-ratio', type=float, default=0.0, help='空闲页占比低于该值时不执行（默认 0）')
+    subparsers.add_parser('collect-files', help='删除不再被有效文档引用的上传文件')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'compress':
+        if not knowledge_config['text_compression']:
+            print("text_compression 未开启，不压缩已有文本", file=sys.stderr)
+            return 1
+        lease = db_manager.acquire_maintenance_lease()
+        if lease is None:
+            print("其他进程正在维护数据库，请稍后重试", file=sys.stderr)
+            return 1
+        try:
+            print(json.dumps({'compressed_rows': db_manager.compress_existing_rows()}))
+        finally:
+            lease.release()
+        return 0
+
+    if args.command == 'collect-files':
+        print(json.dumps(document_manager.collect_unreferenced_blobs()))
+        return 0
+
+    try:
+        result = db_manager.reclaim_free_pages(args.min_ratio)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
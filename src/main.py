@@ -46,6 +46,27 @@ except ImportError as e:
     print(f"导入提示词模块失败: {e}")
     print("提示词功能将不可用")
 
+# 开始构建知识库索引（导入模块时不构建，默认在后台线程中进行）
+try:
+    from models.enhanced_knowledge import enhanced_knowledge_base
+    enhanced_knowledge_base.start()
+except ImportError as e:
+    print(f"知识库索引启动失败: {e}")
+
+# 数据库维护：在后台压缩已有的大文本（只在服务进程中执行，多个服务进程时只有一个执行）
+try:
+    from models.database import db_manager
+    db_manager.start_compression_migration()
+except ImportError as e:
+    print(f"数据库维护启动失败: {e}")
+
+# 重新排队中断的文档导入任务（命令行工具导入模块时不恢复，其他进程正在处理的任务不受影响）
+try:
+    from models.ingestion_queue import ingestion_queue
+    ingestion_queue.recover_jobs()
+except ImportError as e:
+    print(f"恢复导入任务失败: {e}")
+
 # Try to initialize LLM providers
 try:
     from models.llm_models import initialize_llm_providers
@@ -111,17 +132,41 @@ def serve_static_files(filename):
         print(f"Error serving {filename}: {e}")
         return f"文件未找到: {filename}", 404
 
+def _knowledge_index_state():
+    """知识库索引状态：building、ready、failed，模块无法导入时为 unavailable"""
+    try:
+        from models.enhanced_knowledge import enhanced_knowledge_base
+        return enhanced_knowledge_base.get_index_state()
+    except ImportError as e:
+        return {'status': 'unavailable', 'error': str(e)}
+
 @app.route('/api/health')
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: always 200, index status in the body)"""
+    index_state = _knowledge_index_state()
     return jsonify({
         'status': 'ok',
         'message': '锐视测控平台 API 运行正常',
         'platform': 'JYTEK Ruishi Control Platform',
         'static_folder': app.static_folder,
-        'files_exist': os.path.exists(os.path.join(app.static_folder, 'index.html'))
+        'files_exist': os.path.exists(os.path.join(app.static_folder, 'index.html')),
+        'index_status': index_state['status'],
+        'ready': index_state['status'] == 'ready',
+        'knowledge_index': index_state
     })
 
+@app.route('/api/ready')
+def readiness_check():
+    """Readiness endpoint (returns 503 until the knowledge index is ready)"""
+    index_state = _knowledge_index_state()
+    ready = index_state['status'] == 'ready'
+    return jsonify({
+        'ready': ready,
+        'index_status': index_state['status'],
+        'message': '知识库索引已就绪' if ready else '知识库索引尚未就绪',
+        'knowledge_index': index_state
+    }), 200 if ready else 503
+
 @app.route('/api/company-info')
 def company_info():
     """Get company information"""
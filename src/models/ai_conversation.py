@@ -8,6 +8,7 @@ import time
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from models.database import db_manager
+from models.text_codec import compress_text, decompress_text
 import logging
 
 logger = logging.getLogger(__name__)
@@ -59,9 +60,9 @@ class AIConversationManager:
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 user_id, session_id, user_type, user_ip, user_agent,
-                question, answer, ai_provider, ai_model, trigger_type,
+                question, compress_text(answer), ai_provider, ai_model, trigger_type,
                 json.dumps(extracted_keywords) if extracted_keywords else None,
-                related_docs_json,
+                compress_text(related_docs_json),
                 json.dumps(document_names) if document_names else None,
                 response_time, datetime.now().isoformat()
             ))
@@ -526,7 +527,7 @@ class AIConversationManager:
             document_usage_dict = {}
             for row in cursor.fetchall():
                 try:
-                    related_docs = json.loads(row['related_documents'])
+                    related_docs = json.loads(decompress_text(row['related_documents']))
                     if related_docs:
                         for doc in related_docs:
                             doc_id = doc.get('id')
@@ -563,7 +564,7 @@ class AIConversationManager:
             document_type_usage = {}
             for row in cursor.fetchall():
                 try:
-                    docs = json.loads(row['related_documents'])
+                    docs = json.loads(decompress_text(row['related_documents']))
                     for doc in docs:
                         file_type = doc.get('file_type', 'unknown')
                         document_type_usage[file_type] = document_type_usage.get(file_type, 0) + row['usage_count']
@@ -0,0 +1,263 @@
+"""
+文档批量导入
+Bulk import of documents from zip/tar archives or server-side directories
+"""
+
+import os
+import uuid
+import shutil
+import logging
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from config.knowledge_config import knowledge_config
+from models.upload_stream import ALLOWED_EXTENSIONS, StagedUpload, UploadRejected, stream_to_file
+
+logger = logging.getLogger(__name__)
+
+# 导入结果中最多列出的失败文件数
+MAX_REPORTED_ERRORS = 100
+
+# zip通用标志位：文件名为UTF-8编码
+ZIP_UTF8_FLAG = 0x800
+
+
+def is_importable(name: str) -> bool:
+    """是否导入该条目：跳过隐藏文件、macOS元数据目录和不支持的文件类型"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part]
+    if not parts or any(part.startswith('.') or part == '__MACOSX' for part in parts):
+        return False
+    return os.path.splitext(parts[-1])[1].lower() in ALLOWED_EXTENSIONS
+
+
+def zip_entry_name(info: zipfile.ZipInfo) -> str:
+    """zip条目名：没有UTF-8标志的条目（Windows压缩工具常见）按GBK解码，路径分隔符统一为 /"""
+    name = info.filename
+    if not info.flag_bits & ZIP_UTF8_FLAG:
+        try:
+            name = name.encode('cp437').decode('gbk')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return name.replace('\\', '/')
+
+
+def is_allowed_directory(directory: str) -> bool:
+    """目录是否位于 bulk_import_roots 配置的某个目录下（管理后台只能导入这些目录）"""
+    real_path = os.path.realpath(directory)
+    for root in knowledge_config['bulk_import_roots']:
+        root = os.path.realpath(root)
+        if os.path.commonpath([real_path, root]) == root:
+            return True
+    return False
+
+
+def check_import_source(source: str):
+    """检查导入源是目录、zip或tar压缩包，否则抛出 UploadRejected"""
+    if os.path.isdir(source):
+        return
+    if os.path.isfile(source) and (zipfile.is_zipfile(source) or tarfile.is_tarfile(source)):
+        return
+    raise UploadRejected('导入源必须是zip/tar压缩包或目录')
+
+
+def iter_import_entries(source: str) -> Iterator[Tuple[str, BinaryIO, float]]:
+    """
+    逐个产出导入源中的文件 (相对路径, 可读文件对象, 已处理比例)
+
+    目录递归遍历；zip按中央目录逐个打开条目；tar以流模式顺序读取（压缩的tar不需要先解压）。
+    文件对象只在产出后、取下一个条目之前有效。
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.relpath(os.path.join(root, name), source) for name in sorted(files))
+        paths = [path for path in paths if is_importable(path)]
+        for index, path in enumerate(paths):
+            with open(os.path.join(source, path), 'rb') as f:
+                yield path, f, index / len(paths)
+        return
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            entries = [(info, zip_entry_name(info)) for info in archive.infolist() if not info.is_dir()]
+            entries = [(info, name) for info, name in entries if is_importable(name)]
+            for index, (info, name) in enumerate(entries):
+                with archive.open(info) as f:
+                    yield name, f, index / len(entries)
+        return
+
+    # 进度按已读取的压缩包字节数估计
+    total_size = max(os.path.getsize(source), 1)
+    with open(source, 'rb') as raw, tarfile.open(fileobj=raw, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and is_importable(member.name):
+                yield member.name, archive.extractfile(member), min(raw.tell() / total_size, 1.0)
+
+
+class BulkImporter:
+    """
+    文档批量导入
+
+    条目按顺序流式写入暂存目录（大小限制、SHA-256和类型嗅探与单个上传相同），文本提取在线程池中
+    并行执行（提取本身在沙箱子进程中），结果按 bulk_import_batch_size 分批在一个事务中入库；
+    全部完成后只通知一次索引更新。原始文件名和内容都相同的文件视为已导入并跳过，
+    中断后重新导入同一个压缩包不会产生重复文档。
+    """
+
+    def __init__(self, document_manager, user_id: int, category: str = 'general', workers: int = None,
+                 progress: Callable[[str, int], None] = None):
+        self.document_manager = document_manager
+        self.user_id = user_id
+        self.category = category
+        self.workers = max(1, workers or knowledge_config['bulk_import_workers'] or os.cpu_count() or 1)
+        self.batch_size = max(1, knowledge_config['bulk_import_batch_size'])
+        self.progress = progress
+        self.staging_dir = os.path.join(document_manager.upload_dir, '.staging', f"bulk-{uuid.uuid4().hex}")
+        self.summary = {'total': 0, 'imported': 0, 'skipped': 0, 'failed': 0, 'extraction_failed': 0,
+                        'errors': []}
+        self.batch = []
+        self.document_ids = []
+        self.superseded = []
+        self.reported_percent = None
+
+    def run(self, source: str) -> Dict:
+        """导入目录或压缩包中的全部文件，返回导入结果汇总"""
+        check_import_source(source)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        known = self.document_manager.get_document_keys()
+        max_files = knowledge_config['bulk_import_max_files']
+        pending = deque()
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-import')
+        try:
+            for name, fileobj, done in iter_import_entries(source):
+                if max_files and self.summary['total'] >= max_files:
+                    self._record_error(name, f'超过单次导入的文件数量上限 {max_files}，其余文件未导入')
+                    break
+
+                self.summary['total'] += 1
+                staged = self._stage_entry(name, fileobj, known)
+                if staged is not None:
+                    pending.append((name, staged, executor.submit(self._prepare_entry, name, staged)))
+
+                # 在途的提取任务数有上限，暂存目录中只保留少量文件
+                while len(pending) >= self.workers * 2:
+                    self._collect(*pending.popleft())
+                self._report('importing', done)
+
+            while pending:
+                self._collect(*pending.popleft())
+            self._flush()
+
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            # 中途失败时已入库的批次同样需要更新索引
+            self._report('indexing', 1.0)
+            self._notify_index()
+
+        logger.info(f"批量导入完成: {source}，共 {self.summary['total']} 个文件，导入 {self.summary['imported']}，"
+                    f"跳过 {self.summary['skipped']}，失败 {self.summary['failed']}")
+        return self.summary
+
+    def _stage_entry(self, name: str, fileobj: BinaryIO, known: Set[Tuple[str, str]]) -> Optional[StagedUpload]:
+        """把条目写入暂存文件；不符合要求或已导入过时返回None"""
+        filename = os.path.basename(name)
+        try:
+            staged = stream_to_file(fileobj, os.path.join(self.staging_dir, f"{self.summary['total']}.part"),
+                                    filename)
+        except Exception as e:
+            self._record_error(name, e)
+            return None
+
+        key = (filename, staged.sha256)
+        if key in known:
+            os.remove(staged.path)
+            self.summary['skipped'] += 1
+            return None
+
+        known.add(key)
+        return staged
+
+    def _prepare_entry(self, name: str, staged: StagedUpload) -> Dict:
+        """提取条目的文本、摘要和MinHash签名（在线程池中执行）"""
+        filename = os.path.basename(name)
+        blob_filename = self.document_manager.blob_filename_for(staged.sha256, os.path.splitext(filename)[1])
+        return {
+            'name': name,
+            'staged_path': staged.path,
+            'filename': filename,
+            'file_size': staged.size,
+            'content_hash': staged.sha256,
+            'mime_type': staged.mime_type,
+            'content': self.document_manager.prepare_document_content(staged.path, filename, blob_filename)
+        }
+
+    def _collect(self, name: str, staged: StagedUpload, future):
+        """取回一个条目的提取结果加入当前批次，批次满时入库"""
+        try:
+            entry = future.result()
+        except Exception as e:
+            self._record_error(name, e)
+            if os.path.exists(staged.path):
+                os.remove(staged.path)
+            return
+
+        self.batch.append(entry)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """把当前批次在一个事务中入库（失败时整批记为失败，继续导入后续文件）"""
+        entries, self.batch = self.batch, []
+        if not entries:
+            return
+
+        try:
+            document_ids, superseded = self.document_manager.save_documents_batch(
+                entries, self.user_id, self.category
+            )
+        except Exception as e:
+            logger.error(f"批量导入入库失败: {e}")
+            for entry in entries:
+                self._record_error(entry['name'], e)
+                if os.path.exists(entry['staged_path']):
+                    os.remove(entry['staged_path'])
+            return
+
+        self.document_ids.extend(document_ids)
+        self.superseded.extend(superseded)
+        self.summary['imported'] += len(document_ids)
+        self.summary['extraction_failed'] += sum(1 for entry in entries if entry['content']['extraction_error'])
+
+    def _notify_index(self):
+        """通知索引更新：新文档一次加入索引，被取代的旧文档移出索引"""
+        superseded = set(self.superseded)
+        imported = set(self.document_ids)
+        self.document_manager.notify_documents_changed(
+            'added', [document_id for document_id in self.document_ids if document_id not in superseded]
+        )
+        # 本次导入中被后续文件取代的文档从未加入索引
+        self.document_manager.notify_documents_changed(
+            'deleted', [document_id for document_id in self.superseded if document_id not in imported]
+        )
+        self.document_ids = []
+        self.superseded = []
+
+    def _record_error(self, name: str, error):
+        """记录导入失败的文件"""
+        logger.warning(f"批量导入跳过文件 {name}: {error}")
+        self.summary['failed'] += 1
+        if len(self.summary['errors']) < MAX_REPORTED_ERRORS:
+            self.summary['errors'].append({'file': name, 'error': str(error)})
+
+    def _report(self, stage: str, done: float):
+        """报告进度（导入阶段占5%~95%，只在百分比变化时回调）"""
+        percent = 5 + int(done * 90)
+        if self.progress and percent != self.reported_percent:
+            self.reported_percent = percent
+            self.progress(stage, percent)
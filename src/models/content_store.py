@@ -0,0 +1,194 @@
+"""
+文档正文内容存储
+Append-only, memory-mapped storage for document content
+"""
+
+import os
+import mmap
+import time
+import threading
+from collections import OrderedDict
+from typing import Tuple
+import logging
+
+from config.knowledge_config import knowledge_config
+from models.file_leases import FileLease, remove_unleased
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的线程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ContentCache:
+    """
+    热点文档正文LRU缓存
+
+    按正文的UTF-8编码字节数计量，总量不超过配置上限，每个进程的正文内存占用
+    由配置决定而不随语料规模增长。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """读取缓存，未命中返回None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, text: str, size: int):
+        """写入缓存（size 为正文编码后的字节数），超出上限时淘汰最久未使用的条目"""
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (text, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_statistics(self) -> dict:
+        """获取缓存统计"""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'cached_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+class ContentStore:
+    """
+    只追加的正文存储文件
+
+    正文以UTF-8追加写入，文档只保存 (偏移, 长度)；读取时通过mmap定位，
+    整篇正文的解码结果放入全局LRU缓存，片段按字节范围只解码所需部分。文件句柄在对象存活期间保持打开，
+    文件被替换删除后，仍被旧索引快照引用的存储可以继续读取（POSIX）。
+
+    多个应用进程可能同时追加同一个存储：追加时持有目录中追加锁文件的排他flock，
+    在文件末尾偏移处 pwrite，记录的偏移就是实际写入的位置。
+    对象存活期间持有存储文件的读租约，其他进程清理旧存储时不会删除它。
+    """
+
+    FILE_PREFIX = 'content-'
+    FILE_SUFFIX = '.bin'
+    APPEND_LOCK_FILE = '.append.lock'
+
+    def __init__(self, path: str):
+        self.path = path
+        # 不使用追加模式：O_APPEND 下 pwrite 忽略偏移
+        self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        self.lease = FileLease(path)
+        self.append_lock_path = os.path.join(os.path.dirname(path), self.APPEND_LOCK_FILE)
+        self.lock = threading.Lock()
+        self.mapped = None
+        self.mapped_size = 0
+
+    @classmethod
+    def create(cls, directory: str) -> 'ContentStore':
+        """在目录中创建新的存储文件"""
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{cls.FILE_PREFIX}{time.time_ns()}{cls.FILE_SUFFIX}"))
+
+    @property
+    def name(self) -> str:
+        """存储文件名（写入索引元数据）"""
+        return os.path.basename(self.path)
+
+    def append(self, text: str) -> Tuple[int, int]:
+        """
+        追加正文
+
+        Returns:
+            (字节偏移, 字节长度)
+        """
+        data = text.encode('utf-8')
+        with self.lock, open(self.append_lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            offset = self.size()
+            self._write_at(data, offset)
+        return offset, len(data)
+
+    def _write_at(self, data: bytes, offset: int):
+        """在指定偏移写入全部数据"""
+        fd = self.file.fileno()
+        view = memoryview(data)
+        while view:
+            if hasattr(os, 'pwrite'):
+                written = os.pwrite(fd, view, offset)
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+            view = view[written:]
+            offset += written
+
+    def read(self, offset: int, length: int) -> str:
+        """读取正文，优先使用LRU缓存"""
+        if length == 0:
+            return ""
+
+        key = (self.path, offset)
+        text = content_cache.get(key)
+        if text is not None:
+            return text
+
+        with self.lock:
+            if offset + length > self.mapped_size:
+                self._remap()
+            data = self.mapped[offset:offset + length]
+
+        text = data.decode('utf-8')
+        content_cache.put(key, text, length)
+        return text
+
+    def read_slice(self, offset: int, start: int, end: int) -> str:
+        """读取正文（起始于 offset）中 [start, end) 字节范围的片段，只解码该范围，不经过正文缓存"""
+        if end <= start:
+            return ""
+
+        with self.lock:
+            if offset + end > self.mapped_size:
+                self._remap()
+            data = self.mapped[offset + start:offset + end]
+        return data.decode('utf-8')
+
+    def _remap(self):
+        """文件增长后重新映射"""
+        size = os.fstat(self.file.fileno()).st_size
+        if self.mapped is not None:
+            self.mapped.close()
+        self.mapped = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        self.mapped_size = size
+
+    def size(self) -> int:
+        """存储文件字节数"""
+        return os.fstat(self.file.fileno()).st_size
+
+
+def remove_stale_stores(directory: str, keep: str):
+    """删除目录中除 keep 以外、没有任何进程打开的存储文件（仍被使用的存储留到下次清理）"""
+    if not os.path.isdir(directory):
+        return
+
+    for name in os.listdir(directory):
+        if (name.startswith(ContentStore.FILE_PREFIX) and name.endswith(ContentStore.FILE_SUFFIX)
+                and name != keep):
+            path = os.path.join(directory, name)
+            remove_unleased(path, path)
+
+
+# 全局正文缓存（进程内所有存储共享）
+content_cache = ContentCache(knowledge_config['content_cache_mb'] * 1024 * 1024)
@@ -0,0 +1,204 @@
+"""
+知识库上下文组装
+Token-budgeted context assembly for knowledge base prompts
+"""
+
+import re
+from typing import Dict, List
+import logging
+
+from config.knowledge_config import knowledge_config
+
+logger = logging.getLogger(__name__)
+
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+# 近似重复判断使用的字符shingle长度（中文没有空格分词，按字符切分）
+SHINGLE_SIZE = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的令牌数
+
+    中文字符和全角标点按每字符1个令牌，其余字符按每4个字符1个令牌，
+    对各提供商的分词器都偏保守。
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断文本，使估算令牌数不超过 max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    cost = 0.0
+    for idx, char in enumerate(text):
+        cost += 1.0 if CJK_PATTERN.match(char) else 0.25
+        if cost > max_tokens:
+            return text[:idx]
+    return text
+
+
+def token_budget_for(provider: str = None, model: str = None) -> int:
+    """
+    获取提供商/模型的知识库上下文令牌预算
+
+    依次查找 context_token_budgets 中的 "提供商:模型"、"提供商"，都没有时使用 context_token_budget。
+    """
+    budgets = knowledge_config['context_token_budgets']
+    if provider and model and f"{provider}:{model}" in budgets:
+        return budgets[f"{provider}:{model}"]
+    if provider and provider in budgets:
+        return budgets[provider]
+    return knowledge_config['context_token_budget']
+
+
+class Passage:
+    """候选片段"""
+
+    __slots__ = ('doc_id', 'title', 'text', 'score', '_shingles')
+
+    def __init__(self, doc_id: int, title: str, text: str, score: float):
+        self.doc_id = doc_id
+        self.title = title
+        self.text = text
+        self.score = score
+        self._shingles = None
+
+    @property
+    def shingles(self) -> frozenset:
+        """规范化文本（小写、去空白）的字符shingle集合"""
+        if self._shingles is None:
+            normalized = "".join(self.text.lower().split())
+            self._shingles = frozenset(
+                normalized[idx:idx + SHINGLE_SIZE]
+                for idx in range(max(len(normalized) - SHINGLE_SIZE + 1, 1))
+            )
+        return self._shingles
+
+    def similarity(self, other: 'Passage') -> float:
+        """两个片段shingle集合的Jaccard相似度"""
+        if not self.shingles or not other.shingles:
+            return 0.0
+        intersection = len(self.shingles & other.shingles)
+        return intersection / (len(self.shingles) + len(other.shingles) - intersection)
+
+
+class AssembledContext:
+    """
+    组装好的上下文：文本、入选片段和令牌统计
+
+    sources 为入选片段所属文档的记录（由知识库在组装后填入），调用方据此列出来源文档，
+    不需要再检索一次。
+    """
+
+    __slots__ = ('text', 'passages', 'token_count', 'token_budget', 'dropped_duplicates', 'sources')
+
+    def __init__(self, text: str = "", passages: List[Passage] = None, token_count: int = 0,
+                 token_budget: int = 0, dropped_duplicates: int = 0, sources: List[Dict] = None):
+        self.text = text
+        self.passages = passages or []
+        self.token_count = token_count
+        self.token_budget = token_budget
+        self.dropped_duplicates = dropped_duplicates
+        self.sources = sources or []
+
+    def __bool__(self):
+        return bool(self.text)
+
+    @property
+    def document_ids(self) -> List[int]:
+        """入选片段所属文档ID（按出现顺序去重）"""
+        return list(dict.fromkeys(passage.doc_id for passage in self.passages))
+
+
+class ContextAssembler:
+    """
+    上下文组装器
+
+    按最大边际相关性（MMR）逐个挑选片段：相关度（候选集内归一化）减去与已选片段的最大
+    shingle相似度；与已选片段相似度超过阈值的近似重复片段直接丢弃。
+    入选片段按文档分组输出，总令牌数不超过预算。
+    """
+
+    def __init__(self, token_budget: int, dedup_threshold: float = None, mmr_lambda: float = None):
+        self.token_budget = token_budget
+        self.dedup_threshold = (knowledge_config['context_dedup_threshold']
+                                if dedup_threshold is None else dedup_threshold)
+        self.mmr_lambda = knowledge_config['context_mmr_lambda'] if mmr_lambda is None else mmr_lambda
+
+    @staticmethod
+    def _header(passage: Passage) -> str:
+        """文档分组标题"""
+        return f"【{passage.title}】(相关度: {passage.score:.2f})\n"
+
+    def assemble(self, candidates: List[Passage], max_docs: int = 3,
+                 max_passages_per_doc: int = 3) -> AssembledContext:
+        """挑选候选片段并组装上下文"""
+        candidates = [passage for passage in candidates if passage.text and passage.text.strip()]
+        if not candidates or self.token_budget <= 0:
+            return AssembledContext(token_budget=self.token_budget)
+
+        top_score = max(passage.score for passage in candidates) or 1.0
+        selected = []
+        # 每个文档的 (组内第一个片段, 已选片段数)
+        doc_groups = {}
+        used_tokens = 0
+        dropped_duplicates = 0
+        max_similarity = {id(passage): 0.0 for passage in candidates}
+
+        while candidates:
+            best = max(candidates, key=lambda passage: (
+                self.mmr_lambda * passage.score / top_score
+                - (1 - self.mmr_lambda) * max_similarity[id(passage)]
+            ))
+            candidates.remove(best)
+
+            if max_similarity[id(best)] >= self.dedup_threshold:
+                dropped_duplicates += 1
+                continue
+
+            group = doc_groups.get(best.doc_id)
+            if group is None and len(doc_groups) >= max_docs:
+                continue
+            if group is not None and group[1] >= max_passages_per_doc:
+                continue
+
+            cost = estimate_tokens(best.text) + 1
+            if group is None:
+                cost += estimate_tokens(self._header(best))
+
+            if used_tokens + cost > self.token_budget:
+                if selected:
+                    continue
+                # 第一个片段就超出预算时截断，保证有内容可用
+                remaining = self.token_budget - (cost - estimate_tokens(best.text))
+                if remaining <= 0:
+                    continue
+                best = Passage(best.doc_id, best.title, truncate_to_tokens(best.text, remaining), best.score)
+                cost = self.token_budget
+
+            selected.append(best)
+            doc_groups[best.doc_id] = (group[0] if group else best, (group[1] if group else 0) + 1)
+            used_tokens += cost
+
+            for passage in candidates:
+                max_similarity[id(passage)] = max(max_similarity[id(passage)], passage.similarity(best))
+
+        text = self._format(selected, doc_groups)
+        logger.info(f"知识库上下文组装完成: {len(selected)} 个片段, 约 {used_tokens}/{self.token_budget} 令牌, "
+                    f"去除近似重复 {dropped_duplicates} 个")
+        return AssembledContext(text, selected, used_tokens, self.token_budget, dropped_duplicates)
+
+    def _format(self, selected: List[Passage], doc_groups: dict) -> str:
+        """按文档分组输出（文档顺序为首次入选顺序）"""
+        parts = []
+        for doc_id, (first, _) in doc_groups.items():
+            texts = [passage.text.strip() for passage in selected if passage.doc_id == doc_id]
+            parts.append(self._header(first) + "\n".join(texts))
+        return "\n\n".join(parts)
+
@@ -7,20 +7,61 @@ import os
 import sqlite3
 import hashlib
 import json
+import time
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 import logging
 
+from models import document_text
+from models.extraction_sandbox import ExtractionFailed
+from models.text_codec import compress_text, decompress_text
+from models.db_pool import ConnectionPool
+from models.fts_text import segment_for_fts, build_fts_query
+from models.dedup import (minhash_signature, lsh_buckets, estimate_similarity,
+                          signature_to_blob, signature_from_blob)
+from config.knowledge_config import knowledge_config
+from config.paths import data_path
+from models.file_leases import ExclusiveLease
+
 logger = logging.getLogger(__name__)
 
+# 透明压缩的大文本列 (表, 列)：写入时按配置压缩，读取时用 decompress_text 还原
+COMPRESSED_COLUMNS = (
+    ('documents', 'content_text'),
+    ('ai_conversations', 'answer'),
+    ('ai_conversations', 'related_documents'),
+)
+
+# 插入文档记录（参数由 DocumentManager.document_row 生成）
+INSERT_DOCUMENT_SQL = '''
+    INSERT INTO documents (
+        filename, original_filename, file_path, file_size, 
+        file_type, mime_type, category, title, description,
+        content_text, content_summary, content_hash, minhash, uploaded_by,
+        extraction_status, extraction_error
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 class DatabaseManager:
     """数据库管理器"""
     
     def __init__(self, db_path: str = None):
         if db_path is None:
-            db_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'ruishi_platform.db')
+            db_path = data_path('ruishi_platform.db')
         
         self.db_path = db_path
+        self.fts_enabled = False
+        self.compression_thread = None
+        self.pool = ConnectionPool(
+            db_path,
+            size=knowledge_config['db_pool_size'],
+            timeout=knowledge_config['db_busy_timeout'],
+            cache_size_kb=knowledge_config['db_cache_size_kb'],
+            mmap_size_mb=knowledge_config['db_mmap_size_mb'],
+            statement_cache_size=knowledge_config['db_statement_cache_size'],
+            on_connect=self.configure_connection
+        )
         self.ensure_data_directory()
         self.init_database()
     
@@ -31,10 +72,19 @@ class DatabaseManager:
             os.makedirs(data_dir)
     
     def get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        """获取数据库连接（从连接池借出，close() 时归还）"""
+        return self.pool.acquire()
+    
+    @staticmethod
+    def configure_connection(conn: sqlite3.Connection):
+        """新建连接的初始化（每个连接只执行一次）"""
         conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
-        return conn
+        # SQL中需要匹配可能被压缩的列时使用，如 decompress_text(content_text) LIKE ?
+        conn.create_function('decompress_text', 1, decompress_text, deterministic=True)
+    
+    def pool_stats(self) -> Dict:
+        """数据库连接池统计"""
+        return self.pool.stats()
     
     def init_database(self):
         """初始化数据库表"""
@@ -180,6 +230,79 @@ class DatabaseManager:
                 )
             ''')
             
+            # 为旧数据库补充新增的列
+            self.ensure_column(conn, 'documents', 'content_hash', 'TEXT')
+            # 增强提取内容的摘要，以及关键词/摘要所基于文本的分析哈希（文本变化时重新计算）
+            self.ensure_column(conn, 'documents', 'enhanced_summary', 'TEXT')
+            self.ensure_column(conn, 'documents', 'analysis_hash', 'TEXT')
+            # 近似重复检测：提取文本的MinHash签名，以及被较新修订版取代时指向新文档的ID
+            self.ensure_column(conn, 'documents', 'minhash', 'BLOB')
+            self.ensure_column(conn, 'documents', 'superseded_by', 'INTEGER')
+            # 文本提取状态（'ok' 或 'extraction_failed'，旧数据为空）和失败原因
+            self.ensure_column(conn, 'documents', 'extraction_status', 'TEXT')
+            self.ensure_column(conn, 'documents', 'extraction_error', 'TEXT')
+            
+            # 创建MinHash LSH分段桶表（用于查找近似重复的候选文档）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS document_minhash_bands (
+                    document_id INTEGER NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    PRIMARY KEY (band, bucket, document_id),
+                    FOREIGN KEY (document_id) REFERENCES documents (id)
+                )
+            ''')
+            
+            # 创建文档导入任务表（上传后在后台提取、分析和索引）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    staged_path TEXT,
+                    category TEXT,
+                    title TEXT,
+                    description TEXT,
+                    uploaded_by INTEGER,
+                    status TEXT DEFAULT 'queued',
+                    stage TEXT,
+                    progress INTEGER DEFAULT 0,
+                    document_id INTEGER,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    FOREIGN KEY (uploaded_by) REFERENCES users (id),
+                    FOREIGN KEY (document_id) REFERENCES documents (id)
+                )
+            ''')
+            
+            # 创建上传文件引用计数表（上传目录按内容哈希存储，相同文件只保存一份）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS upload_blobs (
+                    filename TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    file_size INTEGER,
+                    ref_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 暂存上传文件时流式计算的大小、SHA-256和嗅探到的MIME类型
+            self.ensure_column(conn, 'ingestion_jobs', 'file_size', 'INTEGER')
+            self.ensure_column(conn, 'ingestion_jobs', 'content_hash', 'TEXT')
+            self.ensure_column(conn, 'ingestion_jobs', 'mime_type', 'TEXT')
+            
+            # 批量导入任务（压缩包或服务器目录）与单个文件任务共用任务表，导入结果汇总为JSON
+            self.ensure_column(conn, 'ingestion_jobs', 'job_type', "TEXT DEFAULT 'document'")
+            self.ensure_column(conn, 'ingestion_jobs', 'result', 'TEXT')
+            
+            # 处理任务的进程（导入队列实例）和最近一次心跳，服务启动时据此只恢复所属进程已退出的任务
+            self.ensure_column(conn, 'ingestion_jobs', 'owner', 'TEXT')
+            self.ensure_column(conn, 'ingestion_jobs', 'heartbeat_at', 'TIMESTAMP')
+            
+            # 创建文档全文索引表（rowid 与 documents.id 相同，内容为jieba分词结果）
+            self.fts_enabled = self.ensure_fts_table(conn)
+            
             conn.commit()
             
             # 创建默认管理员账户
@@ -193,6 +316,140 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    @staticmethod
+    def ensure_column(conn, table: str, column: str, definition: str):
+        """表中缺少该列时添加（用于旧数据库升级）"""
+        columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    @staticmethod
+    def ensure_fts_table(conn) -> bool:
+        """创建FTS5全文索引表，SQLite不支持FTS5时返回False"""
+        try:
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    title, body, tokenize = 'unicode61'
+                )
+            ''')
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite不支持FTS5，文档搜索使用LIKE查询: {e}")
+            return False
+    
+    def acquire_maintenance_lease(self) -> Optional[ExclusiveLease]:
+        """取得数据库维护租约（压缩迁移、VACUUM在多个进程间互斥），其他进程持有时返回None"""
+        try:
+            return ExclusiveLease(f"{self.db_path}.maintenance.lock")
+        except BlockingIOError:
+            return None
+    
+    def start_compression_migration(self):
+        """
+        启动后台线程，把已有的未压缩大文本行改写为压缩格式（压缩关闭时不启动）
+        
+        由服务启动流程调用（命令行工具不执行）；多个进程共用数据库时只有取得维护租约的进程执行迁移。
+        """
+        if not knowledge_config['text_compression']:
+            return
+        
+        lease = self.acquire_maintenance_lease()
+        if lease is None:
+            logger.info("其他进程正在维护数据库，本进程不执行压缩迁移")
+            return
+        
+        def migrate():
+            try:
+                self.compress_existing_rows()
+            finally:
+                lease.release()
+        
+        self.compression_thread = threading.Thread(
+            target=migrate, name='text-compression-migration', daemon=True
+        )
+        self.compression_thread.start()
+    
+    def compress_existing_rows(self) -> int:
+        """
+        压缩 COMPRESSED_COLUMNS 中未压缩的大文本行
+        
+        按ID分批读取和改写，每批一个短事务，不长时间占用写锁；改写时比较原值，
+        期间被其他连接修改的行保持不变。改写后数据库文件不会自动收缩，需要时由管理员执行
+        reclaim_free_pages（管理后台或 python db_maintenance.py vacuum）。
+        
+        Returns:
+            压缩的行数
+        """
+        batch_size = knowledge_config['text_compression_batch_size']
+        min_bytes = knowledge_config['text_compression_min_bytes']
+        compressed = 0
+        
+        try:
+            for table, column in COMPRESSED_COLUMNS:
+                last_id = 0
+                while True:
+                    conn = self.get_connection()
+                    try:
+                        rows = conn.execute(f'''
+                            SELECT id, {column} FROM {table}
+                            WHERE id > ? AND typeof({column}) = 'text' AND length(CAST({column} AS BLOB)) >= ?
+                            ORDER BY id LIMIT ?
+                        ''', (last_id, min_bytes, batch_size)).fetchall()
+                        
+                        updates = []
+                        for row in rows:
+                            packed = compress_text(row[column])
+                            if isinstance(packed, bytes):
+                                updates.append((packed, row['id'], row[column]))
+                        conn.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ? AND {column} = ?', updates)
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    
+                    if not rows:
+                        break
+                    last_id = rows[-1]['id']
+                    compressed += len(updates)
+                    # 批次之间让出写锁
+                    time.sleep(0.01)
+            
+        except Exception as e:
+            logger.error(f"压缩已有文本失败: {e}")
+        
+        if compressed:
+            logger.info(f"已有文本压缩完成，压缩行数: {compressed}")
+        return compressed
+    
+    def reclaim_free_pages(self, min_ratio: float = 0.0) -> Dict:
+        """
+        执行VACUUM收缩数据库文件（管理员操作，不在启动时自动执行）
+        
+        VACUUM 重写整个数据库文件，执行期间其他连接不能写入；空闲页占比低于 min_ratio 时不执行。
+        持有维护租约，与其他进程的压缩迁移互斥，其他进程正在维护数据库时抛出 RuntimeError。
+        
+        Returns:
+            {'page_count': 执行前的页数, 'free_pages': 执行前的空闲页数, 'vacuumed': 是否执行}
+        """
+        lease = self.acquire_maintenance_lease()
+        if lease is None:
+            raise RuntimeError("其他进程正在维护数据库，请稍后重试")
+        
+        try:
+            conn = self.get_connection()
+            try:
+                page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+                free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                vacuumed = bool(page_count) and free_pages / page_count >= min_ratio
+                if vacuumed:
+                    conn.execute('VACUUM')
+                    logger.info(f"数据库收缩完成，释放页数: {free_pages}")
+            finally:
+                conn.close()
+        finally:
+            lease.release()
+        
+        return {'page_count': page_count, 'free_pages': free_pages, 'vacuumed': vacuumed}
+    
     def create_default_admin(self):
         """创建默认管理员账户"""
         conn = self.get_connection()
@@ -288,6 +545,23 @@ class UserManager:
         finally:
             conn.close()
     
+    def get_user_by_username(self, username: str) -> Optional[Dict]:
+        """按用户名获取有效用户（不含密码哈希）"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, username, email, role FROM users WHERE username = ? AND is_active = 1
+            ''', (username,))
+            
+            row = cursor.fetchone()
+            return dict(row) if row else None
+            
+        except Exception as e:
+            logger.error(f"获取用户失败: {e}")
+            return None
+        finally:
+            conn.close()
+    
     def verify_session(self, session_token: str) -> Optional[Dict]:
         """验证会话"""
         conn = self.db.get_connection()
@@ -334,75 +608,516 @@ class UserManager:
 class DocumentManager:
     """文档管理器"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, upload_dir: str = None):
         self.db = db_manager
-        self.upload_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'uploads')
+        self.upload_dir = upload_dir or data_path('uploads')
+        self.change_listeners = []
+        # 文档变更计数（进程内），检索缓存据此判断全文索引是否变化
+        self.revision = 0
         self.ensure_upload_directory()
+        self.sync_upload_blobs()
+        self.sync_fts_index()
+        self.sync_minhash_signatures()
     
     def ensure_upload_directory(self):
         """确保上传目录存在"""
         if not os.path.exists(self.upload_dir):
             os.makedirs(self.upload_dir)
     
+    def add_change_listener(self, listener):
+        """注册文档变更监听器，listener(action, document_ids)，action 为 'added' 或 'deleted'"""
+        self.change_listeners.append(listener)
+    
+    def notify_document_change(self, action: str, document_id: int):
+        """通知所有监听器文档已变更"""
+        self.notify_documents_changed(action, [document_id])
+    
+    def notify_documents_changed(self, action: str, document_ids: List[int]):
+        """通知所有监听器一批文档已变更（批量导入结束后只通知一次）"""
+        if not document_ids:
+            return
+        
+        self.revision += 1
+        for listener in self.change_listeners:
+            try:
+                listener(action, document_ids)
+            except Exception as e:
+                logger.error(f"文档变更通知失败: {e}")
+    
     def save_document(self, file_data: bytes, filename: str, user_id: int, 
                      category: str = 'general', title: str = None, 
                      description: str = None) -> Optional[int]:
         """保存文档"""
-        import uuid
-        import mimetypes
+        import tempfile
         
+        staged_path = None
         try:
-            # 生成唯一文件名
-            file_ext = os.path.splitext(filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_ext}"
-            file_path = os.path.join(self.upload_dir, unique_filename)
-            
-            # 保存文件
-            with open(file_path, 'wb') as f:
+            # 先写入上传目录中的临时文件，再交给 save_document_file 移动到最终位置
+            fd, staged_path = tempfile.mkstemp(dir=self.upload_dir, suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
                 f.write(file_data)
             
+            return self.save_document_file(staged_path, filename, user_id, category, title, description)
+                
+        except Exception as e:
+            logger.error(f"文档保存失败: {e}")
+            if staged_path and os.path.exists(staged_path):
+                os.remove(staged_path)
+            return None
+    
+    def save_document_file(self, staged_path: str, filename: str, user_id: int,
+                           category: str = 'general', title: str = None,
+                           description: str = None, progress=None,
+                           content_hash: str = None, mime_type: str = None) -> int:
+        """
+        保存已写入磁盘的上传文件
+        
+        文件移动到上传目录后提取文本、检测近似重复并写入数据库，最后通知索引更新。
+        失败时抛出异常（已移动的文件会被删除）。
+        
+        Args:
+            staged_path: 上传文件的临时路径（与上传目录在同一文件系统）
+            progress: 进度回调 progress(阶段, 百分比)，用于导入任务状态
+            content_hash: 写入暂存文件时已计算的SHA-256（为空时读取文件计算）
+            mime_type: 嗅探到的MIME类型（为空时按文件名推断）
+        
+        Returns:
+            新文档ID
+        """
+        import mimetypes
+        
+        def report(stage: str, percent: int):
+            if progress:
+                progress(stage, percent)
+        
+        # 按内容哈希存储：相同内容的文件只保存一份，由多个文档记录引用
+        file_size = os.path.getsize(staged_path)
+        content_hash = content_hash or self.compute_file_hash(staged_path)
+        blob_filename = self.store_blob(staged_path, content_hash, os.path.splitext(filename)[1], file_size)
+        file_path = os.path.join(self.upload_dir, blob_filename)
+        
+        try:
             # 获取文件信息
-            file_size = len(file_data)
-            mime_type, _ = mimetypes.guess_type(filename)
-            file_type = self.get_file_type(filename)
+            mime_type = mime_type or mimetypes.guess_type(filename)[0]
             
-            # 提取文本内容
-            content_text = self.extract_text_content(file_path, file_type)
-            content_summary = self.generate_summary(content_text)
+            # 同一内容已上传过时直接复用其提取文本、签名和关键词分析，否则提取文本内容
+            content = self.prepare_document_content(file_path, filename, blob_filename, report)
             
             # 保存到数据库
+            report('saving', 70)
             conn = self.db.get_connection()
             try:
-                cursor = conn.execute('''
-                    INSERT INTO documents (
-                        filename, original_filename, file_path, file_size, 
-                        file_type, mime_type, category, title, description,
-                        content_text, content_summary, uploaded_by
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    unique_filename, filename, file_path, file_size,
-                    file_type, mime_type, category, title or filename, description,
-                    content_text, content_summary, user_id
+                cursor = conn.execute(INSERT_DOCUMENT_SQL, self.document_row(
+                    blob_filename, filename, file_size, mime_type, category, title, description,
+                    content_hash, content, user_id
                 ))
                 
                 document_id = cursor.lastrowid
+                if content['previous_id']:
+                    self.copy_document_analysis(conn, content['previous_id'], document_id)
+                self.index_fts_document(conn, document_id, title or filename, description, content['content_text'])
+                
+                # 新文档是已有文档的近似重复（如同一数据手册的新修订版）时，只保留最新的一份在索引中
+                superseded = []
+                if content['signature'] is not None:
+                    superseded = self.supersede_near_duplicates(conn, document_id, content['signature'])
                 conn.commit()
                 
-                logger.info(f"文档保存成功: {filename} -> {unique_filename}")
-                return document_id
+                logger.info(f"文档保存成功: {filename} -> {blob_filename}" +
+                            ("（复用已有文件）" if content['previous_id'] else ""))
+                if superseded:
+                    logger.info(f"文档 {document_id} 取代了近似重复的旧文档: {superseded}")
                 
             except Exception as e:
                 logger.error(f"数据库保存失败: {e}")
-                # 删除已保存的文件
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return None
+                conn.rollback()
+                raise
             finally:
                 conn.close()
                 
+        except Exception:
+            # 释放文件引用（文件由 collect_unreferenced_blobs 清理）
+            self.release_blob(blob_filename)
+            raise
+        
+        # 更新知识库索引（关键词、摘要和分块在监听器中计算）
+        report('indexing', 85)
+        self.notify_document_change('added', document_id)
+        for old_document_id in superseded:
+            self.notify_document_change('deleted', old_document_id)
+        return document_id
+    
+    def prepare_document_content(self, file_path: str, filename: str, blob_filename: str,
+                                 report=None) -> Dict:
+        """
+        提取文档的文本、摘要和MinHash签名
+        
+        同一文件（按存储文件名）已有成功提取的文档记录时直接复用其结果；
+        提取超时或超出内存上限时正文为空，并返回提取错误。
+        
+        Returns:
+            {'content_text', 'content_summary', 'signature', 'previous_id', 'extraction_error'}
+        """
+        report = report or (lambda stage, percent: None)
+        previous = self.find_blob_document(blob_filename)
+        extraction_error = None
+        if previous:
+            report('reusing', 50)
+            content_text = previous['content_text']
+            content_summary = previous['content_summary']
+        else:
+            report('extracting', 10)
+            try:
+                content_text = self.extract_text_content(file_path, self.get_file_type(filename))
+            except ExtractionFailed as e:
+                # 提取超时或超出内存上限：文档照常保存但没有正文，标记为提取失败
+                logger.error(f"文本提取失败: {filename}: {e}")
+                content_text = ""
+                extraction_error = str(e)
+            report('analyzing', 50)
+            content_summary = self.generate_summary(content_text)
+        
+        signature = None
+        if knowledge_config['dedup_enabled']:
+            signature = (signature_from_blob(previous['minhash']) if previous and previous['minhash']
+                         else minhash_signature(content_text))
+        
+        return {
+            'content_text': content_text,
+            'content_summary': content_summary,
+            'signature': signature,
+            'previous_id': previous['id'] if previous else None,
+            'extraction_error': extraction_error
+        }
+    
+    def document_row(self, blob_filename: str, filename: str, file_size: int, mime_type: str,
+                     category: str, title: str, description: str, content_hash: str,
+                     content: Dict, user_id: int) -> Tuple:
+        """INSERT_DOCUMENT_SQL 的参数（content 为 prepare_document_content 的结果）"""
+        signature = content['signature']
+        return (
+            blob_filename, filename, os.path.join(self.upload_dir, blob_filename), file_size,
+            self.get_file_type(filename), mime_type, category, title or filename, description,
+            compress_text(content['content_text']), content['content_summary'], content_hash,
+            signature_to_blob(signature) if signature is not None else None, user_id,
+            'extraction_failed' if content['extraction_error'] else 'ok', content['extraction_error']
+        )
+    
+    def save_documents_batch(self, entries: List[Dict], user_id: int,
+                             category: str = 'general') -> Tuple[List[int], List[int]]:
+        """
+        在一个事务中保存一批已提取内容的暂存文件（批量导入）
+        
+        文件存入内容寻址存储后，文档记录用 executemany 一次插入，再写入全文索引并检测近似重复。
+        不通知索引更新，由调用方在整个导入结束后统一通知；失败时整批回滚并抛出异常。
+        
+        Args:
+            entries: 每项包含 staged_path, filename, file_size, content_hash, mime_type
+                     以及 prepare_document_content 的结果 content
+        
+        Returns:
+            (新文档ID列表（与 entries 顺序一致）, 被取代的文档ID列表)
+        """
+        if not entries:
+            return [], []
+        
+        created_blobs = []
+        conn = self.db.get_connection()
+        try:
+            # 引用计数和文件的存在性在同一个写事务中判断，与其他进程的存储和清理互斥
+            conn.execute('BEGIN IMMEDIATE')
+            rows = []
+            for entry in entries:
+                blob_filename, created = self._store_blob(
+                    conn, entry['staged_path'], entry['content_hash'],
+                    os.path.splitext(entry['filename'])[1], entry['file_size']
+                )
+                if created:
+                    created_blobs.append(blob_filename)
+                rows.append(self.document_row(
+                    blob_filename, entry['filename'], entry['file_size'], entry['mime_type'],
+                    category, None, None, entry['content_hash'], entry['content'], user_id
+                ))
+            
+            # 事务已取得写锁，本批插入的文档ID大于当前最大ID且按插入顺序递增
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM documents').fetchone()[0]
+            conn.executemany(INSERT_DOCUMENT_SQL, rows)
+            document_ids = [row['id'] for row in conn.execute(
+                'SELECT id FROM documents WHERE id > ? ORDER BY id', (last_id,)
+            ).fetchall()]
+            
+            superseded = []
+            for entry, document_id in zip(entries, document_ids):
+                content = entry['content']
+                if content['previous_id']:
+                    self.copy_document_analysis(conn, content['previous_id'], document_id)
+                self.index_fts_document(conn, document_id, entry['filename'], None, content['content_text'])
+                if content['signature'] is not None:
+                    superseded.extend(self.supersede_near_duplicates(conn, document_id, content['signature']))
+            conn.commit()
+            
+        except Exception:
+            # 本批新建的文件没有其他引用；在回滚（释放写锁）之前删除，其他进程不会在此期间复用这些文件
+            for blob_filename in created_blobs:
+                blob_path = os.path.join(self.upload_dir, blob_filename)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        logger.info(f"批量保存文档: {len(document_ids)} 个")
+        return document_ids, superseded
+    
+    def get_document_keys(self) -> Set[Tuple[str, str]]:
+        """有效文档的 (原始文件名, 内容哈希)，批量导入据此跳过已导入的文件"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT original_filename, content_hash FROM documents WHERE is_active = 1
+            ''')
+            return {(row['original_filename'], row['content_hash']) for row in cursor.fetchall()}
+            
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def blob_filename_for(content_hash: str, file_ext: str) -> str:
+        """内容寻址存储的文件名：SHA-256 + 扩展名（提取器按扩展名识别格式）"""
+        return f"{content_hash}{file_ext.lower()}"
+    
+    def store_blob(self, staged_path: str, content_hash: str, file_ext: str, file_size: int) -> str:
+        """
+        把暂存文件存入内容寻址存储并增加引用计数
+        
+        同名文件已存在时丢弃暂存文件。
+        
+        Returns:
+            存储文件名（上传目录下）
+        """
+        conn = self.db.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            blob_filename, _ = self._store_blob(conn, staged_path, content_hash, file_ext, file_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return blob_filename
+    
+    def _store_blob(self, conn, staged_path: str, content_hash: str, file_ext: str,
+                    file_size: int) -> Tuple[str, bool]:
+        """
+        在调用方的写事务中存入文件并增加引用计数，返回 (存储文件名, 是否新建)
+        
+        调用方以 BEGIN IMMEDIATE 开始事务：持有写锁期间其他进程不能清理文件（见 collect_unreferenced_blobs），
+        文件是否存在的判断和引用计数的增加是原子的。
+        """
+        blob_filename = self.blob_filename_for(content_hash, file_ext)
+        blob_path = os.path.join(self.upload_dir, blob_filename)
+        
+        conn.execute('''
+            INSERT OR IGNORE INTO upload_blobs (filename, content_hash, file_size, ref_count)
+            VALUES (?, ?, ?, 0)
+        ''', (blob_filename, content_hash, file_size))
+        conn.execute('UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE filename = ?',
+                     (blob_filename,))
+        
+        if os.path.exists(blob_path):
+            os.remove(staged_path)
+            return blob_filename, False
+        os.replace(staged_path, blob_path)
+        return blob_filename, True
+    
+    def release_blob(self, blob_filename: str):
+        """
+        减少文件引用计数
+        
+        不再被有效文档引用的文件仍然保留（已删除的文档是软删除，记录仍指向该文件），
+        由管理员执行 collect_unreferenced_blobs 清理。
+        """
+        conn = self.db.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                UPDATE upload_blobs SET ref_count = MAX(ref_count - 1, 0) WHERE filename = ?
+            ''', (blob_filename,))
+            conn.commit()
+            
         except Exception as e:
-            logger.error(f"文档保存失败: {e}")
-            return None
+            logger.error(f"释放上传文件引用失败: {e}")
+            conn.rollback()
+        finally:
+            conn.close()
+    
+    def collect_unreferenced_blobs(self) -> Dict:
+        """
+        删除不再被有效文档引用的上传文件（管理员操作，不自动执行）
+        
+        在一个写事务中确认引用计数仍为0后删除文件和计数记录，与其他进程的存储互斥。
+        被删除文件的已删除文档记录保留，但不能再下载原文件。
+        
+        Returns:
+            {'removed_files': 删除的文件数, 'freed_bytes': 释放的字节数}
+        """
+        removed_files = 0
+        freed_bytes = 0
+        conn = self.db.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT filename, file_size FROM upload_blobs WHERE ref_count <= 0
+            ''').fetchall()
+            for row in rows:
+                blob_path = os.path.join(self.upload_dir, row['filename'])
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+                    removed_files += 1
+                    freed_bytes += row['file_size'] or 0
+                conn.execute('DELETE FROM upload_blobs WHERE filename = ?', (row['filename'],))
+            conn.commit()
+            
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        if removed_files:
+            logger.info(f"清理不再被引用的上传文件: {removed_files} 个，{freed_bytes} 字节")
+        return {'removed_files': removed_files, 'freed_bytes': freed_bytes}
+    
+    def find_blob_document(self, blob_filename: str) -> Optional[Dict]:
+        """查找引用同一文件、已成功提取内容的最新文档记录（含已删除的记录）"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, content_text, content_summary, minhash FROM documents
+                WHERE filename = ? AND content_text IS NOT NULL
+                      AND (extraction_status IS NULL OR extraction_status != 'extraction_failed')
+                ORDER BY id DESC LIMIT 1
+            ''', (blob_filename,))
+            row = cursor.fetchone()
+            return self._decompress_row(row) if row else None
+            
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _decompress_row(row) -> Dict:
+        """记录转为字典并还原压缩的正文"""
+        document = dict(row)
+        document['content_text'] = decompress_text(document['content_text'])
+        return document
+    
+    @staticmethod
+    def copy_document_analysis(conn, source_id: int, document_id: int):
+        """复制文档的关键词和摘要分析（在调用方的事务中执行）"""
+        conn.execute('''
+            UPDATE documents SET (keywords, enhanced_summary, analysis_hash) = (
+                SELECT keywords, enhanced_summary, analysis_hash FROM documents WHERE id = ?
+            ) WHERE id = ?
+        ''', (source_id, document_id))
+        conn.execute('''
+            INSERT OR IGNORE INTO document_keywords (document_id, keyword, frequency)
+            SELECT ?, keyword, frequency FROM document_keywords WHERE document_id = ?
+        ''', (document_id, source_id))
+    
+    def sync_upload_blobs(self):
+        """为旧数据登记文件引用计数（旧文件保持原文件名，不迁移）"""
+        conn = self.db.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO upload_blobs (filename, content_hash, file_size, ref_count)
+                SELECT filename, MAX(content_hash), MAX(file_size), COUNT(*) FROM documents
+                WHERE is_active = 1 AND filename NOT IN (SELECT filename FROM upload_blobs)
+                GROUP BY filename
+            ''')
+            conn.commit()
+            
+        except Exception as e:
+            logger.error(f"同步上传文件引用计数失败: {e}")
+        finally:
+            conn.close()
+    
+    def supersede_near_duplicates(self, conn, document_id: int, signature) -> List[int]:
+        """
+        登记文档的LSH分段桶，并把近似重复的旧文档标记为被该文档取代
+        
+        与新文档至少有一个分段桶相同的有效文档为候选，按签名估计的Jaccard相似度
+        不低于 dedup_threshold 时视为近似重复；被取代的文档保留在数据库中，但移出全文索引和知识库索引。
+        在调用方的事务中执行。
+        
+        Returns:
+            被取代的文档ID列表
+        """
+        buckets = lsh_buckets(signature)
+        candidates = set()
+        for band, bucket in buckets:
+            cursor = conn.execute('''
+                SELECT document_id FROM document_minhash_bands WHERE band = ? AND bucket = ?
+            ''', (band, bucket))
+            candidates.update(row['document_id'] for row in cursor.fetchall())
+        
+        conn.executemany('''
+            INSERT OR IGNORE INTO document_minhash_bands (document_id, band, bucket) VALUES (?, ?, ?)
+        ''', [(document_id, band, bucket) for band, bucket in buckets])
+        
+        candidates.discard(document_id)
+        if not candidates:
+            return []
+        
+        placeholders = ",".join("?" * len(candidates))
+        cursor = conn.execute(f'''
+            SELECT id, minhash FROM documents
+            WHERE id IN ({placeholders}) AND is_active = 1 AND superseded_by IS NULL AND minhash IS NOT NULL
+        ''', list(candidates))
+        
+        superseded = [
+            row['id'] for row in cursor.fetchall()
+            if estimate_similarity(signature, signature_from_blob(row['minhash'])) >= knowledge_config['dedup_threshold']
+        ]
+        for old_document_id in superseded:
+            conn.execute('UPDATE documents SET superseded_by = ? WHERE id = ?', (document_id, old_document_id))
+            if self.db.fts_enabled:
+                conn.execute('DELETE FROM documents_fts WHERE rowid = ?', (old_document_id,))
+        return superseded
+    
+    def sync_minhash_signatures(self):
+        """为旧数据补算MinHash签名和LSH分段桶（只登记，不对已有文档做取代）"""
+        if not knowledge_config['dedup_enabled']:
+            return
+        
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, content_text FROM documents WHERE is_active = 1 AND minhash IS NULL
+            ''')
+            
+            count = 0
+            for row in cursor.fetchall():
+                signature = minhash_signature(decompress_text(row['content_text']))
+                if signature is None:
+                    continue
+                conn.execute('UPDATE documents SET minhash = ? WHERE id = ?',
+                             (signature_to_blob(signature), row['id']))
+                conn.executemany('''
+                    INSERT OR IGNORE INTO document_minhash_bands (document_id, band, bucket) VALUES (?, ?, ?)
+                ''', [(row['id'], band, bucket) for band, bucket in lsh_buckets(signature)])
+                count += 1
+            conn.commit()
+            
+            if count:
+                logger.info(f"MinHash签名补算完成，文档数量: {count}")
+            
+        except Exception as e:
+            logger.error(f"补算MinHash签名失败: {e}")
+        finally:
+            conn.close()
     
     def get_file_type(self, filename: str) -> str:
         """获取文件类型"""
@@ -438,60 +1153,23 @@ class DocumentManager:
                 return self.extract_ppt_text(file_path)
             else:
                 return ""
+        except ExtractionFailed:
+            raise
         except Exception as e:
             logger.error(f"文本提取失败: {e}")
             return ""
     
     def extract_pdf_text(self, file_path: str) -> str:
         """提取PDF文本"""
-        try:
-            import PyPDF2
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-        except ImportError:
-            logger.warning("PyPDF2未安装，无法提取PDF文本")
-            return ""
-        except Exception as e:
-            logger.error(f"PDF文本提取失败: {e}")
-            return ""
+        return document_text.extract_pdf_text(file_path)
     
     def extract_word_text(self, file_path: str) -> str:
         """提取Word文档文本"""
-        try:
-            import docx
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        except ImportError:
-            logger.warning("python-docx未安装，无法提取Word文本")
-            return ""
-        except Exception as e:
-            logger.error(f"Word文本提取失败: {e}")
-            return ""
+        return document_text.extract_word_text(file_path)
     
     def extract_ppt_text(self, file_path: str) -> str:
         """提取PowerPoint文本"""
-        try:
-            from pptx import Presentation
-            prs = Presentation(file_path)
-            text = ""
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text += shape.text + "\n"
-            return text
-        except ImportError:
-            logger.warning("python-pptx未安装，无法提取PowerPoint文本")
-            return ""
-        except Exception as e:
-            logger.error(f"PowerPoint文本提取失败: {e}")
-            return ""
+        return document_text.extract_ppt_text(file_path)
     
     def generate_summary(self, content: str, max_length: int = 200) -> str:
         """生成内容摘要"""
@@ -506,27 +1184,34 @@ class DocumentManager:
         return summary
     
     def search_documents(self, query: str, category: str = None, limit: int = 10) -> List[Dict]:
-        """搜索文档"""
+        """搜索文档（支持FTS5时按全文索引相关度排序，否则使用LIKE匹配）"""
+        match = build_fts_query(query) if query and self.db.fts_enabled else ""
+        
         conn = self.db.get_connection()
         try:
             sql = '''
-                SELECT id, filename, original_filename, file_type, category,
-                       title, description, content_summary, upload_time, file_size
+                SELECT documents.id, filename, original_filename, file_type, category,
+                       documents.title, description, content_summary, upload_time, file_size
                 FROM documents 
-                WHERE is_active = 1
             '''
             params = []
             
-            if query:
-                sql += ' AND (title LIKE ? OR description LIKE ? OR content_text LIKE ?)'
-                query_param = f'%{query}%'
-                params.extend([query_param, query_param, query_param])
+            if match:
+                sql += ' JOIN documents_fts ON documents_fts.rowid = documents.id'
+                sql += ' WHERE is_active = 1 AND superseded_by IS NULL AND documents_fts MATCH ?'
+                params.append(match)
+            else:
+                sql += ' WHERE is_active = 1 AND superseded_by IS NULL'
+                if query:
+                    sql += ' AND (documents.title LIKE ? OR description LIKE ? OR decompress_text(content_text) LIKE ?)'
+                    query_param = f'%{query}%'
+                    params.extend([query_param, query_param, query_param])
             
             if category:
                 sql += ' AND category = ?'
                 params.append(category)
             
-            sql += ' ORDER BY upload_time DESC LIMIT ?'
+            sql += ' ORDER BY bm25(documents_fts, 5.0, 1.0) LIMIT ?' if match else ' ORDER BY upload_time DESC LIMIT ?'
             params.append(limit)
             
             cursor = conn.execute(sql, params)
@@ -554,6 +1239,122 @@ class DocumentManager:
         finally:
             conn.close()
     
+    def index_fts_document(self, conn, document_id: int, title: str, description: str,
+                           content_text: str = None, segmented_body: str = None):
+        """写入文档的全文索引行（在调用方的事务中执行，正文可以是已分词的文本）"""
+        if not self.db.fts_enabled:
+            return
+        conn.execute('INSERT OR REPLACE INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)', (
+            document_id,
+            segment_for_fts(f"{title or ''} {description or ''}"),
+            segmented_body if segmented_body is not None else segment_for_fts(content_text)
+        ))
+    
+    def update_fts_documents(self, entries: List[Tuple[int, str, str, str]]):
+        """
+        批量更新全文索引正文
+        
+        知识库索引构建时用增强提取器的内容（如Excel表格）替换上传时提取的文本。
+        
+        Args:
+            entries: (文档ID, 标题, 描述, 已分词的正文) 列表
+        """
+        if not self.db.fts_enabled or not entries:
+            return
+        
+        conn = self.db.get_connection()
+        try:
+            for document_id, title, description, segmented_body in entries:
+                self.index_fts_document(conn, document_id, title, description, segmented_body=segmented_body)
+            conn.commit()
+            
+        except Exception as e:
+            logger.error(f"更新全文索引失败: {e}")
+            conn.rollback()
+        finally:
+            conn.close()
+    
+    def sync_fts_index(self):
+        """补建缺失的全文索引行，并删除已失效文档的索引行（用于旧数据库升级）"""
+        if not self.db.fts_enabled:
+            return
+        
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, title, description, content_text FROM documents
+                WHERE is_active = 1 AND superseded_by IS NULL AND id NOT IN (SELECT rowid FROM documents_fts)
+            ''')
+            
+            missing = cursor.fetchall()
+            for row in missing:
+                self.index_fts_document(conn, row['id'], row['title'], row['description'],
+                                        decompress_text(row['content_text']))
+            
+            conn.execute('''
+                DELETE FROM documents_fts
+                WHERE rowid NOT IN (SELECT id FROM documents WHERE is_active = 1 AND superseded_by IS NULL)
+            ''')
+            conn.commit()
+            
+            if missing:
+                logger.info(f"全文索引补建完成，文档数量: {len(missing)}")
+            
+        except Exception as e:
+            logger.error(f"同步全文索引失败: {e}")
+        finally:
+            conn.close()
+    
+    def fts_search(self, query: str, limit: int = 20) -> List[Tuple[int, float]]:
+        """
+        FTS5全文检索
+        
+        Returns:
+            按BM25相关度排序的 (文档ID, 得分) 列表，得分越大越相关；不支持FTS5时返回空列表
+        """
+        match = build_fts_query(query) if self.db.fts_enabled else ""
+        if not match:
+            return []
+        
+        conn = self.db.get_connection()
+        try:
+            # bm25() 越小越相关，标题权重高于正文
+            cursor = conn.execute('''
+                SELECT rowid, bm25(documents_fts, 5.0, 1.0) AS rank
+                FROM documents_fts WHERE documents_fts MATCH ?
+                ORDER BY rank LIMIT ?
+            ''', (match, limit))
+            
+            return [(row['rowid'], -row['rank']) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"全文检索失败: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def get_documents_by_ids(self, document_ids: List[int]) -> Dict[int, Dict]:
+        """批量获取有效文档的元数据（不含正文），返回文档ID到记录的映射"""
+        if not document_ids:
+            return {}
+        
+        conn = self.db.get_connection()
+        try:
+            placeholders = ','.join('?' * len(document_ids))
+            cursor = conn.execute(f'''
+                SELECT id, filename, original_filename, file_type, category,
+                       title, description, content_summary, upload_time, file_size
+                FROM documents WHERE is_active = 1 AND id IN ({placeholders})
+            ''', list(document_ids))
+            
+            return {row['id']: dict(row) for row in cursor.fetchall()}
+            
+        except Exception as e:
+            logger.error(f"批量获取文档失败: {e}")
+            return {}
+        finally:
+            conn.close()
+    
     def get_document_content(self, document_id: int) -> Optional[str]:
         """获取文档内容"""
         conn = self.db.get_connection()
@@ -563,7 +1364,7 @@ class DocumentManager:
             ''', (document_id,))
             
             result = cursor.fetchone()
-            return result['content_text'] if result else None
+            return decompress_text(result['content_text']) if result else None
             
         except Exception as e:
             logger.error(f"获取文档内容失败: {e}")
@@ -571,6 +1372,176 @@ class DocumentManager:
         finally:
             conn.close()
     
+    def get_extraction_error(self, document_id: int) -> Optional[str]:
+        """文档文本提取失败的原因，提取成功时返回None"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT extraction_error FROM documents WHERE id = ? AND extraction_status = 'extraction_failed'
+            ''', (document_id,))
+            row = cursor.fetchone()
+            return row['extraction_error'] if row else None
+            
+        except Exception as e:
+            logger.error(f"获取文档提取状态失败: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def get_document(self, document_id: int) -> Optional[Dict]:
+        """获取单个文档（包含提取的文本内容）"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, filename, original_filename, file_type, category, title,
+                       description, content_text, content_summary, upload_time, file_size,
+                       keywords, enhanced_summary, analysis_hash, extraction_status
+                FROM documents WHERE id = ? AND is_active = 1
+            ''', (document_id,))
+            
+            row = cursor.fetchone()
+            return self._decompress_row(row) if row else None
+            
+        except Exception as e:
+            logger.error(f"获取文档失败: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def iter_documents(self, batch_size: int = 500, document_ids: List[int] = None):
+        """
+        逐个产出所有有效文档（字段同 get_document，不含已被新修订版取代的文档），按ID分批查询
+        
+        每批使用独立的连接，不会把全部记录一次读入内存，适合流式建立索引。
+        指定 document_ids 时只产出其中的有效文档（如批量导入的新文档）。
+        """
+        last_id = 0
+        remaining = sorted(set(document_ids)) if document_ids is not None else None
+        while True:
+            if remaining is None:
+                condition, params = 'id > ?', [last_id]
+            elif remaining:
+                part, remaining = remaining[:batch_size], remaining[batch_size:]
+                condition, params = f'id IN ({",".join("?" * len(part))})', part
+            else:
+                return
+            
+            conn = self.db.get_connection()
+            try:
+                rows = conn.execute(f'''
+                    SELECT id, filename, original_filename, file_type, category, title,
+                           description, content_text, content_summary, upload_time, file_size,
+                           keywords, enhanced_summary, analysis_hash, extraction_status
+                    FROM documents WHERE is_active = 1 AND superseded_by IS NULL AND {condition}
+                    ORDER BY id LIMIT ?
+                ''', params + [batch_size]).fetchall()
+            finally:
+                conn.close()
+            
+            if not rows and remaining is None:
+                return
+            for row in rows:
+                yield self._decompress_row(row)
+            if rows:
+                last_id = rows[-1]['id']
+    
+    def save_document_analyses(self, entries: List[Tuple[int, List[Tuple[str, int]], str, str]]):
+        """
+        批量保存文档关键词和摘要
+        
+        关键词以JSON列表写入 documents.keywords，连同词频写入 document_keywords；
+        分析哈希用于下次建立索引时判断能否直接复用。
+        
+        Args:
+            entries: (文档ID, [(关键词, 词频)], 摘要, 分析哈希) 列表
+        """
+        if not entries:
+            return
+        
+        conn = self.db.get_connection()
+        try:
+            for document_id, keyword_frequencies, summary, analysis_hash in entries:
+                conn.execute('''
+                    UPDATE documents SET keywords = ?, enhanced_summary = ?, analysis_hash = ?
+                    WHERE id = ?
+                ''', (
+                    json.dumps([keyword for keyword, _ in keyword_frequencies], ensure_ascii=False),
+                    summary, analysis_hash, document_id
+                ))
+                conn.execute('DELETE FROM document_keywords WHERE document_id = ?', (document_id,))
+                conn.executemany('''
+                    INSERT INTO document_keywords (document_id, keyword, frequency) VALUES (?, ?, ?)
+                ''', [(document_id, keyword, frequency) for keyword, frequency in keyword_frequencies])
+            conn.commit()
+            
+        except Exception as e:
+            logger.error(f"保存文档关键词失败: {e}")
+            conn.rollback()
+        finally:
+            conn.close()
+    
+    def count_documents(self) -> int:
+        """有效文档数量（不含已被取代的文档）"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT COUNT(*) as total FROM documents WHERE is_active = 1 AND superseded_by IS NULL
+            ''')
+            return cursor.fetchone()['total']
+            
+        except Exception as e:
+            logger.error(f"统计文档数量失败: {e}")
+            return 0
+        finally:
+            conn.close()
+    
+    def get_corpus_fingerprint(self) -> str:
+        """
+        计算当前有效文档语料的指纹（文档ID + 内容哈希）
+        
+        旧数据没有内容哈希时会根据文件（文件缺失时根据提取文本）补算并回写。
+        """
+        conn = self.db.get_connection()
+        try:
+            # 只有缺少内容哈希的旧数据才需要读取正文
+            cursor = conn.execute('''
+                SELECT id, filename, content_hash,
+                       CASE WHEN content_hash IS NULL THEN content_text END AS content_text
+                FROM documents WHERE is_active = 1 AND superseded_by IS NULL ORDER BY id
+            ''')
+            
+            entries = []
+            for row in cursor.fetchall():
+                content_hash = row['content_hash']
+                if not content_hash:
+                    content_hash = self.compute_file_hash(
+                        os.path.join(self.upload_dir, row['filename']), decompress_text(row['content_text'])
+                    )
+                    conn.execute('UPDATE documents SET content_hash = ? WHERE id = ?',
+                                 (content_hash, row['id']))
+                entries.append(f"{row['id']}:{content_hash}")
+            
+            conn.commit()
+            return hashlib.sha256("\n".join(entries).encode('utf-8')).hexdigest()
+            
+        except Exception as e:
+            logger.error(f"计算语料指纹失败: {e}")
+            return ""
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def compute_file_hash(file_path: str, fallback_text: str = None) -> str:
+        """计算文件SHA-256，文件不存在时使用备用文本"""
+        sha256 = hashlib.sha256()
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(block)
+        else:
+            sha256.update((fallback_text or '').encode('utf-8'))
+        return sha256.hexdigest()
+    
     def get_all_documents(self, page: int = 1, per_page: int = 20) -> Dict:
         """获取所有文档（分页）"""
         conn = self.db.get_connection()
@@ -605,7 +1576,10 @@ class DocumentManager:
                     'upload_time': row['upload_time'],
                     'file_size': row['file_size'],
                     'uploaded_by_name': row['uploaded_by_name'],
-                    'download_count': row['download_count']
+                    'download_count': row['download_count'],
+                    'superseded_by': row['superseded_by'],
+                    'extraction_status': row['extraction_status'],
+                    'extraction_error': row['extraction_error']
                 })
             
             return {
@@ -626,27 +1600,43 @@ class DocumentManager:
         """删除文档"""
         conn = self.db.get_connection()
         try:
-            # 获取文件路径
-            cursor = conn.execute('SELECT file_path FROM documents WHERE id = ?', (document_id,))
+            # 获取存储文件名
+            cursor = conn.execute('SELECT filename FROM documents WHERE id = ? AND is_active = 1', (document_id,))
             result = cursor.fetchone()
             
             if result:
                 # 软删除（标记为不活跃）
                 conn.execute('UPDATE documents SET is_active = 0 WHERE id = ?', (document_id,))
-                conn.commit()
+                if self.db.fts_enabled:
+                    conn.execute('DELETE FROM documents_fts WHERE rowid = ?', (document_id,))
+                conn.execute('DELETE FROM document_minhash_bands WHERE document_id = ?', (document_id,))
                 
-                # 可选：删除物理文件
-                # if os.path.exists(result['file_path']):
-                #     os.remove(result['file_path'])
-                
-                return True
-            return False
+                # 被该文档取代的旧修订版恢复为有效文档
+                cursor = conn.execute('''
+                    SELECT id, title, description, content_text FROM documents
+                    WHERE superseded_by = ? AND is_active = 1
+                ''', (document_id,))
+                restored = cursor.fetchall()
+                for row in restored:
+                    conn.execute('UPDATE documents SET superseded_by = NULL WHERE id = ?', (row['id'],))
+                    self.index_fts_document(conn, row['id'], row['title'], row['description'],
+                                        decompress_text(row['content_text']))
+                conn.commit()
             
         except Exception as e:
             logger.error(f"删除文档失败: {e}")
             return False
         finally:
             conn.close()
+        
+        if result:
+            # 减少文件引用计数（文件保留，由 collect_unreferenced_blobs 清理）
+            self.release_blob(result['filename'])
+            self.notify_document_change('deleted', document_id)
+            for row in restored:
+                self.notify_document_change('added', row['id'])
+            return True
+        return False
 
 
 # 全局数据库管理器实例
@@ -0,0 +1,164 @@
+"""
+SQLite连接池
+Pooled WAL-mode SQLite connections with per-connection pragmas and statement caching
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """
+    连接池借出的连接
+
+    用法与 sqlite3.Connection 相同；close() 不关闭底层连接，而是回滚未提交的事务后归还连接池。
+    未调用 close() 就被回收的对象同样归还连接。记录借出时的进程ID：fork前借出的连接在子进程中归还时
+    不进入连接池。
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+        self._pid = os.getpid()
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """归还连接（可重复调用）"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn, self._pid)
+
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """
+    SQLite连接池
+
+    连接创建时设置一次 WAL 日志模式（读写互不阻塞）、synchronous=NORMAL、内存映射和页缓存，
+    并启用语句缓存，之后反复复用。空闲连接最多保留 size 个；连接全部借出时新建连接而不是等待
+    （调用方会在持有一个连接时再获取另一个，等待可能死锁），归还时超出部分直接关闭。
+    fork出的子进程不复用也不关闭父进程的连接（关闭时SQLite可能检查点或删除父进程仍在使用的WAL文件），
+    只保留引用直到进程退出。
+    """
+
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 30.0, cache_size_kb: int = 8192,
+                 mmap_size_mb: int = 256, statement_cache_size: int = 256,
+                 on_connect: Callable[[sqlite3.Connection], None] = None):
+        self.db_path = db_path
+        self.size = max(0, size)
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.statement_cache_size = statement_cache_size
+        self.on_connect = on_connect
+        self.lock = threading.Lock()
+        self.idle = deque()
+        # fork后从父进程继承的连接：保留引用，避免对象回收时关闭
+        self.inherited = []
+        self.pid = os.getpid()
+        self.counters = {'created': 0, 'reused': 0, 'discarded': 0, 'in_use': 0, 'peak_in_use': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        """新建连接并设置pragma"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.statement_cache_size)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.OperationalError as e:
+            # 其他连接正在切换日志模式时可能失败，日志模式写在数据库文件中，不影响使用
+            logger.warning(f"设置WAL日志模式失败: {e}")
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size_mb) * 1024 * 1024}')
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """借出一个连接（优先复用空闲连接）"""
+        with self.lock:
+            if os.getpid() != self.pid:
+                # fork后父进程的连接不能在子进程中使用
+                self.pid = os.getpid()
+                self.inherited.extend(self.idle)
+                self.idle.clear()
+                self.counters['in_use'] = 0
+            conn = self.idle.pop() if self.idle else None
+            self.counters['reused' if conn is not None else 'created'] += 1
+            self.counters['in_use'] += 1
+            self.counters['peak_in_use'] = max(self.counters['peak_in_use'], self.counters['in_use'])
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self.lock:
+                    self.counters['in_use'] -= 1
+                raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection, borrowed_pid: int = None):
+        """归还连接：回滚未提交的事务；连接异常或空闲连接已满时关闭"""
+        if borrowed_pid is not None and borrowed_pid != os.getpid():
+            # fork前借出的连接在子进程中归还：不计入、不回滚也不关闭
+            with self.lock:
+                self.inherited.append(conn)
+            return
+
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+
+        with self.lock:
+            same_process = os.getpid() == self.pid
+            if same_process:
+                self.counters['in_use'] = max(0, self.counters['in_use'] - 1)
+            keep = same_process and healthy and len(self.idle) < self.size
+            if keep:
+                self.idle.append(conn)
+            else:
+                self.counters['discarded'] += 1
+
+        if not keep:
+            conn.close()
+
+    def close_all(self):
+        """关闭全部空闲连接（借出的连接归还时照常处理）"""
+        with self.lock:
+            connections = list(self.idle)
+            self.idle.clear()
+        for conn in connections:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """连接池统计：新建、复用、关闭的连接数，当前借出和空闲的连接数"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['idle'] = len(self.idle)
+            stats['size'] = self.size
+        acquired = stats['created'] + stats['reused']
+        stats['reuse_rate'] = round(stats['reused'] / acquired, 3) if acquired else 0.0
+        return stats
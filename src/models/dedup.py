@@ -0,0 +1,75 @@
+"""
+近似重复文档检测
+MinHash signatures and LSH banding for near-duplicate detection
+"""
+
+import zlib
+import hashlib
+import numpy as np
+from typing import List, Optional, Tuple
+
+# 签名长度 = 分段数 × 每段行数；Jaccard相似度为 s 的两个文档至少有一段完全相同的概率为
+# 1 - (1 - s^ROWS)^BANDS，32×4 时 s=0.8 约为1.0，s=0.5 约为0.87，s=0.3 约为0.23
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# 字符shingle长度（中文没有空格分词，按字符切分）
+SHINGLE_SIZE = 5
+
+# 哈希函数 (a * x + b) mod p，p 为小于 2^32 的最大素数，乘积不会超出 uint64
+_PRIME = np.uint64(4294967291)
+_random = np.random.RandomState(20240611)
+_A = _random.randint(1, int(_PRIME), size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _random.randint(0, int(_PRIME), size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+# 每次参与计算的shingle数量，限制中间矩阵大小
+_BLOCK_SIZE = 8192
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """规范化文本（小写、去空白）的字符shingle哈希（去重）"""
+    normalized = "".join((text or "").lower().split())
+    if not normalized:
+        return np.zeros(0, dtype=np.uint64)
+
+    count = max(len(normalized) - SHINGLE_SIZE + 1, 1)
+    hashes = {zlib.crc32(normalized[idx:idx + SHINGLE_SIZE].encode('utf-8')) for idx in range(count)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """计算文本的MinHash签名，文本为空时返回None"""
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return None
+
+    signature = np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK_SIZE):
+        block = hashes[start:start + _BLOCK_SIZE, None]
+        np.minimum(signature, ((block * _A + _B) % _PRIME).min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def lsh_buckets(signature: np.ndarray) -> List[Tuple[int, str]]:
+    """LSH分段：每段签名的哈希作为桶，返回 (段号, 桶)"""
+    return [
+        (band, hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(),
+                               digest_size=8).hexdigest())
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate_similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """由签名估计两个文档的Jaccard相似度"""
+    return float(np.mean(signature_a == signature_b))
+
+
+def signature_to_blob(signature: np.ndarray) -> bytes:
+    """签名序列化（写入数据库）"""
+    return signature.astype('<u4').tobytes()
+
+
+def signature_from_blob(blob: bytes) -> np.ndarray:
+    """从数据库读取签名"""
+    return np.frombuffer(blob, dtype='<u4')
@@ -0,0 +1,64 @@
+"""
+上传文档的文本提取
+Plain-text extraction for uploaded PDF, Word and PowerPoint files
+
+提取函数在沙箱进程中执行（见 run_sandboxed），本模块不打开数据库，沙箱进程导入时没有副作用。
+"""
+
+import logging
+
+from models.extraction_cache import cached_extraction
+from models.pdf_pipeline import iter_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+
+@cached_extraction('pypdf2.pdf')
+def extract_pdf_text(file_path: str) -> str:
+    """提取PDF文本"""
+    try:
+        return "".join(f"{page.text}\n" for page in iter_pdf_pages(file_path, 'pypdf2'))
+    except ImportError:
+        logger.warning("PyPDF2未安装，无法提取PDF文本")
+        return ""
+    except Exception as e:
+        logger.error(f"PDF文本提取失败: {e}")
+        return ""
+
+
+@cached_extraction('docx.word')
+def extract_word_text(file_path: str) -> str:
+    """提取Word文档文本"""
+    try:
+        import docx
+        doc = docx.Document(file_path)
+        text = ""
+        for paragraph in doc.paragraphs:
+            text += paragraph.text + "\n"
+        return text
+    except ImportError:
+        logger.warning("python-docx未安装，无法提取Word文本")
+        return ""
+    except Exception as e:
+        logger.error(f"Word文本提取失败: {e}")
+        return ""
+
+
+@cached_extraction('pptx.powerpoint')
+def extract_ppt_text(file_path: str) -> str:
+    """提取PowerPoint文本"""
+    try:
+        from pptx import Presentation
+        prs = Presentation(file_path)
+        text = ""
+        for slide in prs.slides:
+            for shape in slide.shapes:
+                if hasattr(shape, "text"):
+                    text += shape.text + "\n"
+        return text
+    except ImportError:
+        logger.warning("python-pptx未安装，无法提取PowerPoint文本")
+        return ""
+    except Exception as e:
+        logger.error(f"PowerPoint文本提取失败: {e}")
+        return ""
@@ -4,115 +4,142 @@ Enhanced Knowledge Base Management with AI Integration
 """
 
 import os
+import copy
 import json
+import time
+import atexit
+import shutil
 import hashlib
+import threading
 import numpy as np
+import scipy.sparse as sp
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
 import logging
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import jieba
 import re
+from collections import Counter
+from itertools import islice
+from types import MappingProxyType
+
+from config.knowledge_config import knowledge_config
+from config.paths import data_path
+from models.index_store import IndexStore
+from models.extraction_cache import cached_extraction
+from models.fts_text import segment_for_fts
+from models.retrieval_cache import RetrievalCache, normalize_query
+from models.content_store import ContentStore, content_cache, remove_stale_stores
+from models.file_leases import FileLease, remove_unleased
+from models.context_assembler import ContextAssembler, AssembledContext, Passage
+from models.pdf_pipeline import iter_pdf_pages
+from models.extraction_sandbox import ExtractionFailed
+from models.index_workers import IndexWorkerPool
 
 # 文档内容提取库
 import openpyxl
-import pdfplumber
 import docx
 from werkzeug.utils import secure_filename
 
 logger = logging.getLogger(__name__)
 
 class EnhancedDocument:
-    """增强文档模型"""
+    """
+    增强文档模型
+    
+    正文写入内容存储（attach_content_store）后，对象只保留元数据、关键词、摘要和
+    正文在存储中的偏移，content 按需从内存映射文件读取并经LRU缓存。
+    """
+    
+    __slots__ = ('doc_id', 'filename', 'doc_type', 'category', 'title', 'description',
+                 'upload_time', 'keywords', 'summary', '_content', 'content_store',
+                 'content_offset', 'content_length')
     
     def __init__(self, doc_id: int, filename: str, content: str, doc_type: str, 
                  category: str = 'general', title: str = None, description: str = None,
-                 upload_time: str = None):
+                 upload_time: str = None, keywords: List[str] = None, summary: str = None):
         self.doc_id = doc_id
         self.filename = filename
-        self.content = content
+        self._content = content
+        self.content_store = None
+        self.content_offset = 0
+        self.content_length = 0
         self.doc_type = doc_type
         self.category = category
         self.title = title or filename
         self.description = description or ""
         self.upload_time = upload_time or datetime.now().isoformat()
         
-        # AI增强字段
-        self.keywords = self._extract_keywords()
-        self.summary = self._generate_summary()
-        self.content_vector = None  # 将由向量化器设置
+        # AI增强字段（已持久化时直接使用，避免重复分词）
+        self.keywords = keywords if keywords is not None else self._extract_keywords()
+        self.summary = summary if summary is not None else self._generate_summary()
+    
+    @property
+    def content(self) -> str:
+        """文档正文（已写入内容存储时按需读取）"""
+        if self._content is not None:
+            return self._content
+        if self.content_store is None:
+            return ""
+        return self.content_store.read(self.content_offset, self.content_length)
+    
+    def content_slice(self, start: int, end: int) -> str:
+        """按UTF-8字节偏移读取正文片段（已写入内容存储时只解码该片段）"""
+        if self._content is not None:
+            return self._content.encode('utf-8')[start:end].decode('utf-8')
+        if self.content_store is None:
+            return ""
+        return self.content_store.read_slice(self.content_offset, start, min(end, self.content_length))
+    
+    def attach_content_store(self, store: ContentStore):
+        """把正文写入内容存储并释放内存中的正文"""
+        if self._content is None:
+            return
+        self.content_offset, self.content_length = store.append(self._content)
+        self.content_store = store
+        self._content = None
+    
+    def __getstate__(self):
+        """序列化时内联正文（进程池传递文档时，内容存储的文件句柄不可序列化）"""
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['_content'] = self.content
+        state['content_store'] = None
+        return state
+    
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+    
+    @classmethod
+    def from_content_store(cls, doc_data: Dict, store: ContentStore, offset: int, length: int) -> 'EnhancedDocument':
+        """从元数据和内容存储中的偏移恢复文档"""
+        doc = cls(content=None, **doc_data)
+        doc.content_store = store
+        doc.content_offset = offset
+        doc.content_length = length
+        return doc
         
     def _extract_keywords(self) -> List[str]:
         """提取关键词"""
-        if not self.content:
-            return []
-        
-        # 中文分词
-        words = jieba.cut(self.content)
-        
-        # 过滤停用词和短词
-        stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
-        keywords = []
-        
-        for word in words:
-            word = word.strip()
-            if (len(word) >= 2 and 
-                word not in stop_words and 
-                not word.isdigit() and
-                re.match(r'^[\u4e00-\u9fa5a-zA-Z0-9\-_]+$', word)):
-                keywords.append(word)
-        
-        # 返回频率最高的关键词
-        from collections import Counter
-        word_freq = Counter(keywords)
-        return [word for word, freq in word_freq.most_common(20)]
+        return [word for word, _ in extract_keyword_frequencies(self.content)]
     
     def _generate_summary(self, max_length: int = 200) -> str:
         """生成智能摘要"""
-        if not self.content:
-            return ""
-        
-        # 简单的摘要生成：提取包含关键信息的句子
-        sentences = re.split(r'[。！？\n]', self.content)
-        
-        # 优先选择包含技术关键词的句子
-        tech_keywords = ['PXI', 'LabVIEW', 'C#', '数据采集', '测控', '简仪', 'MISD', '模块', '系统', '平台']
-        important_sentences = []
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if len(sentence) > 10:
-                # 计算句子重要性得分
-                score = sum(1 for keyword in tech_keywords if keyword in sentence)
-                if score > 0:
-                    important_sentences.append((sentence, score))
-        
-        # 按重要性排序并选择前几句
-        important_sentences.sort(key=lambda x: x[1], reverse=True)
-        
-        summary_parts = []
-        current_length = 0
-        
-        for sentence, score in important_sentences:
-            if current_length + len(sentence) <= max_length:
-                summary_parts.append(sentence)
-                current_length += len(sentence)
-            else:
-                break
-        
-        if not summary_parts and sentences:
-            # 如果没有找到重要句子，取开头部分
-            summary_parts = [sentences[0][:max_length]]
-        
-        return '。'.join(summary_parts) + ('。' if summary_parts else '')
+        return generate_summary(self.content, max_length)
     
     def to_dict(self) -> Dict:
         """转换为字典"""
+        data = self.metadata_dict()
+        data['content'] = self.content
+        return data
+    
+    def metadata_dict(self) -> Dict:
+        """转换为不含正文内容的字典（用于索引持久化）"""
         return {
             'doc_id': self.doc_id,
             'filename': self.filename,
-            'content': self.content,
             'doc_type': self.doc_type,
             'category': self.category,
             'title': self.title,
@@ -126,50 +153,38 @@ class EnhancedContentExtractor:
     """增强内容提取器"""
     
     @staticmethod
+    @cached_extraction(lambda: f"enhanced.excel:{knowledge_config['excel_max_rows']}:"
+                               f"{knowledge_config['excel_max_cells']}:{knowledge_config['chunk_size']}", 2)
     def extract_excel_content(file_path: str) -> str:
-        """提取Excel文件内容"""
+        """
+        提取Excel文件内容
+        
+        按工作表分块输出，块之间以空行分隔，每块以 "工作表: 名称" 开头且不超过 chunk_size 个字符
+        （单行过长时除外），片段切分时可以直接按块建立索引（见 split_excel_chunks）。
+        """
         try:
-            workbook = openpyxl.load_workbook(file_path, data_only=True)
-            content_parts = []
-            
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                content_parts.append(f"工作表: {sheet_name}")
-                
-                for row in sheet.iter_rows(values_only=True):
-                    row_data = [str(cell) if cell is not None else "" for cell in row]
-                    row_text = " | ".join(filter(None, row_data))
-                    if row_text.strip():
-                        content_parts.append(row_text)
-            
-            return "\n".join(content_parts)
+            return "\n\n".join(iter_excel_blocks(file_path, knowledge_config['chunk_size']))
             
         except Exception as e:
             logger.error(f"Excel内容提取失败: {e}")
             return ""
     
     @staticmethod
+    @cached_extraction('enhanced.pdf')
     def extract_pdf_content(file_path: str) -> str:
-        """提取PDF文件内容（使用pdfplumber）"""
+        """提取PDF文件内容（使用pdfplumber，长文档分页并行提取）"""
         try:
             content_parts = []
             
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    text = page.extract_text()
-                    if text:
-                        content_parts.append(f"第{page_num + 1}页:\n{text}")
-                    
-                    # 尝试提取表格
-                    tables = page.extract_tables()
-                    for table_num, table in enumerate(tables):
-                        if table:
-                            table_text = f"表格{table_num + 1}:\n"
-                            for row in table:
-                                if row:
-                                    row_text = " | ".join(str(cell) if cell else "" for cell in row)
-                                    table_text += row_text + "\n"
-                            content_parts.append(table_text)
+            for page in iter_pdf_pages(file_path, 'pdfplumber', with_tables=True):
+                if page.text:
+                    content_parts.append(f"第{page.number}页:\n{page.text}")
+                
+                # 页面中的表格
+                for table_num, table in enumerate(page.tables):
+                    if table:
+                        rows = (" | ".join(str(cell) if cell else "" for cell in row) for row in table if row)
+                        content_parts.append(f"表格{table_num + 1}:\n" + "".join(f"{row}\n" for row in rows))
             
             return "\n\n".join(content_parts)
             
@@ -178,6 +193,7 @@ class EnhancedContentExtractor:
             return ""
     
     @staticmethod
+    @cached_extraction('enhanced.word')
     def extract_word_content(file_path: str) -> str:
         """提取Word文档内容"""
         try:
@@ -205,6 +221,7 @@ class EnhancedContentExtractor:
             return ""
     
     @staticmethod
+    @cached_extraction('enhanced.text')
     def extract_text_content(file_path: str) -> str:
         """提取文本文件内容"""
         try:
@@ -224,68 +241,660 @@ class EnhancedContentExtractor:
             logger.error(f"文本内容提取失败: {e}")
             return ""
 
-class VectorSearchEngine:
-    """向量搜索引擎"""
+def split_into_chunks(content: str, chunk_size: int = 500, overlap: int = 100) -> List[Tuple[int, int]]:
+    """
+    将文档内容按行切分为相互重叠的片段
+    
+    Args:
+        content: 文档内容
+        chunk_size: 片段最大字符数
+        overlap: 相邻片段重叠的最大字符数
+        
+    Returns:
+        片段在内容中的 (起始, 结束) 字符偏移列表
+    """
+    if not content:
+        return []
+    
+    overlap = min(overlap, chunk_size // 2)
+    
+    # 按行切分，过长的行按固定窗口切开
+    pieces = []
+    for match in re.finditer(r'[^\n]+', content):
+        start, end = match.span()
+        while end - start > chunk_size:
+            pieces.append((start, start + chunk_size))
+            start += chunk_size - overlap
+        pieces.append((start, end))
+    
+    spans = []
+    i = 0
+    while i < len(pieces):
+        start = pieces[i][0]
+        j = i
+        while j + 1 < len(pieces) and pieces[j + 1][1] - start <= chunk_size:
+            j += 1
+        
+        end = pieces[j][1]
+        if len(content[start:end].strip()) > 20:
+            spans.append((start, end))
+        
+        # 下一个片段从与当前片段末尾重叠不超过overlap的第一行开始
+        next_i = j + 1
+        for k in range(i + 1, j + 1):
+            if end - pieces[k][0] <= overlap:
+                next_i = k
+                break
+        i = next_i
+    
+    return spans
+
+def split_excel_chunks(content: str, chunk_size: int = 500, overlap: int = 100) -> List[Tuple[int, int]]:
+    """
+    按 extract_excel_content 输出的工作表块切分片段（每块一个片段，片段不跨工作表）
+    
+    超过 chunk_size 的块（单行过长）在块内按行切分。
+    """
+    spans = []
+    start = 0
+    for block in content.split("\n\n"):
+        end = start + len(block)
+        if len(block) <= chunk_size:
+            if len(block.strip()) > 20:
+                spans.append((start, end))
+        else:
+            spans.extend((start + s, start + e) for s, e in split_into_chunks(block, chunk_size, overlap))
+        start = end + 2
+    return spans
+
+def iter_excel_rows(file_path: str, max_rows: int = None, max_cells: int = None) -> Iterator[Tuple[str, str]]:
+    """
+    以只读模式逐行读取Excel工作簿，产出 (工作表名, 行文本)
+    
+    只读模式按行流式解析工作表XML，不构建完整的单元格对象模型，内存占用与表格大小无关。
+    每个工作表最多读取 max_rows 行，整个工作簿最多读取 max_cells 个单元格，超出部分跳过。
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    cells = 0
+    try:
+        for sheet in workbook.worksheets:
+            for row_num, row in enumerate(sheet.iter_rows(values_only=True)):
+                if max_rows is not None and row_num >= max_rows:
+                    logger.warning(f"工作表行数超过上限 {max_rows}，其余行已跳过: {sheet.title}")
+                    break
+                if max_cells is not None and cells + len(row) > max_cells:
+                    logger.warning(f"工作簿单元格数超过上限 {max_cells}，其余内容已跳过: {file_path}")
+                    return
+                cells += len(row)
+                
+                row_text = " | ".join(str(cell) for cell in row if cell is not None and str(cell) != "")
+                if row_text.strip():
+                    yield sheet.title, row_text
+    finally:
+        workbook.close()
+
+def iter_excel_blocks(file_path: str, block_size: int = 500) -> Iterator[str]:
+    """
+    逐块产出Excel文本：每块以 "工作表: 名称" 开头，包含同一工作表的若干行，不超过 block_size 个字符
+    
+    行数和单元格数上限见 excel_max_rows / excel_max_cells 配置。
+    """
+    current_sheet = None
+    lines = []
+    length = 0
+    for sheet_name, row_text in iter_excel_rows(
+        file_path, knowledge_config['excel_max_rows'], knowledge_config['excel_max_cells']
+    ):
+        header = f"工作表: {sheet_name}"
+        if lines and (sheet_name != current_sheet or length + 1 + len(row_text) > block_size):
+            yield "\n".join(lines)
+            lines = []
+        if not lines:
+            current_sheet = sheet_name
+            lines = [header]
+            length = len(header)
+        lines.append(row_text)
+        length += 1 + len(row_text)
+    
+    if lines:
+        yield "\n".join(lines)
+
+# 关键词和摘要算法版本，算法变化时递增，数据库中已保存的分析结果随之失效
+ANALYSIS_VERSION = 1
+
+STOP_WORDS = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
+
+def preprocess_text(text: str) -> str:
+    """预处理文本：jieba分词，过滤停用词、单字和纯数字"""
+    if not text:
+        return ""
+    
+    # 中文分词
+    words = jieba.cut(text)
+    
+    # 过滤和清理
+    processed_words = []
+    for word in words:
+        word = word.strip().lower()
+        if (len(word) >= 2 and
+            word not in STOP_WORDS and
+            not word.isdigit()):
+            processed_words.append(word)
+    
+    return " ".join(processed_words)
+
+def extract_keyword_frequencies(content: str) -> List[Tuple[str, int]]:
+    """提取关键词，返回频率最高的 (关键词, 词频)"""
+    if not content:
+        return []
+    
+    # 中文分词
+    words = jieba.cut(content)
+    
+    # 过滤停用词和短词
+    keywords = []
+    
+    for word in words:
+        word = word.strip()
+        if (len(word) >= 2 and 
+            word not in STOP_WORDS and 
+            not word.isdigit() and
+            re.match(r'^[\u4e00-\u9fa5a-zA-Z0-9\-_]+$', word)):
+            keywords.append(word)
+    
+    # 返回频率最高的关键词及其词频
+    return Counter(keywords).most_common(20)
+
+def generate_summary(content: str, max_length: int = 200) -> str:
+    """生成智能摘要"""
+    if not content:
+        return ""
+    
+    # 简单的摘要生成：提取包含关键信息的句子
+    sentences = re.split(r'[。！？\n]', content)
+    
+    # 优先选择包含技术关键词的句子
+    tech_keywords = ['PXI', 'LabVIEW', 'C#', '数据采集', '测控', '简仪', 'MISD', '模块', '系统', '平台']
+    important_sentences = []
+    
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if len(sentence) > 10:
+            # 计算句子重要性得分
+            score = sum(1 for keyword in tech_keywords if keyword in sentence)
+            if score > 0:
+                important_sentences.append((sentence, score))
+    
+    # 按重要性排序并选择前几句
+    important_sentences.sort(key=lambda x: x[1], reverse=True)
+    
+    summary_parts = []
+    current_length = 0
+    
+    for sentence, score in important_sentences:
+        if current_length + len(sentence) <= max_length:
+            summary_parts.append(sentence)
+            current_length += len(sentence)
+        else:
+            break
+    
+    if not summary_parts and sentences:
+        # 如果没有找到重要句子，取开头部分
+        summary_parts = [sentences[0][:max_length]]
+    
+    return '。'.join(summary_parts) + ('。' if summary_parts else '')
+
+def analysis_hash(content: str) -> str:
+    """关键词和摘要的分析哈希：分析算法版本 + 被分析文本的SHA-256"""
+    return hashlib.sha256(f"{ANALYSIS_VERSION}:{content}".encode('utf-8')).hexdigest()
+
+def analyze_document(db_doc: Dict, content: str) -> Tuple[List[str], str, Optional[Tuple]]:
+    """
+    获取文档的关键词和摘要
+    
+    数据库中已保存且分析哈希与当前文本一致时直接使用，否则重新分词计算。
+    
+    Returns:
+        (关键词, 摘要, 需要写回数据库的 (文档ID, [(关键词, 词频)], 摘要, 分析哈希)，复用时为None)
+    """
+    content_hash = analysis_hash(content)
+    if db_doc.get('analysis_hash') == content_hash and db_doc.get('keywords') is not None:
+        try:
+            return json.loads(db_doc['keywords']), db_doc.get('enhanced_summary') or "", None
+        except ValueError:
+            logger.warning(f"文档关键词数据无效，重新计算: {db_doc['id']}")
+    
+    keyword_frequencies = extract_keyword_frequencies(content)
+    summary = generate_summary(content)
+    return ([keyword for keyword, _ in keyword_frequencies], summary,
+            (db_doc['id'], keyword_frequencies, summary, content_hash))
+
+def byte_spans(content: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """把片段的字符偏移转换为正文UTF-8编码中的字节偏移（按偏移顺序分段编码，整篇正文只编码一次）"""
+    if content.isascii():
+        return list(spans)
+    
+    positions = {0: 0}
+    previous = 0
+    for position in sorted({position for span in spans for position in span}):
+        positions[position] = positions[previous] + len(content[previous:position].encode('utf-8'))
+        previous = position
+    return [(positions[start], positions[end]) for start, end in spans]
+
+def prepare_document_texts(doc: EnhancedDocument) -> Tuple[str, List[str], List[Tuple[int, int]]]:
+    """
+    准备文档的索引文本
+    
+    Returns:
+        (预处理后的文档文本, 预处理后的片段文本列表, 片段在正文UTF-8编码中的字节偏移列表)
+    """
+    content = doc.content
+    doc_text = preprocess_text(f"{doc.title} {doc.description} {content}")
+    if doc.doc_type == 'excel' and knowledge_config['excel_sheet_chunks']:
+        spans = split_excel_chunks(content, knowledge_config['chunk_size'], knowledge_config['chunk_overlap'])
+    else:
+        spans = split_into_chunks(content, knowledge_config['chunk_size'], knowledge_config['chunk_overlap'])
+    chunk_texts = [preprocess_text(content[start:end]) for start, end in spans]
+    return doc_text, chunk_texts, byte_spans(content, spans)
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """把可迭代对象按顺序切分为长度不超过 batch_size 的列表"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+class SearchEngineBase:
+    """
+    搜索引擎基类
+    
+    子类实现 fit_documents / add_document / remove_document / search / search_chunks
+    以及 export_state / from_state，知识库通过 create_search_engine 按配置选择实现。
+    """
+    
+    engine_name = ''
     
     def __init__(self):
-        self.tfidf_vectorizer = TfidfVectorizer(
-            max_features=5000,
-            stop_words=None,  # 我们自己处理中文停用词
-            ngram_range=(1, 2),
-            min_df=1,
-            max_df=0.95
-        )
-        self.document_vectors = None
         self.documents = []
         self.is_fitted = False
+        # 文档ID到最新行号的映射（同一文档重新添加时旧行做墓碑标记，只有最新行可能有效）
+        self.doc_rows = {}
+        
+        # 片段所属文档行号和片段在文档正文UTF-8编码中的字节偏移（读取片段时只解码该范围）
+        self.chunk_doc_rows = np.zeros(0, dtype=np.int32)
+        self.chunk_spans = np.zeros((0, 2), dtype=np.int64)
+        
+        # 增量索引状态：被删除/替换的行只做墓碑标记
+        self.tombstones = set()
+        self.fitted_count = 0
+        self.drift_count = 0
     
     def preprocess_text(self, text: str) -> str:
         """预处理文本"""
-        if not text:
-            return ""
+        return preprocess_text(text)
+    
+    def fit_stream(self, batches: Iterable[List[Tuple[EnhancedDocument, Tuple]]]):
+        """
+        从逐批产出的 (文档, 索引文本) 建立索引
+        
+        默认收集全部批次后调用 fit_documents；能够逐批写入索引的引擎覆盖此方法。
+        """
+        documents = []
+        prepared = []
+        for batch in batches:
+            for doc, doc_texts in batch:
+                documents.append(doc)
+                prepared.append(doc_texts)
+        self.fit_documents(documents, prepared)
+    
+    def add_documents(self, batch: List[Tuple[EnhancedDocument, Tuple]]):
+        """
+        增量添加一批已准备好索引文本的文档（如批量导入）
+        
+        引擎尚未训练时（如空知识库首次导入）用现有文档和这批文档一次训练，避免逐个添加时反复训练。
+        """
+        if not batch:
+            return
+        if not self.is_fitted:
+            documents = self.live_documents()
+            self.fit_documents(documents + [doc for doc, _ in batch],
+                               self._prepare(documents) + [doc_texts for _, doc_texts in batch])
+            return
+        
+        for doc, doc_texts in batch:
+            self.add_document(doc, doc_texts)
+    
+    def remove_stale_files(self):
+        """引擎发布后删除不再使用的磁盘文件（只有把索引写入磁盘的引擎需要实现）"""
+        pass
+    
+    @staticmethod
+    def _prepare(documents: List[EnhancedDocument], prepared: List[Tuple] = None) -> List[Tuple]:
+        """获取文档的索引文本，未预先准备（如进程池并行准备）时在当前进程计算"""
+        if prepared is None:
+            prepared = [prepare_document_texts(doc) for doc in documents]
+        return prepared
+    
+    def _split_chunks(self, prepared: List[Tuple], first_row: int):
+        """展开已准备的片段，返回 (预处理后的片段文本, 片段所属文档行号, 片段偏移)"""
+        chunk_texts = []
+        doc_rows = []
+        spans = []
+        
+        for offset, (_, doc_chunk_texts, doc_spans) in enumerate(prepared):
+            chunk_texts.extend(doc_chunk_texts)
+            doc_rows.extend([first_row + offset] * len(doc_spans))
+            spans.extend(doc_spans)
         
-        # 中文分词
-        words = jieba.cut(text)
+        return (chunk_texts,
+                np.array(doc_rows, dtype=np.int32),
+                np.array(spans, dtype=np.int64).reshape(-1, 2))
+    
+    def copy(self) -> 'SearchEngineBase':
+        """
+        复制引擎用于写时复制：增量更新在副本上进行，已发布的引擎保持不变
+        
+        矩阵和数组在增量更新时整体替换而不原地修改，因此副本与原引擎共享。
+        """
+        clone = copy.copy(self)
+        clone.documents = list(self.documents)
+        clone.doc_rows = dict(self.doc_rows)
+        clone.tombstones = set(self.tombstones)
+        return clone
+    
+    def _index_rows(self, first_row: int = 0):
+        """记录 first_row 起各行的文档ID（从第0行开始时重建映射）"""
+        if first_row == 0:
+            self.doc_rows = {}
+        for idx in range(first_row, len(self.documents)):
+            self.doc_rows[self.documents[idx].doc_id] = idx
+    
+    def _append_documents(self, documents: List[EnhancedDocument]):
+        """追加文档行（列表整体替换，已发布快照的文档列表不变）"""
+        first_row = len(self.documents)
+        self.documents = self.documents + documents
+        self._index_rows(first_row)
+    
+    def _find_row(self, doc_id: int) -> Optional[int]:
+        """查找文档当前有效的行号"""
+        row = self.doc_rows.get(doc_id)
+        if row is None or row in self.tombstones:
+            return None
+        return row
+    
+    def live_documents(self) -> List[EnhancedDocument]:
+        """获取未被删除的文档"""
+        return [doc for idx, doc in enumerate(self.documents) if idx not in self.tombstones]
+    
+    def drift_ratio(self) -> float:
+        """自上次训练以来增量变更所占比例"""
+        return self.drift_count / max(self.fitted_count, 1)
+    
+    def _live_rows(self) -> Tuple[List[int], np.ndarray, np.ndarray]:
+        """
+        计算导出时保留的行
+        
+        Returns:
+            (未删除文档行号, 片段行号, 片段所属文档在导出后的行号)
+        """
+        live_rows = [idx for idx in range(len(self.documents)) if idx not in self.tombstones]
+        row_mapping = np.full(len(self.documents), -1, dtype=np.int32)
+        row_mapping[live_rows] = np.arange(len(live_rows), dtype=np.int32)
+        live_chunks = np.flatnonzero(row_mapping[self.chunk_doc_rows] >= 0)
+        return live_rows, live_chunks, row_mapping[self.chunk_doc_rows[live_chunks]]
+    
+    @staticmethod
+    def _export_documents(documents: List[EnhancedDocument]) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """
+        导出文档：正文已在内容存储中，只导出偏移量；其余字段作为元数据
         
-        # 过滤和清理
-        processed_words = []
-        stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
+        Returns:
+            (偏移数组, 包含存储文件名和文档元数据的字典)
+        """
+        stores = {doc.content_store for doc in documents}
+        if None in stores or len(stores) > 1:
+            raise ValueError("导出的文档正文必须写入同一个内容存储")
         
-        for word in words:
-            word = word.strip().lower()
-            if (len(word) >= 2 and 
-                word not in stop_words and 
-                not word.isdigit()):
-                processed_words.append(word)
+        arrays = {
+            'content_offsets': np.array([doc.content_offset for doc in documents], dtype=np.int64),
+            'content_lengths': np.array([doc.content_length for doc in documents], dtype=np.int64)
+        }
+        metadata = {
+            'content_store': stores.pop().name if stores else None,
+            'documents': [doc.metadata_dict() for doc in documents]
+        }
+        return arrays, metadata
+    
+    @staticmethod
+    def _restore_documents(arrays: Dict[str, np.ndarray], metadata: Dict,
+                           content_store: ContentStore) -> List[EnhancedDocument]:
+        """从持久化偏移和元数据恢复文档，正文留在内容存储中按需读取"""
+        offsets = arrays['content_offsets']
+        lengths = arrays['content_lengths']
+        return [
+            EnhancedDocument.from_content_store(doc_data, content_store, int(offsets[idx]), int(lengths[idx]))
+            for idx, doc_data in enumerate(metadata['documents'])
+        ]
+    
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用argpartition选出得分最高的top_k行，按得分降序返回"""
+        if len(rows) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return rows[order], scores[order]
+    
+    def _drop_tombstoned(self, doc_rows: np.ndarray, keep: np.ndarray) -> np.ndarray:
+        """过滤掉属于已删除文档的结果"""
+        if self.tombstones and len(keep):
+            keep = keep[~np.isin(doc_rows[keep], list(self.tombstones))]
+        return keep
+    
+    def _chunk_results(self, chunk_rows: np.ndarray, scores: np.ndarray) -> List[Tuple[EnhancedDocument, str, float]]:
+        """把片段行号转换为 (文档, 片段文本, 得分)"""
+        results = []
+        for chunk_idx, score in zip(chunk_rows, scores):
+            doc = self.documents[self.chunk_doc_rows[chunk_idx]]
+            start, end = self.chunk_spans[chunk_idx]
+            results.append((doc, doc.content_slice(int(start), int(end)).strip(), float(score)))
+        return results
+
+class VectorSearchEngine(SearchEngineBase):
+    """向量搜索引擎（TF-IDF余弦相似度）"""
+    
+    engine_name = 'tfidf'
+    
+    def __init__(self):
+        super().__init__()
+        self.tfidf_vectorizer = self._create_vectorizer()
+        self.document_vectors = None
         
-        return " ".join(processed_words)
+        # 片段索引：按列存储（CSC）即为倒排表，查询只访问包含查询词的片段
+        # 增量添加时词表和IDF保持不变
+        self.chunk_vectors = None
+        # 增量添加的行块 [(文档向量CSR, 片段向量CSC)]，行号接在训练时的矩阵之后：追加时不复制已有矩阵，
+        # 行数相近的相邻块合并（块数保持在对数级），重新训练时并入新矩阵
+        self.pending_blocks = []
     
-    def fit_documents(self, documents: List[EnhancedDocument]):
-        """训练向量化器"""
+    @staticmethod
+    def _create_vectorizer() -> TfidfVectorizer:
+        """创建TF-IDF向量化器"""
+        return TfidfVectorizer(
+            max_features=5000,
+            stop_words=None,  # 我们自己处理中文停用词
+            ngram_range=(1, 2),
+            min_df=1,
+            max_df=0.95
+        )
+    
+    def fit_documents(self, documents: List[EnhancedDocument], prepared: List[Tuple] = None):
+        """训练向量化器（prepared 为 prepare_document_texts 的预先计算结果，可选）"""
+        # 每次训练使用新的向量化器，不修改可能被其他快照共享的实例
+        self.tfidf_vectorizer = self._create_vectorizer()
         self.documents = documents
+        self._index_rows()
+        self.pending_blocks = []
         
         if not documents:
             logger.warning("没有文档用于训练向量化器")
             return
         
         # 预处理所有文档内容
-        processed_texts = []
-        for doc in documents:
-            # 组合标题、描述和内容
-            combined_text = f"{doc.title} {doc.description} {doc.content}"
-            processed_text = self.preprocess_text(combined_text)
-            processed_texts.append(processed_text)
+        prepared = self._prepare(documents, prepared)
+        processed_texts = [doc_text for doc_text, _, _ in prepared]
         
         try:
             # 训练TF-IDF向量化器
             self.document_vectors = self.tfidf_vectorizer.fit_transform(processed_texts)
+            self.chunk_vectors, self.chunk_doc_rows, self.chunk_spans = self._vectorize_chunks(prepared, 0)
             self.is_fitted = True
+            self.tombstones = set()
+            self.fitted_count = len(documents)
+            self.drift_count = 0
             logger.info(f"向量搜索引擎训练完成，文档数量: {len(documents)}")
-            
+        
         except Exception as e:
             logger.error(f"向量化器训练失败: {e}")
             self.is_fitted = False
     
+    def _vectorize_chunks(self, prepared: List[Tuple], first_row: int):
+        """向量化已切分的片段，返回 (片段矩阵CSC, 片段所属文档行号, 片段偏移)"""
+        chunk_texts, doc_rows, spans = self._split_chunks(prepared, first_row)
+        
+        if chunk_texts:
+            chunk_vectors = self.tfidf_vectorizer.transform(chunk_texts).tocsc()
+        else:
+            chunk_vectors = sp.csc_matrix((0, len(self.tfidf_vectorizer.vocabulary_)))
+        
+        return chunk_vectors, doc_rows, spans
+    
+    def add_document(self, doc: EnhancedDocument, doc_texts: Tuple = None):
+        """增量添加文档：使用现有词表和IDF向量化后追加一行"""
+        if not self.is_fitted:
+            self.fit_documents(self.live_documents() + [doc])
+            return
+        
+        # 同一文档重复添加时，旧行做墓碑标记
+        old_row = self._find_row(doc.doc_id)
+        if old_row is not None:
+            self.tombstones.add(old_row)
+        
+        # 先追加文档再追加矩阵行，保证并发搜索时行号始终有对应文档
+        prepared = self._prepare([doc], None if doc_texts is None else [doc_texts])
+        doc_vector = self.tfidf_vectorizer.transform([prepared[0][0]])
+        chunk_vectors, chunk_doc_rows, chunk_spans = self._vectorize_chunks(prepared, len(self.documents))
+        self._append_documents([doc])
+        self._append_block(doc_vector, chunk_vectors)
+        self.chunk_spans = np.vstack([self.chunk_spans, chunk_spans])
+        self.chunk_doc_rows = np.concatenate([self.chunk_doc_rows, chunk_doc_rows])
+        self.drift_count += 1
+    
+    def add_documents(self, batch: List[Tuple[EnhancedDocument, Tuple]]):
+        """增量添加一批文档：整批向量化，矩阵只追加一次"""
+        if not self.is_fitted or not batch:
+            super().add_documents(batch)
+            return
+        
+        for doc, _ in batch:
+            old_row = self._find_row(doc.doc_id)
+            if old_row is not None:
+                self.tombstones.add(old_row)
+        
+        prepared = [doc_texts for _, doc_texts in batch]
+        doc_vectors = self.tfidf_vectorizer.transform([doc_text for doc_text, _, _ in prepared])
+        chunk_vectors, chunk_doc_rows, chunk_spans = self._vectorize_chunks(prepared, len(self.documents))
+        self._append_documents([doc for doc, _ in batch])
+        self._append_block(doc_vectors, chunk_vectors)
+        self.chunk_spans = np.vstack([self.chunk_spans, chunk_spans])
+        self.chunk_doc_rows = np.concatenate([self.chunk_doc_rows, chunk_doc_rows])
+        self.drift_count += len(batch)
+    
+    def _append_block(self, doc_vectors: sp.csr_matrix, chunk_vectors: sp.csc_matrix):
+        """追加增量行块；末尾前一块的行数不超过新块时两块合并，合并只复制增量行"""
+        blocks = self.pending_blocks + [(doc_vectors.tocsr(), chunk_vectors)]
+        while len(blocks) > 1 and blocks[-2][0].shape[0] <= blocks[-1][0].shape[0]:
+            (docs_a, chunks_a), (docs_b, chunks_b) = blocks[-2:]
+            blocks[-2:] = [(sp.vstack([docs_a, docs_b], format='csr'),
+                            sp.vstack([chunks_a, chunks_b], format='csc'))]
+        self.pending_blocks = blocks
+    
+    def _merged_vectors(self) -> Tuple[sp.csr_matrix, sp.csc_matrix]:
+        """训练时的矩阵与增量行块合并后的 (文档向量, 片段向量)"""
+        if not self.pending_blocks:
+            return self.document_vectors, self.chunk_vectors
+        return (sp.vstack([self.document_vectors] + [docs for docs, _ in self.pending_blocks], format='csr'),
+                sp.vstack([self.chunk_vectors] + [chunks for _, chunks in self.pending_blocks], format='csc'))
+    
+    def remove_document(self, doc_id: int) -> bool:
+        """增量删除文档：只做墓碑标记，不改变矩阵"""
+        row = self._find_row(doc_id)
+        if row is None:
+            return False
+        
+        self.tombstones.add(row)
+        self.drift_count += 1
+        return True
+    
+    def export_state(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """导出索引状态（只包含未删除的文档），用于持久化"""
+        live_rows, live_chunks, chunk_doc_rows = self._live_rows()
+        document_vectors, chunk_vectors = self._merged_vectors()
+        vectors = document_vectors[live_rows].tocsr()
+        chunk_vectors = chunk_vectors[live_chunks].tocsc()
+        arrays, document_metadata = self._export_documents([self.documents[idx] for idx in live_rows])
+        
+        vocabulary = sorted(self.tfidf_vectorizer.vocabulary_, key=self.tfidf_vectorizer.vocabulary_.get)
+        
+        arrays.update({
+            'idf': self.tfidf_vectorizer.idf_,
+            'vectors_data': vectors.data,
+            'vectors_indices': vectors.indices,
+            'vectors_indptr': vectors.indptr,
+            'chunk_data': chunk_vectors.data,
+            'chunk_indices': chunk_vectors.indices,
+            'chunk_indptr': chunk_vectors.indptr,
+            'chunk_doc_rows': chunk_doc_rows,
+            'chunk_spans': self.chunk_spans[live_chunks]
+        })
+        metadata = {
+            'engine': self.engine_name,
+            'vocabulary': vocabulary,
+            'shape': list(vectors.shape),
+            'chunk_shape': list(chunk_vectors.shape),
+            **document_metadata
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict,
+                   content_store: ContentStore) -> 'VectorSearchEngine':
+        """从持久化状态恢复搜索引擎（数组可以是内存映射）"""
+        engine = cls()
+        
+        engine.tfidf_vectorizer.vocabulary_ = {
+            term: idx for idx, term in enumerate(metadata['vocabulary'])
+        }
+        engine.tfidf_vectorizer.idf_ = np.asarray(arrays['idf'])
+        engine.document_vectors = sp.csr_matrix(
+            (arrays['vectors_data'], arrays['vectors_indices'], arrays['vectors_indptr']),
+            shape=tuple(metadata['shape'])
+        )
+        engine.chunk_vectors = sp.csc_matrix(
+            (arrays['chunk_data'], arrays['chunk_indices'], arrays['chunk_indptr']),
+            shape=tuple(metadata['chunk_shape'])
+        )
+        engine.chunk_doc_rows = arrays['chunk_doc_rows']
+        engine.chunk_spans = arrays['chunk_spans']
+        
+        engine.documents = cls._restore_documents(arrays, metadata, content_store)
+        engine._index_rows()
+        engine.fitted_count = len(engine.documents)
+        engine.is_fitted = bool(engine.documents)
+        return engine
+    
     def search(self, query: str, top_k: int = 5) -> List[Tuple[EnhancedDocument, float]]:
         """向量搜索"""
         if not self.is_fitted or not self.documents:
@@ -300,118 +909,1280 @@ class VectorSearchEngine:
             # 向量化查询
             query_vector = self.tfidf_vectorizer.transform([processed_query])
             
-            # 计算相似度
-            similarities = cosine_similarity(query_vector, self.document_vectors).flatten()
+            # 计算相似度（训练时的矩阵和各增量行块按行号顺序拼接）
+            similarities = np.concatenate([
+                cosine_similarity(query_vector, vectors).ravel()
+                for vectors in [self.document_vectors] + [docs for docs, _ in self.pending_blocks]
+            ])
+            if self.tombstones:
+                similarities[list(self.tombstones)] = 0.0
             
             # 获取最相似的文档
-            top_indices = similarities.argsort()[-top_k:][::-1]
+            rows = np.flatnonzero(similarities > 0.01)  # 最小相似度阈值
+            rows, scores = self._top_k(rows, similarities[rows], top_k)
             
-            results = []
-            for idx in top_indices:
-                if similarities[idx] > 0.01:  # 最小相似度阈值
-                    results.append((self.documents[idx], float(similarities[idx])))
+            return [(self.documents[idx], float(score)) for idx, score in zip(rows, scores)]
+        
+        except Exception as e:
+            logger.error(f"向量搜索失败: {e}")
+            return []
+    
+    def search_chunks(self, query: str, top_k: int = 10) -> List[Tuple[EnhancedDocument, str, float]]:
+        """
+        片段搜索：一次稀疏矩阵-向量乘积加top-k选择
+        
+        Returns:
+            (文档, 片段文本, 相似度) 列表，按相似度降序
+        """
+        if not self.is_fitted or self.chunk_vectors is None or not len(self.chunk_doc_rows):
+            return []
+        
+        try:
+            processed_query = self.preprocess_text(query)
+            if not processed_query:
+                return []
             
-            return results
+            query_vector = self.tfidf_vectorizer.transform([processed_query])
+            if not query_vector.nnz:
+                return []
+            
+            # 只取查询词对应的列（倒排表），结果中只有命中的片段
+            term_ids = query_vector.indices
+            scores = np.concatenate([
+                (vectors[:, term_ids] @ query_vector.data).ravel()
+                for vectors in [self.chunk_vectors] + [chunks for _, chunks in self.pending_blocks]
+            ])
             
+            candidates = np.flatnonzero(scores > 0.01)  # 最小相似度阈值
+            candidates = self._drop_tombstoned(self.chunk_doc_rows, candidates)
+            rows, top_scores = self._top_k(candidates, scores[candidates], top_k)
+            
+            return self._chunk_results(rows, top_scores)
+        
         except Exception as e:
-            logger.error(f"向量搜索失败: {e}")
+            logger.error(f"片段搜索失败: {e}")
             return []
 
-class EnhancedKnowledgeBase:
-    """增强知识库管理类"""
+class BM25Index:
+    """
+    BM25倒排索引
+    
+    词频矩阵按列存储（CSC，行=文档或片段，列=词），每一列即为一个词的倒排表。
+    文档频率、存活文档数和总长度随增删增量维护，查询只访问查询词的倒排表。
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = sp.csc_matrix((0, 0), dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.doc_freqs = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.live_count = 0
+        self.live_length = 0.0
+    
+    def copy(self) -> 'BM25Index':
+        """复制索引：原地修改的统计数组复制一份，词频矩阵只会被整体替换，可以共享"""
+        clone = copy.copy(self)
+        clone.doc_freqs = self.doc_freqs.copy()
+        clone.alive = self.alive.copy()
+        return clone
+    
+    def resize_terms(self, n_terms: int):
+        """词表增长时扩展列数（文档索引和片段索引共用词表，一方新增的词另一方也要有对应的空列）"""
+        current = self.term_freqs.shape[1]
+        if n_terms <= current:
+            return
+        
+        indptr = np.concatenate([
+            self.term_freqs.indptr,
+            np.full(n_terms - current, self.term_freqs.indptr[-1], dtype=self.term_freqs.indptr.dtype)
+        ])
+        self.term_freqs = sp.csc_matrix(
+            (self.term_freqs.data, self.term_freqs.indices, indptr),
+            shape=(self.term_freqs.shape[0], n_terms)
+        )
+        self.doc_freqs = np.concatenate([self.doc_freqs, np.zeros(n_terms - current, dtype=np.int64)])
+    
+    def add_rows(self, token_lists: List[List[str]], vocabulary: Dict[str, int]):
+        """追加行，新词加入词表"""
+        data, indices, indptr, lengths = [], [], [0], []
+        for tokens in token_lists:
+            for term, count in Counter(tokens).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+            lengths.append(len(tokens))
+        
+        n_terms = len(vocabulary)
+        new_rows = sp.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(token_lists), n_terms)
+        )
+        
+        self.resize_terms(n_terms)
+        self.term_freqs = sp.vstack([self.term_freqs, new_rows], format='csc')
+        self.doc_freqs += np.bincount(new_rows.indices, minlength=n_terms)
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.array(lengths, dtype=np.float32)])
+        self.alive = np.concatenate([self.alive, np.ones(len(token_lists), dtype=bool)])
+        self.live_count += len(token_lists)
+        self.live_length += float(sum(lengths))
+    
+    def remove_rows(self, rows):
+        """删除行：从文档频率和长度统计中扣除"""
+        for row in rows:
+            if not self.alive[row]:
+                continue
+            self.doc_freqs[self.term_freqs[row].indices] -= 1
+            self.alive[row] = False
+            self.live_count -= 1
+            self.live_length -= float(self.doc_lengths[row])
+    
+    def score(self, term_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算包含查询词的行的BM25得分
+        
+        Returns:
+            (行号, 得分)，只包含命中的存活行
+        """
+        if not self.live_count:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        
+        avg_length = self.live_length / self.live_count
+        indptr, indices, data = self.term_freqs.indptr, self.term_freqs.indices, self.term_freqs.data
+        
+        row_parts, score_parts = [], []
+        for term_id in set(term_ids):
+            # 列数少于词表的索引（如旧版本持久化的索引）中没有该词
+            if term_id >= len(self.doc_freqs):
+                continue
+            doc_freq = self.doc_freqs[term_id]
+            if doc_freq <= 0:
+                continue
+            
+            start, end = indptr[term_id], indptr[term_id + 1]
+            rows = indices[start:end]
+            tf = data[start:end]
+            idf = np.log(1 + (self.live_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[rows] / avg_length)
+            
+            row_parts.append(rows)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        
+        if not row_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        
+        # 合并各词的得分，只在命中的行上累加
+        rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        
+        live = self.alive[rows]
+        return rows[live], scores[live]
+    
+    def export_arrays(self, rows: np.ndarray, prefix: str) -> Tuple[Dict[str, np.ndarray], List[int]]:
+        """导出指定行，返回数组和矩阵形状"""
+        term_freqs = self.term_freqs[rows].tocsc()
+        arrays = {
+            f'{prefix}_data': term_freqs.data,
+            f'{prefix}_indices': term_freqs.indices,
+            f'{prefix}_indptr': term_freqs.indptr,
+            f'{prefix}_lengths': self.doc_lengths[rows]
+        }
+        return arrays, list(term_freqs.shape)
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prefix: str, shape: List[int]) -> 'BM25Index':
+        """从导出的数组恢复"""
+        index = cls()
+        index.term_freqs = sp.csc_matrix(
+            (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'], arrays[f'{prefix}_indptr']),
+            shape=tuple(shape)
+        )
+        index.doc_lengths = np.asarray(arrays[f'{prefix}_lengths'])
+        index.doc_freqs = np.diff(index.term_freqs.indptr).astype(np.int64)
+        index.alive = np.ones(shape[0], dtype=bool)
+        index.live_count = shape[0]
+        index.live_length = float(index.doc_lengths.sum())
+        return index
+
+class BM25SearchEngine(SearchEngineBase):
+    """BM25搜索引擎（基于jieba分词的倒排索引）"""
+    
+    engine_name = 'bm25'
     
     def __init__(self):
-        from models.database import document_manager
-        self.document_manager = document_manager
-        self.content_extractor = EnhancedContentExtractor()
-        self.vector_engine = VectorSearchEngine()
-        self.documents_cache = {}
-        self._load_and_index_documents()
+        super().__init__()
+        self.vocabulary = {}
+        self.doc_index = BM25Index()
+        self.chunk_index = BM25Index()
+    
+    def copy(self) -> 'BM25SearchEngine':
+        """复制引擎（词表和倒排索引统计量会被增量更新原地修改，需要复制）"""
+        clone = super().copy()
+        clone.vocabulary = dict(self.vocabulary)
+        clone.doc_index = self.doc_index.copy()
+        clone.chunk_index = self.chunk_index.copy()
+        return clone
+    
+    def _tokens(self, text: str) -> List[str]:
+        """分词"""
+        return self.preprocess_text(text).split()
+    
+    def fit_documents(self, documents: List[EnhancedDocument], prepared: List[Tuple] = None):
+        """建立倒排索引（prepared 为 prepare_document_texts 的预先计算结果，可选）"""
+        self.vocabulary = {}
+        self.doc_index = BM25Index()
+        self.chunk_index = BM25Index()
+        self.chunk_doc_rows = np.zeros(0, dtype=np.int32)
+        self.chunk_spans = np.zeros((0, 2), dtype=np.int64)
+        self.tombstones = set()
+        self.drift_count = 0
+        self.documents = documents
+        self._index_rows()
+        
+        if not documents:
+            logger.warning("没有文档用于建立BM25索引")
+            return
+        
+        try:
+            self._index_documents(self._prepare(documents, prepared), 0)
+            self.is_fitted = True
+            self.fitted_count = len(documents)
+            logger.info(f"BM25搜索引擎索引完成，文档数量: {len(documents)}")
+        
+        except Exception as e:
+            logger.error(f"BM25索引建立失败: {e}")
+            self.is_fitted = False
+    
+    def _index_documents(self, prepared: List[Tuple], first_row: int):
+        """把已准备的文档及其片段加入倒排索引"""
+        chunk_texts, chunk_doc_rows, chunk_spans = self._split_chunks(prepared, first_row)
+        self.doc_index.add_rows([doc_text.split() for doc_text, _, _ in prepared], self.vocabulary)
+        self.chunk_index.add_rows([text.split() for text in chunk_texts], self.vocabulary)
+        # 片段中新增的词也要在文档索引中有列，两个索引的列数始终等于词表大小
+        self.doc_index.resize_terms(len(self.vocabulary))
+        self.chunk_index.resize_terms(len(self.vocabulary))
+        self.chunk_spans = np.vstack([self.chunk_spans, chunk_spans])
+        self.chunk_doc_rows = np.concatenate([self.chunk_doc_rows, chunk_doc_rows])
+    
+    def add_document(self, doc: EnhancedDocument, doc_texts: Tuple = None):
+        """增量添加文档，BM25统计量随之精确更新"""
+        if not self.is_fitted:
+            self.fit_documents(self.live_documents() + [doc])
+            return
+        
+        self.remove_document(doc.doc_id)
+        self._append_documents([doc])
+        self._index_documents(self._prepare([doc], None if doc_texts is None else [doc_texts]),
+                              len(self.documents) - 1)
+        self.drift_count += 1
+    
+    def add_documents(self, batch: List[Tuple[EnhancedDocument, Tuple]]):
+        """增量添加一批文档：一次加入倒排索引"""
+        if not self.is_fitted or not batch:
+            super().add_documents(batch)
+            return
+        
+        for doc, _ in batch:
+            self.remove_document(doc.doc_id)
+        first_row = len(self.documents)
+        self._append_documents([doc for doc, _ in batch])
+        self._index_documents([doc_texts for _, doc_texts in batch], first_row)
+        self.drift_count += len(batch)
+    
+    def remove_document(self, doc_id: int) -> bool:
+        """删除文档，从文档频率统计中扣除"""
+        row = self._find_row(doc_id)
+        if row is None:
+            return False
+        
+        self.tombstones.add(row)
+        self.doc_index.remove_rows([row])
+        self.chunk_index.remove_rows(np.flatnonzero(self.chunk_doc_rows == row))
+        self.drift_count += 1
+        return True
+    
+    def _query_terms(self, query: str) -> List[int]:
+        """查询分词并映射到词ID，忽略未登录词"""
+        return [self.vocabulary[token] for token in self._tokens(query) if token in self.vocabulary]
     
-    def _load_and_index_documents(self):
-        """加载并索引所有文档"""
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[EnhancedDocument, float]]:
+        """BM25搜索，只访问查询词的倒排表"""
+        if not self.is_fitted or not self.documents:
+            return []
+        
+        try:
+            rows, scores = self.doc_index.score(self._query_terms(query))
+            rows, scores = self._top_k(rows, scores, top_k)
+            return [(self.documents[idx], float(score)) for idx, score in zip(rows, scores)]
+        
+        except Exception as e:
+            logger.error(f"BM25搜索失败: {e}")
+            return []
+    
+    def search_chunks(self, query: str, top_k: int = 10) -> List[Tuple[EnhancedDocument, str, float]]:
+        """BM25片段搜索"""
+        if not self.is_fitted:
+            return []
+        
         try:
-            # 从数据库获取所有文档
-            db_docs = self.document_manager.get_all_documents(per_page=1000)
-            enhanced_docs = []
+            rows, scores = self.chunk_index.score(self._query_terms(query))
+            rows, scores = self._top_k(rows, scores, top_k)
+            return self._chunk_results(rows, scores)
+        
+        except Exception as e:
+            logger.error(f"BM25片段搜索失败: {e}")
+            return []
+    
+    def export_state(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """导出索引状态（只包含未删除的文档），用于持久化"""
+        live_rows, live_chunks, chunk_doc_rows = self._live_rows()
+        arrays, document_metadata = self._export_documents([self.documents[idx] for idx in live_rows])
+        
+        doc_arrays, doc_shape = self.doc_index.export_arrays(np.array(live_rows, dtype=np.int64), 'doc')
+        chunk_arrays, chunk_shape = self.chunk_index.export_arrays(live_chunks, 'chunk')
+        arrays.update(doc_arrays)
+        arrays.update(chunk_arrays)
+        arrays.update({
+            'chunk_doc_rows': chunk_doc_rows,
+            'chunk_spans': self.chunk_spans[live_chunks]
+        })
+        
+        metadata = {
+            'engine': self.engine_name,
+            'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get),
+            'doc_shape': doc_shape,
+            'chunk_shape': chunk_shape,
+            **document_metadata
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict,
+                   content_store: ContentStore) -> 'BM25SearchEngine':
+        """从持久化状态恢复"""
+        engine = cls()
+        engine.vocabulary = {term: idx for idx, term in enumerate(metadata['vocabulary'])}
+        engine.doc_index = BM25Index.from_arrays(arrays, 'doc', metadata['doc_shape'])
+        engine.chunk_index = BM25Index.from_arrays(arrays, 'chunk', metadata['chunk_shape'])
+        engine.chunk_doc_rows = arrays['chunk_doc_rows']
+        engine.chunk_spans = arrays['chunk_spans']
+        
+        engine.documents = cls._restore_documents(arrays, metadata, content_store)
+        engine._index_rows()
+        engine.fitted_count = len(engine.documents)
+        engine.is_fitted = bool(engine.documents)
+        return engine
+
+class SparseShard:
+    """
+    磁盘上的稀疏矩阵分片
+    
+    按列存储（CSC）即为倒排表；data/indices/indptr 各写一个 .npy 文件，
+    以内存映射方式打开，矩阵内容不占用堆内存。
+    """
+    
+    __slots__ = ('name', 'first_row', 'matrix')
+    
+    PARTS = ('data', 'indices', 'indptr')
+    
+    def __init__(self, name: str, first_row: int, matrix: sp.csc_matrix):
+        self.name = name
+        self.first_row = first_row
+        self.matrix = matrix
+    
+    @property
+    def end_row(self) -> int:
+        return self.first_row + self.matrix.shape[0]
+    
+    @classmethod
+    def write(cls, directory: str, name: str, first_row: int, matrix: sp.spmatrix) -> 'SparseShard':
+        """写入分片文件，返回以内存映射方式重新打开的分片"""
+        matrix = matrix.tocsc()
+        matrix.sort_indices()
+        for part in cls.PARTS:
+            np.save(os.path.join(directory, f"{name}.{part}.npy"), getattr(matrix, part))
+        return cls.open(directory, name, first_row, matrix.shape)
+    
+    @classmethod
+    def open(cls, directory: str, name: str, first_row: int, shape) -> 'SparseShard':
+        """以内存映射方式打开分片"""
+        data, indices, indptr = (
+            np.load(os.path.join(directory, f"{name}.{part}.npy"), mmap_mode='r') for part in cls.PARTS
+        )
+        return cls(name, first_row, sp.csc_matrix((data, indices, indptr), shape=tuple(shape)))
+    
+    def describe(self) -> Dict:
+        """分片清单条目（写入索引元数据）"""
+        return {'name': self.name, 'first_row': self.first_row, 'shape': list(self.matrix.shape)}
+
+class HashingSearchEngine(SearchEngineBase):
+    """
+    哈希向量搜索引擎（流式索引，适用于超出内存的语料）
+    
+    词项经HashingVectorizer哈希到固定维度，不需要词表，文档可以逐批向量化后写入磁盘分片。
+    文档向量只做对数词频和L2归一化，IDF在查询时由增量维护的文档频率计算（lnc.ltc），
+    因此增删文档既不重写已有分片，也不需要重新训练。
+    """
+    
+    engine_name = 'hashing'
+    
+    def __init__(self):
+        super().__init__()
+        self.n_features = knowledge_config['hashing_features']
+        self.vectorizer = HashingVectorizer(
+            n_features=self.n_features,
+            tokenizer=str.split,
+            token_pattern=None,
+            lowercase=False,  # 预处理时已统一小写
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32
+        )
+        self.shard_dir = None
+        # 构建目录的读租约（副本共享），其他进程清理旧构建目录时不会删除正在使用的目录
+        self.shard_lease = None
+        self.doc_shards = []
+        self.chunk_shards = []
+        self.chunk_count = 0
+        
+        # 文档频率和有效文档数，增删文档时整体替换（不原地修改），副本可以共享
+        self.doc_freqs = np.zeros(self.n_features, dtype=np.int32)
+        self.live_count = 0
+    
+    LEASE_FILE = '.lease'
+    
+    @staticmethod
+    def shard_root() -> str:
+        """分片根目录，每次全量建立索引使用其中一个新的 build-<时间戳> 子目录"""
+        return os.path.join(os.path.dirname(__file__), '..', knowledge_config['index_dir'], 'shards')
+    
+    def _vectorize(self, texts: List[str]) -> sp.csr_matrix:
+        """向量化预处理后的文本：对数词频，L2归一化"""
+        vectors = self.vectorizer.transform(texts)
+        vectors.data = 1 + np.log(vectors.data)
+        return normalize(vectors, copy=False)
+    
+    def _write_shard(self, kind: str, first_row: int, vectors: sp.spmatrix) -> SparseShard:
+        """把一批向量写入当前构建目录"""
+        return SparseShard.write(self.shard_dir, f"{kind}-{first_row}-{time.time_ns()}", first_row, vectors)
+    
+    def _write_batch(self, prepared: List[Tuple], first_row: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        向量化一批已准备的文档及其片段并写入分片，累计文档频率
+        
+        Returns:
+            (片段所属文档行号, 片段偏移)
+        """
+        doc_vectors = self._vectorize([doc_text for doc_text, _, _ in prepared])
+        chunk_texts, chunk_doc_rows, chunk_spans = self._split_chunks(prepared, first_row)
+        
+        self.doc_shards = self.doc_shards + [self._write_shard('doc', first_row, doc_vectors)]
+        if chunk_texts:
+            chunk_shard = self._write_shard('chunk', self.chunk_count, self._vectorize(chunk_texts))
+            self.chunk_shards = self.chunk_shards + [chunk_shard]
+            self.chunk_count = chunk_shard.end_row
+        
+        self.doc_freqs = self.doc_freqs + np.bincount(
+            doc_vectors.indices, minlength=self.n_features
+        ).astype(np.int32)
+        return chunk_doc_rows, chunk_spans
+    
+    def fit_documents(self, documents: List[EnhancedDocument], prepared: List[Tuple] = None):
+        """建立索引（prepared 为 prepare_document_texts 的预先计算结果，可选），按配置的批大小写入分片"""
+        prepared = self._prepare(documents, prepared)
+        self.fit_stream(iter_batches(zip(documents, prepared), knowledge_config['index_batch_size']))
+    
+    def fit_stream(self, batches: Iterable[List[Tuple[EnhancedDocument, Tuple]]]):
+        """
+        流式建立索引：逐批向量化并写入新的构建目录，文档频率随批累计
+        
+        任一时刻内存中只有一批文档的索引文本，已写入的分片以内存映射方式打开。
+        """
+        self.shard_dir = os.path.join(self.shard_root(), f"build-{time.time_ns()}")
+        self.documents = []
+        self.doc_rows = {}
+        self.doc_shards = []
+        self.chunk_shards = []
+        self.chunk_count = 0
+        self.doc_freqs = np.zeros(self.n_features, dtype=np.int32)
+        self.tombstones = set()
+        self.drift_count = 0
+        chunk_doc_rows = [np.zeros(0, dtype=np.int32)]
+        chunk_spans = [np.zeros((0, 2), dtype=np.int64)]
+        
+        try:
+            os.makedirs(self.shard_dir)
+            lease_path = os.path.join(self.shard_dir, self.LEASE_FILE)
+            open(lease_path, 'wb').close()
+            self.shard_lease = FileLease(lease_path)
+            for batch in batches:
+                first_row = len(self.documents)
+                self.documents.extend(doc for doc, _ in batch)
+                self._index_rows(first_row)
+                batch_doc_rows, batch_spans = self._write_batch([doc_texts for _, doc_texts in batch], first_row)
+                chunk_doc_rows.append(batch_doc_rows)
+                chunk_spans.append(batch_spans)
             
-            for db_doc in db_docs['documents']:
-                # 重新提取内容（使用增强提取器）
-                content = self._extract_enhanced_content(db_doc)
-                
-                if content:  # 只处理有内容的文档
-                    enhanced_doc = EnhancedDocument(
-                        doc_id=db_doc['id'],
-                        filename=db_doc['original_filename'],
-                        content=content,
-                        doc_type=db_doc['file_type'],
-                        category=db_doc['category'],
-                        title=db_doc['title'],
-                        description=db_doc['description'],
-                        upload_time=db_doc['upload_time']
-                    )
-                    enhanced_docs.append(enhanced_doc)
-                    self.documents_cache[db_doc['id']] = enhanced_doc
-            
-            # 训练向量搜索引擎
-            if enhanced_docs:
-                self.vector_engine.fit_documents(enhanced_docs)
-                logger.info(f"知识库索引完成，有效文档数量: {len(enhanced_docs)}")
+            self.chunk_doc_rows = np.concatenate(chunk_doc_rows)
+            self.chunk_spans = np.vstack(chunk_spans)
+            self.live_count = len(self.documents)
+            self.fitted_count = len(self.documents)
+            self.is_fitted = bool(self.documents)
+            
+            if self.documents:
+                logger.info(f"哈希搜索引擎索引完成，文档数量: {len(self.documents)}，分片数: {len(self.doc_shards)}")
             else:
-                logger.warning("没有找到有效的文档内容")
-                
+                logger.warning("没有文档用于建立哈希索引")
+        
+        except Exception:
+            # 批次来源（数据库读取、提取）的错误同样在这里抛出，不能当作空语料发布
+            self.is_fitted = False
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+            raise
+    
+    def remove_stale_files(self):
+        """删除其他构建中没有进程持有租约的分片目录（其他进程仍在读取或追加分片的目录保留）"""
+        root = self.shard_root()
+        if not self.shard_dir or not os.path.isdir(root):
+            return
+        
+        current = os.path.basename(self.shard_dir)
+        for name in os.listdir(root):
+            if name.startswith('build-') and name != current:
+                build_dir = os.path.join(root, name)
+                remove_unleased(build_dir, os.path.join(build_dir, self.LEASE_FILE))
+    
+    def drift_ratio(self) -> float:
+        """文档频率始终精确，只有墓碑行占比过高时才需要重建以回收空间"""
+        return len(self.tombstones) / max(len(self.documents), 1)
+    
+    def add_document(self, doc: EnhancedDocument, doc_texts: Tuple = None):
+        """增量添加文档：写入一个只含该文档的小分片，文档频率随之更新"""
+        if not self.is_fitted:
+            self.fit_documents(self.live_documents() + [doc])
+            return
+        
+        self.remove_document(doc.doc_id)
+        first_row = len(self.documents)
+        self._append_documents([doc])
+        chunk_doc_rows, chunk_spans = self._write_batch(
+            self._prepare([doc], None if doc_texts is None else [doc_texts]), first_row
+        )
+        self.chunk_spans = np.vstack([self.chunk_spans, chunk_spans])
+        self.chunk_doc_rows = np.concatenate([self.chunk_doc_rows, chunk_doc_rows])
+        self.live_count += 1
+        self.drift_count += 1
+    
+    def add_documents(self, batch: List[Tuple[EnhancedDocument, Tuple]]):
+        """增量添加一批文档：按 index_batch_size 写入分片，而不是每个文档一个分片"""
+        if not self.is_fitted or not batch:
+            super().add_documents(batch)
+            return
+        
+        for doc, _ in batch:
+            self.remove_document(doc.doc_id)
+        chunk_doc_rows = [self.chunk_doc_rows]
+        chunk_spans = [self.chunk_spans]
+        for part in iter_batches(batch, knowledge_config['index_batch_size']):
+            first_row = len(self.documents)
+            self._append_documents([doc for doc, _ in part])
+            part_doc_rows, part_spans = self._write_batch([doc_texts for _, doc_texts in part], first_row)
+            chunk_doc_rows.append(part_doc_rows)
+            chunk_spans.append(part_spans)
+        
+        self.chunk_spans = np.vstack(chunk_spans)
+        self.chunk_doc_rows = np.concatenate(chunk_doc_rows)
+        self.live_count += len(batch)
+        self.drift_count += len(batch)
+    
+    def remove_document(self, doc_id: int) -> bool:
+        """删除文档：墓碑标记，并从文档频率中扣除该文档的词项"""
+        row = self._find_row(doc_id)
+        if row is None:
+            return False
+        
+        shard = next(shard for shard in self.doc_shards if shard.first_row <= row < shard.end_row)
+        term_ids = shard.matrix[row - shard.first_row].nonzero()[1]
+        doc_freqs = self.doc_freqs.copy()
+        doc_freqs[term_ids] -= 1
+        self.doc_freqs = doc_freqs
+        
+        self.tombstones.add(row)
+        self.live_count -= 1
+        self.drift_count += 1
+        return True
+    
+    def _query_vector(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        查询向量：对数词频乘以由当前文档频率计算的平滑IDF，L2归一化
+        
+        Returns:
+            (词项哈希列号, 权重)，查询为空时两者均为空数组
+        """
+        processed_query = self.preprocess_text(query)
+        if not processed_query:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        
+        query_vector = self.vectorizer.transform([processed_query])
+        term_ids = query_vector.indices
+        idf = np.log((1 + self.live_count) / (1 + self.doc_freqs[term_ids])) + 1
+        weights = (1 + np.log(query_vector.data.astype(np.float64))) * idf
+        norm = np.linalg.norm(weights)
+        return term_ids, (weights / norm if norm else weights)
+    
+    @staticmethod
+    def _score_shards(shards: List[SparseShard], term_ids: np.ndarray,
+                      weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """逐个分片只取查询词对应的列计算得分，返回超过最小相似度阈值的行号和得分"""
+        rows = [np.zeros(0, dtype=np.int64)]
+        scores = [np.zeros(0)]
+        
+        for shard in shards:
+            shard_scores = np.asarray(shard.matrix[:, term_ids] @ weights).ravel()
+            hits = np.flatnonzero(shard_scores > 0.01)  # 最小相似度阈值
+            rows.append(hits + shard.first_row)
+            scores.append(shard_scores[hits])
+        
+        return np.concatenate(rows), np.concatenate(scores)
+    
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[EnhancedDocument, float]]:
+        """哈希向量搜索"""
+        if not self.is_fitted or not self.documents:
+            return []
+        
+        try:
+            term_ids, weights = self._query_vector(query)
+            if not len(term_ids):
+                return []
+            
+            rows, scores = self._score_shards(self.doc_shards, term_ids, weights)
+            keep = self._drop_tombstoned(rows, np.arange(len(rows)))
+            rows, scores = self._top_k(rows[keep], scores[keep], top_k)
+            
+            return [(self.documents[idx], float(score)) for idx, score in zip(rows, scores)]
+        
         except Exception as e:
-            logger.error(f"知识库索引失败: {e}")
+            logger.error(f"哈希向量搜索失败: {e}")
+            return []
     
-    def _extract_enhanced_content(self, db_doc: Dict) -> str:
-        """使用增强提取器重新提取文档内容"""
+    def search_chunks(self, query: str, top_k: int = 10) -> List[Tuple[EnhancedDocument, str, float]]:
+        """哈希向量片段搜索"""
+        if not self.is_fitted or not self.chunk_shards:
+            return []
+        
         try:
-            # 构建文件路径
-            file_path = os.path.join(
-                os.path.dirname(__file__), '..', 'data', 'uploads', db_doc['filename']
+            term_ids, weights = self._query_vector(query)
+            if not len(term_ids):
+                return []
+            
+            rows, scores = self._score_shards(self.chunk_shards, term_ids, weights)
+            keep = self._drop_tombstoned(self.chunk_doc_rows[rows], np.arange(len(rows)))
+            rows, scores = self._top_k(rows[keep], scores[keep], top_k)
+            
+            return self._chunk_results(rows, scores)
+        
+        except Exception as e:
+            logger.error(f"哈希向量片段搜索失败: {e}")
+            return []
+    
+    def export_state(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """
+        导出索引状态：分片已在磁盘上，只导出分片清单、文档频率和片段偏移
+        
+        分片不重写，已删除文档的行保留并以墓碑行号导出。
+        """
+        arrays, document_metadata = self._export_documents(self.documents)
+        arrays.update({
+            'doc_freqs': self.doc_freqs,
+            'tombstones': np.array(sorted(self.tombstones), dtype=np.int64),
+            'chunk_doc_rows': self.chunk_doc_rows,
+            'chunk_spans': self.chunk_spans
+        })
+        
+        metadata = {
+            'engine': self.engine_name,
+            'n_features': self.n_features,
+            'shard_dir': os.path.basename(self.shard_dir),
+            'doc_shards': [shard.describe() for shard in self.doc_shards],
+            'chunk_shards': [shard.describe() for shard in self.chunk_shards],
+            'fitted_count': self.fitted_count,
+            'drift_count': self.drift_count,
+            **document_metadata
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict,
+                   content_store: ContentStore) -> 'HashingSearchEngine':
+        """从持久化状态恢复，分片以内存映射方式打开"""
+        engine = cls()
+        if metadata['n_features'] != engine.n_features:
+            raise ValueError("哈希向量维度与配置不一致")
+        
+        engine.shard_dir = os.path.join(cls.shard_root(), metadata['shard_dir'])
+        lease_path = os.path.join(engine.shard_dir, cls.LEASE_FILE)
+        # 旧版本的构建目录没有租约文件
+        open(lease_path, 'ab').close()
+        engine.shard_lease = FileLease(lease_path)
+        engine.doc_shards = [
+            SparseShard.open(engine.shard_dir, shard['name'], shard['first_row'], shard['shape'])
+            for shard in metadata['doc_shards']
+        ]
+        engine.chunk_shards = [
+            SparseShard.open(engine.shard_dir, shard['name'], shard['first_row'], shard['shape'])
+            for shard in metadata['chunk_shards']
+        ]
+        engine.chunk_count = engine.chunk_shards[-1].end_row if engine.chunk_shards else 0
+        engine.doc_freqs = arrays['doc_freqs']
+        engine.chunk_doc_rows = arrays['chunk_doc_rows']
+        engine.chunk_spans = arrays['chunk_spans']
+        
+        engine.documents = cls._restore_documents(arrays, metadata, content_store)
+        engine._index_rows()
+        engine.tombstones = {int(row) for row in arrays['tombstones']}
+        engine.live_count = len(engine.documents) - len(engine.tombstones)
+        engine.fitted_count = metadata['fitted_count']
+        engine.drift_count = metadata['drift_count']
+        engine.is_fitted = bool(engine.documents)
+        return engine
+
+# 可选的搜索引擎实现，通过 knowledge_index.search_engine 配置选择
+SEARCH_ENGINES = {
+    VectorSearchEngine.engine_name: VectorSearchEngine,
+    BM25SearchEngine.engine_name: BM25SearchEngine,
+    HashingSearchEngine.engine_name: HashingSearchEngine
+}
+
+def create_search_engine(engine_name: str = None) -> SearchEngineBase:
+    """按名称（默认取配置）创建搜索引擎"""
+    engine_name = engine_name or knowledge_config['search_engine']
+    engine_class = SEARCH_ENGINES.get(engine_name)
+    if engine_class is None:
+        logger.warning(f"未知的搜索引擎: {engine_name}，使用TF-IDF")
+        engine_class = VectorSearchEngine
+    return engine_class()
+
+def init_index_worker(config: Dict = None):
+    """
+    索引构建工作进程初始化：使用父进程的配置（包括运行时修改），进程内串行提取PDF分页
+    避免进程池嵌套，并预先加载jieba词典
+    """
+    if config:
+        knowledge_config.update(config)
+    knowledge_config['pdf_workers'] = 1
+    jieba.initialize()
+
+def extract_document_content(db_doc: Dict) -> str:
+    """
+    使用增强提取器从上传文件提取文档内容
+    
+    上传时已提取失败（超时或超出内存上限）的文档不再重新提取；增强提取失败时使用上传时提取的文本。
+    """
+    if db_doc.get('extraction_status') == 'extraction_failed':
+        return db_doc.get('content_text', '')
+    
+    try:
+        # 构建文件路径
+        file_path = data_path('uploads', db_doc['filename'])
+        
+        if not os.path.exists(file_path):
+            logger.warning(f"文件不存在: {file_path}")
+            return db_doc.get('content_text', '')
+        
+        file_type = db_doc['file_type']
+        
+        if file_type == 'excel':
+            return EnhancedContentExtractor.extract_excel_content(file_path)
+        elif file_type == 'pdf':
+            return EnhancedContentExtractor.extract_pdf_content(file_path)
+        elif file_type == 'word':
+            return EnhancedContentExtractor.extract_word_content(file_path)
+        elif file_type in ['text', 'markdown']:
+            return EnhancedContentExtractor.extract_text_content(file_path)
+        else:
+            return db_doc.get('content_text', '')
+            
+    except ExtractionFailed as e:
+        logger.warning(f"增强内容提取失败，使用上传时提取的文本: {db_doc['id']}: {e}")
+        return db_doc.get('content_text', '')
+    except Exception as e:
+        logger.error(f"增强内容提取失败: {e}")
+        return db_doc.get('content_text', '')
+
+def build_enhanced_document(db_doc: Dict) -> Optional[Tuple[EnhancedDocument, Optional[Tuple]]]:
+    """
+    从数据库记录构建增强文档，没有内容时返回None
+    
+    Returns:
+        (增强文档, 需要写回数据库的关键词摘要分析结果，复用已保存结果时为None)
+    """
+    # 重新提取内容（使用增强提取器）
+    content = extract_document_content(db_doc)
+    
+    if not content:  # 只处理有内容的文档
+        return None
+    
+    keywords, summary, analysis = analyze_document(db_doc, content)
+    doc = EnhancedDocument(
+        doc_id=db_doc['id'],
+        filename=db_doc['original_filename'],
+        content=content,
+        doc_type=db_doc['file_type'],
+        category=db_doc['category'],
+        title=db_doc['title'],
+        description=db_doc['description'],
+        upload_time=db_doc['upload_time'],
+        keywords=keywords,
+        summary=summary
+    )
+    return doc, analysis
+
+def prepare_indexed_document(db_doc: Dict) -> Optional[Tuple[EnhancedDocument, Tuple, str, Optional[Tuple]]]:
+    """
+    索引构建的工作函数（在进程池中执行）
+    
+    提取内容、取得（或计算）关键词和摘要并分词，
+    返回 (增强文档, 索引文本, 全文索引分词正文, 需要写回的分析结果)，没有内容时返回None
+    """
+    built = build_enhanced_document(db_doc)
+    if built is None:
+        return None
+    doc, analysis = built
+    fts_body = segment_for_fts(doc.content) if knowledge_config['hybrid_search'] else None
+    return doc, prepare_document_texts(doc), fts_body, analysis
+
+class IndexSnapshot:
+    """
+    不可变索引快照
+    
+    包含搜索引擎、文档映射和索引代数。读者每次请求只取一次当前快照引用，
+    写者在副本上构建新引擎后整体替换快照引用；旧快照在最后一个读者结束后由引用计数释放。
+    """
+    
+    __slots__ = ('engine', 'documents', 'generation')
+    
+    def __init__(self, engine: SearchEngineBase, documents: Dict[int, EnhancedDocument], generation: int):
+        object.__setattr__(self, 'engine', engine)
+        object.__setattr__(self, 'documents', MappingProxyType(documents))
+        object.__setattr__(self, 'generation', generation)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("索引快照不可修改")
+
+class EnhancedKnowledgeBase:
+    """增强知识库管理类"""
+    
+    def __init__(self):
+        self.content_extractor = EnhancedContentExtractor()
+        # 当前索引快照；index_lock 只用于串行化写者，读者不加锁
+        self.snapshot = IndexSnapshot(create_search_engine(), {}, 0)
+        self.index_lock = threading.RLock()
+        self.refit_thread = None
+        self.retrieval_cache = RetrievalCache(
+            max_entries=knowledge_config['retrieval_cache_size'],
+            ttl=knowledge_config['retrieval_cache_ttl']
+        )
+        self.index_store = IndexStore(os.path.join(
+            os.path.dirname(__file__), '..', knowledge_config['index_dir']
+        ))
+        # 正文内容存储：全量构建时新建，增量添加的文档追加到当前存储
+        self.content_dir = os.path.join(self.index_store.index_dir, 'content')
+        self.content_store = None
+        # 增量变更批量持久化：未保存的变更数和延迟写入定时器；persist_lock 串行化导出和写入
+        self.unsaved_changes = 0
+        self.persist_timer = None
+        self.pending_persist_lock = threading.Lock()
+        self.persist_lock = threading.Lock()
+        
+        # 索引就绪状态：building（首次构建中）/ ready（已发布索引）/ failed（首次构建失败）
+        self.index_state = {
+            'status': 'building',
+            'progress': 0.0,
+            'doc_count': 0,
+            'error': None,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None
+        }
+        self.index_ready = threading.Event()
+        # 构建期间收到的文档变更，索引发布后再应用
+        self.pending_changes = None
+        self.started = False
+        self.build_thread = None
+    
+    @property
+    def document_manager(self):
+        """文档管理器（使用时才导入数据库模块，索引工作进程导入本模块时不初始化数据库）"""
+        from models.database import document_manager
+        return document_manager
+    
+    def start(self):
+        """
+        开始构建索引（只执行一次）：注册文档变更监听器，按 background_build 在后台线程或当前线程中构建
+        
+        构建会启动索引工作进程，因此导入模块时不构建；应用启动时调用，首次检索或等待就绪时也会自动调用。
+        """
+        with self.index_lock:
+            if self.started:
+                return
+            self.started = True
+        
+        if knowledge_config['incremental_index']:
+            self.document_manager.add_change_listener(self._on_document_changed)
+        # 进程退出时写入尚未持久化的增量变更
+        atexit.register(self.flush_persist)
+        
+        # 后台构建索引，不阻塞应用启动
+        if knowledge_config['background_build']:
+            self.build_thread = threading.Thread(
+                target=self._load_and_index_documents, name='knowledge-index-build', daemon=True
             )
+            self.build_thread.start()
+        else:
+            self._load_and_index_documents()
+    
+    @property
+    def search_engine(self) -> SearchEngineBase:
+        """当前快照的搜索引擎"""
+        return self.snapshot.engine
+    
+    @property
+    def documents_cache(self) -> Dict[int, EnhancedDocument]:
+        """当前快照的文档映射（只读）"""
+        return self.snapshot.documents
+    
+    @property
+    def index_generation(self) -> int:
+        """索引代数：每次发布新快照时递增，作为检索缓存键的一部分"""
+        return self.snapshot.generation
+    
+    def is_ready(self) -> bool:
+        """索引是否已发布可用"""
+        return self.index_state['status'] == 'ready'
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """等待首次索引构建结束，返回索引是否可用"""
+        self.start()
+        self.index_ready.wait(timeout)
+        return self.is_ready()
+    
+    def get_index_state(self) -> Dict:
+        """获取索引就绪状态"""
+        return dict(self.index_state)
+    
+    def _build_enhanced_document(self, db_doc: Dict) -> Optional[EnhancedDocument]:
+        """从数据库记录构建增强文档，新计算的关键词和摘要写回数据库；没有内容时返回None"""
+        built = build_enhanced_document(db_doc)
+        if built is None:
+            return None
+        
+        doc, analysis = built
+        if analysis is not None:
+            self.document_manager.save_document_analyses([analysis])
+        return doc
+    
+    def _parallel_map(self, func, items: Iterable):
+        """
+        用进程池并行执行 func（提取、关键词摘要计算和分词都受GIL限制），按输入顺序逐个产出结果
+        
+        输入按 index_batch_size 分批提交，内存中只保留一批的输入和结果，可以是数据库游标等生成器。
+        工作进程以独立入口启动（见 IndexWorkerPool），只导入本模块，不从已运行入库、压缩迁移等线程的
+        进程中fork；配置随初始化参数传入。第一批有多个输入时才启动工作进程，工作进程数为1时串行执行。
+        分块超过 index_worker_timeout 秒没有结果时结束该工作进程，该分块在本进程中串行执行。
+        """
+        workers = knowledge_config['index_workers'] or os.cpu_count() or 1
+        pool = None
+        parallel = workers > 1
+        
+        try:
+            for batch in iter_batches(items, knowledge_config['index_batch_size']):
+                results = None
+                if parallel and len(batch) > 1:
+                    try:
+                        if pool is None:
+                            pool = IndexWorkerPool(workers, init_index_worker, (dict(knowledge_config),))
+                        results = pool.map(func, batch, chunksize=max(1, len(batch) // (workers * 4)),
+                                           timeout=knowledge_config['index_worker_timeout'])
+                    except Exception as e:
+                        logger.error(f"并行索引准备失败，剩余部分改为串行执行: {e}")
+                        parallel = False
+                        if pool is not None:
+                            pool.shutdown(kill=True)
+                            pool = None
+                
+                if results is None:
+                    results = [func(item) for item in batch]
+                yield from results
+        
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    
+    def _prepared_batches(self, content_store: ContentStore) -> Iterator[List[Tuple[EnhancedDocument, Tuple]]]:
+        """
+        从数据库分批读取文档并行准备，逐批产出 [(增强文档, 索引文本)]
+        
+        正文写入内容存储，全文索引和新计算的关键词摘要按批写回数据库，同时更新构建进度。
+        """
+        batch_size = knowledge_config['index_batch_size']
+        total = max(self.document_manager.count_documents(), 1)
+        db_docs = self.document_manager.iter_documents(batch_size)
+        batch = []
+        fts_entries = []
+        analyses = []
+        
+        for count, result in enumerate(self._parallel_map(prepare_indexed_document, db_docs), 1):
+            if result:
+                enhanced_doc, doc_texts, fts_body, analysis = result
+                enhanced_doc.attach_content_store(content_store)
+                batch.append((enhanced_doc, doc_texts))
+                if fts_body is not None:
+                    fts_entries.append((enhanced_doc.doc_id, enhanced_doc.title, enhanced_doc.description, fts_body))
+                if analysis is not None:
+                    analyses.append(analysis)
+            # 构建期间新上传的文档也会被读到，进度不超过1
+            self.index_state['progress'] = round(min(count / total, 1.0), 4)
+            
+            if len(batch) >= batch_size:
+                # 全文索引使用增强提取的内容
+                self.document_manager.update_fts_documents(fts_entries)
+                self.document_manager.save_document_analyses(analyses)
+                yield batch
+                batch = []
+                fts_entries = []
+                analyses = []
+        
+        self.document_manager.update_fts_documents(fts_entries)
+        self.document_manager.save_document_analyses(analyses)
+        if batch:
+            yield batch
+    
+    def _load_and_index_documents(self, use_persisted: bool = True):
+        """加载并索引所有文档，构建完成后原子替换当前索引"""
+        with self.index_lock:
+            self.pending_changes = []
+        
+        try:
+            fingerprint = self._index_fingerprint()
             
-            if not os.path.exists(file_path):
-                logger.warning(f"文件不存在: {file_path}")
-                return db_doc.get('content_text', '')
+            # 语料未变化时直接加载持久化索引
+            if use_persisted and knowledge_config['persist_index'] and self._load_persisted_index(fingerprint):
+                return
             
-            file_type = db_doc['file_type']
+            engine = create_search_engine()
+            content_store = ContentStore.create(self.content_dir)
             
-            if file_type == 'excel':
-                return self.content_extractor.extract_excel_content(file_path)
-            elif file_type == 'pdf':
-                return self.content_extractor.extract_pdf_content(file_path)
-            elif file_type == 'word':
-                return self.content_extractor.extract_word_content(file_path)
-            elif file_type in ['text', 'markdown']:
-                return self.content_extractor.extract_text_content(file_path)
+            # 从数据库分批读取、并行提取和分词，结果按原顺序逐批送入搜索引擎
+            engine.fit_stream(self._prepared_batches(content_store))
+            doc_count = len(engine.documents)
+            if doc_count:
+                if not engine.is_fitted:
+                    raise RuntimeError("搜索引擎训练失败")
+                logger.info(f"知识库索引完成，有效文档数量: {doc_count}")
             else:
-                return db_doc.get('content_text', '')
+                logger.warning("没有找到有效的文档内容")
+            
+            self._publish_index(engine, content_store)
+            if doc_count:
+                self._persist_index(fingerprint)
                 
         except Exception as e:
-            logger.error(f"增强内容提取失败: {e}")
-            return db_doc.get('content_text', '')
+            logger.error(f"知识库索引失败: {e}")
+            self.index_state['error'] = str(e)
+            if not self.is_ready():
+                self.index_state['status'] = 'failed'
+                self.index_state['finished_at'] = datetime.now().isoformat()
+        
+        finally:
+            with self.index_lock:
+                pending, self.pending_changes = self.pending_changes, None
+            for action, document_ids in pending:
+                self._on_document_changed(action, document_ids)
+            self.index_ready.set()
+    
+    def _publish_snapshot(self, engine: SearchEngineBase, documents: Dict[int, EnhancedDocument] = None) -> IndexSnapshot:
+        """以新引擎发布快照，索引代数递增"""
+        if documents is None:
+            documents = {doc.doc_id: doc for doc in engine.live_documents()}
+        
+        with self.index_lock:
+            self.snapshot = IndexSnapshot(engine, documents, self.snapshot.generation + 1)
+            return self.snapshot
+    
+    def _publish_index(self, engine: SearchEngineBase, content_store: ContentStore):
+        """发布全量构建的索引，切换内容存储并更新就绪状态"""
+        with self.index_lock:
+            self.content_store = content_store
+            snapshot = self._publish_snapshot(engine)
+        
+        # 旧快照已打开的存储文件在删除后仍可读取，直到快照释放
+        remove_stale_stores(self.content_dir, content_store.name)
+        engine.remove_stale_files()
+        
+        self.index_state.update({
+            'status': 'ready',
+            'progress': 1.0,
+            'doc_count': len(snapshot.documents),
+            'error': None,
+            'finished_at': datetime.now().isoformat()
+        })
+    
+    def _index_fingerprint(self) -> str:
+        """索引指纹：语料指纹加上影响索引结构的配置"""
+        corpus_fingerprint = self.document_manager.get_corpus_fingerprint()
+        build_settings = (f"{knowledge_config['search_engine']}:{knowledge_config['chunk_size']}:"
+                          f"{knowledge_config['chunk_overlap']}:{knowledge_config['excel_sheet_chunks']}")
+        return hashlib.sha256(f"{build_settings}:{corpus_fingerprint}".encode('utf-8')).hexdigest()
+    
+    def _load_persisted_index(self, fingerprint: str) -> bool:
+        """加载持久化索引，成功返回True"""
+        state = self.index_store.load(fingerprint)
+        if not state:
+            return False
+        
+        arrays, metadata = state
+        engine_class = SEARCH_ENGINES.get(metadata.get('engine'))
+        if engine_class is None:
+            return False
+        
+        store_path = os.path.join(self.content_dir, metadata.get('content_store') or '')
+        if not os.path.isfile(store_path):
+            logger.info("正文内容存储不存在，需要重建索引")
+            return False
+        
+        try:
+            content_store = ContentStore(store_path)
+            engine = engine_class.from_state(arrays, metadata, content_store)
+        except Exception as e:
+            logger.error(f"恢复持久化索引失败: {e}")
+            return False
+        
+        self._publish_index(engine, content_store)
+        logger.info(f"已加载持久化索引，文档数量: {len(engine.documents)}")
+        return True
+    
+    def _persist_index(self, fingerprint: str = None):
+        """将当前索引写入磁盘"""
+        if not knowledge_config['persist_index']:
+            return
+        
+        # 写入串行进行，后写入的总是较新的快照
+        with self.persist_lock:
+            try:
+                # 快照不可变，导出时无需持有索引锁
+                engine = self.snapshot.engine
+                if not engine.is_fitted:
+                    return
+                arrays, metadata = engine.export_state()
+                
+                if fingerprint is None:
+                    fingerprint = self._index_fingerprint()
+                self.index_store.save(arrays, metadata, fingerprint)
+                
+            except Exception as e:
+                logger.error(f"索引持久化失败: {e}")
+    
+    def _schedule_persist(self, changes: int = 1):
+        """
+        记录增量变更，按批持久化索引
+        
+        未保存的变更达到 persist_batch_changes 个时立即写入，否则在 persist_delay 秒后由定时器写入一次，
+        连续上传或删除文档时不会每个变更都导出整个索引。
+        """
+        if not knowledge_config['persist_index']:
+            return
+        
+        with self.pending_persist_lock:
+            self.unsaved_changes += changes
+            if self.unsaved_changes < knowledge_config['persist_batch_changes']:
+                if self.persist_timer is None:
+                    self.persist_timer = threading.Timer(knowledge_config['persist_delay'], self.flush_persist)
+                    self.persist_timer.daemon = True
+                    self.persist_timer.start()
+                return
+        
+        self.flush_persist()
+    
+    def flush_persist(self):
+        """立即写入尚未持久化的增量变更（进程退出时自动调用）"""
+        with self.pending_persist_lock:
+            if self.persist_timer is not None:
+                self.persist_timer.cancel()
+                self.persist_timer = None
+            if not self.unsaved_changes:
+                return
+            self.unsaved_changes = 0
+        
+        self._persist_index()
+    
+    def _cached_retrieval(self, method: str, query: str, params: tuple, retrieve):
+        """
+        按 (方法, 规范化查询, 参数, 索引代数, 文档变更计数) 缓存检索结果
+        
+        retrieve 接收本次请求取得的快照，整个检索过程使用同一个快照。
+        文档变更计数使全文索引变化（如没有可索引正文的文档）也能让缓存失效。
+        """
+        self.start()
+        snapshot = self.snapshot
+        key = (method, normalize_query(query), params, snapshot.generation, self.document_manager.revision)
+        hit, value = self.retrieval_cache.get(key)
+        if hit:
+            return value
+        
+        value = retrieve(snapshot)
+        if value:  # 检索失败或无结果时不缓存
+            self.retrieval_cache.put(key, value)
+        return value
     
     def search_documents(self, query: str, limit: int = 5) -> List[Dict]:
-        """增强文档搜索"""
+        """增强文档搜索（结果按规范化查询缓存）"""
+        results = self._cached_retrieval(
+            'search_documents', query, (limit,),
+            lambda snapshot: self._search_documents(snapshot, query, limit)
+        )
+        # 返回副本，调用方修改结果时不影响缓存
+        return [dict(result) for result in results]
+    
+    def _search_documents(self, snapshot: IndexSnapshot, query: str, limit: int) -> List[Dict]:
+        """
+        执行混合文档搜索
+        
+        FTS5全文检索（精确匹配型号等关键词）与搜索引擎（语义召回）的排名按
+        倒数排名融合（RRF）：score = Σ 1 / (k + rank)。索引尚未就绪（构建中或构建失败）时不论是否开启
+        混合检索都退回到数据库搜索（FTS5全文检索，不支持时LIKE匹配）。
+        """
         try:
-            # 使用向量搜索
-            vector_results = self.vector_engine.search(query, top_k=limit)
+            candidates = max(limit * 4, 20)
+            rankings = [[doc.doc_id for doc, _ in snapshot.engine.search(query, top_k=candidates)]]
+            if not self.is_ready():
+                rankings.append([row['id'] for row in self.document_manager.search_documents(query, limit=candidates)])
+            elif knowledge_config['hybrid_search']:
+                rankings.append([doc_id for doc_id, _ in self.document_manager.fts_search(query, candidates)])
+            
+            fused = {}
+            for ranking in rankings:
+                for rank, doc_id in enumerate(ranking, 1):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (knowledge_config['rrf_k'] + rank)
+            
+            top_ids = sorted(fused, key=fused.get, reverse=True)[:limit]
+            rows = self.document_manager.get_documents_by_ids(top_ids)
             
             # 转换为标准格式
             results = []
-            for doc, score in vector_results:
-                results.append({
-                    'id': doc.doc_id,
-                    'title': doc.title,
-                    'original_filename': doc.filename,
-                    'file_type': doc.doc_type,
-                    'category': doc.category,
-                    'content_summary': doc.summary,
-                    'upload_time': doc.upload_time,
-                    'relevance_score': score,
-                    'keywords': doc.keywords
+            for doc_id in top_ids:
+                row = rows.get(doc_id)
+                if row is None:  # 已删除的文档
+                    continue
+                
+                doc = snapshot.documents.get(doc_id)
+                result = dict(row)
+                result.update({
+                    'content_summary': (doc.summary if doc and doc.summary else row['content_summary']) or '',
+                    'relevance_score': round(fused[doc_id], 6),
+                    'keywords': doc.keywords if doc else []
                 })
+                results.append(result)
             
             return results
             
@@ -419,108 +2190,259 @@ class EnhancedKnowledgeBase:
             logger.error(f"增强搜索失败: {e}")
             return []
     
-    def get_relevant_content(self, question: str, max_docs: int = 3) -> str:
-        """获取与问题相关的文档内容（RAG增强）"""
+    def get_relevant_content(self, question: str, max_docs: int = 3, max_chunks_per_doc: int = 3,
+                             token_budget: int = None) -> str:
+        """获取与问题相关的文档内容（RAG增强，按令牌预算组装）"""
+        return self.assemble_context(question, max_docs, max_chunks_per_doc, token_budget).text
+    
+    def assemble_context(self, question: str, max_docs: int = 3, max_chunks_per_doc: int = 3,
+                         token_budget: int = None) -> AssembledContext:
+        """
+        检索候选片段，去除近似重复后按令牌预算（默认取配置）组装上下文，结果按规范化查询缓存
+        """
+        if token_budget is None:
+            token_budget = knowledge_config['context_token_budget']
+        return self._cached_retrieval(
+            'assemble_context', question, (max_docs, max_chunks_per_doc, token_budget),
+            lambda snapshot: self._assemble_context(snapshot, question, max_docs, max_chunks_per_doc, token_budget)
+        )
+    
+    def _assemble_context(self, snapshot: IndexSnapshot, question: str, max_docs: int,
+                          max_chunks_per_doc: int, token_budget: int) -> AssembledContext:
+        """执行相关内容检索和上下文组装"""
         try:
-            # 使用向量搜索找到最相关的文档
-            vector_results = self.vector_engine.search(question, top_k=max_docs)
+            candidates = self._candidate_passages(snapshot, question, max_docs, max_chunks_per_doc)
+            context = ContextAssembler(token_budget).assemble(candidates, max_docs, max_chunks_per_doc)
+            context.sources = self._context_sources(snapshot, context)
             
-            if not vector_results:
+            if not context:
                 logger.warning(f"向量搜索没有找到相关文档，问题: {question}")
-                return ""
-            
-            content_parts = []
-            
-            for doc, score in vector_results:
-                logger.info(f"处理文档: {doc.title}, 相似度: {score:.3f}")
-                
-                if score < 0.01:  # 降低相似度阈值
-                    logger.info(f"文档相似度太低，跳过: {score:.3f}")
-                    continue
-                
-                # 提取最相关的段落
-                relevant_paragraphs = self._extract_relevant_paragraphs(
-                    doc.content, question, max_paragraphs=3
-                )
-                
-                if relevant_paragraphs:
-                    content_part = f"【{doc.title}】(相关度: {score:.2f})\n"
-                    content_part += "\n".join(relevant_paragraphs)
-                    content_parts.append(content_part)
-                    logger.info(f"添加了 {len(relevant_paragraphs)} 个相关段落")
-                else:
-                    # 如果没有找到相关段落，使用文档摘要
-                    if doc.summary:
-                        content_part = f"【{doc.title}】(相关度: {score:.2f})\n{doc.summary}"
-                        content_parts.append(content_part)
-                        logger.info(f"使用文档摘要作为相关内容")
-                    else:
-                        # 使用文档内容的前500个字符
-                        preview = doc.content[:500] if doc.content else ""
-                        if preview:
-                            content_part = f"【{doc.title}】(相关度: {score:.2f})\n{preview}..."
-                            content_parts.append(content_part)
-                            logger.info(f"使用文档内容预览")
-            
-            result = "\n\n".join(content_parts)
-            logger.info(f"最终相关内容长度: {len(result)}")
-            return result
+            else:
+                logger.info(f"最终相关内容长度: {len(context.text)}")
+            return context
             
         except Exception as e:
             logger.error(f"相关内容提取失败: {e}")
-            return ""
+            return AssembledContext(token_budget=token_budget)
     
-    def _extract_relevant_paragraphs(self, content: str, question: str, max_paragraphs: int = 3) -> List[str]:
-        """从文档中提取最相关的段落"""
-        if not content:
+    def _context_sources(self, snapshot: IndexSnapshot, context: AssembledContext) -> List[Dict]:
+        """
+        上下文的来源文档：入选片段所属文档的数据库记录（按入选顺序，已删除的文档跳过），
+        相关度取该文档入选片段的最高得分
+        """
+        scores = {}
+        for passage in context.passages:
+            scores[passage.doc_id] = max(scores.get(passage.doc_id, 0.0), float(passage.score))
+        if not scores:
             return []
         
-        # 分割段落
-        paragraphs = [p.strip() for p in content.split('\n') if len(p.strip()) > 20]
+        rows = self.document_manager.get_documents_by_ids(list(scores))
+        sources = []
+        for doc_id, score in scores.items():
+            row = rows.get(doc_id)
+            if row is None:
+                continue
+            doc = snapshot.documents.get(doc_id)
+            source = dict(row)
+            source.update({
+                'content_summary': (doc.summary if doc and doc.summary else row['content_summary']) or '',
+                'relevance_score': round(score, 6),
+                'keywords': doc.keywords if doc else []
+            })
+            sources.append(source)
+        return sources
+    
+    def _candidate_passages(self, snapshot: IndexSnapshot, question: str, max_docs: int,
+                            max_chunks_per_doc: int) -> List[Passage]:
+        """
+        检索候选片段：片段索引中最相关的片段（数量为最终可用片段数的3倍，供去重和MMR挑选），
+        没有命中的片段时（包括索引尚未就绪）退回到混合文档搜索并使用摘要
+        """
+        chunk_results = snapshot.engine.search_chunks(
+            question, top_k=max_docs * max_chunks_per_doc * 3
+        )
+        candidates = [
+            Passage(doc.doc_id, doc.title, chunk_text, score)
+            for doc, chunk_text, score in chunk_results
+        ]
         
-        if not paragraphs:
-            return []
+        if not candidates:
+            for hit in self._search_documents(snapshot, question, max_docs):
+                doc = snapshot.documents.get(hit['id'])
+                summary = hit['content_summary'] or (doc.content[:500] + "..." if doc and doc.content else "")
+                if summary:
+                    candidates.append(Passage(hit['id'], hit['title'], summary, hit['relevance_score']))
+                    logger.info(f"使用文档摘要作为相关内容: {hit['title']}")
         
-        # 提取问题关键词
-        question_words = set(jieba.cut(question.lower()))
-        question_words = {w for w in question_words if len(w) >= 2}
+        return candidates
+    
+    def _on_document_changed(self, action: str, document_ids: List[int]):
+        """文档变更回调：增量更新索引（全量构建期间先记录，发布后再应用）"""
+        with self.index_lock:
+            if self.pending_changes is not None:
+                self.pending_changes.append((action, document_ids))
+                return
         
-        # 计算每个段落的相关性得分
-        paragraph_scores = []
+        if action == 'added':
+            if len(document_ids) == 1:
+                self.add_document(document_ids[0])
+            else:
+                self.add_documents(document_ids)
+        elif action == 'deleted':
+            for document_id in document_ids:
+                self.remove_document(document_id)
+    
+    def add_document(self, document_id: int) -> bool:
+        """增量索引单个文档"""
+        db_doc = self.document_manager.get_document(document_id)
+        if not db_doc:
+            return False
         
-        for paragraph in paragraphs:
-            paragraph_words = set(jieba.cut(paragraph.lower()))
+        enhanced_doc = self._build_enhanced_document(db_doc)
+        if not enhanced_doc:
+            logger.warning(f"文档没有可索引的内容: {document_id}")
+            return False
+        
+        if knowledge_config['hybrid_search']:
+            self.document_manager.update_fts_documents([(
+                document_id, enhanced_doc.title, enhanced_doc.description, segment_for_fts(enhanced_doc.content)
+            )])
+        
+        # 写时复制：在引擎副本上追加，完成后发布新快照
+        with self.index_lock:
+            if self.content_store is None:
+                self.content_store = ContentStore.create(self.content_dir)
+            enhanced_doc.attach_content_store(self.content_store)
             
-            # 计算关键词匹配得分
-            match_score = len(question_words & paragraph_words) / max(len(question_words), 1)
+            snapshot = self.snapshot
+            engine = snapshot.engine.copy()
+            engine.add_document(enhanced_doc)
+            documents = dict(snapshot.documents)
+            documents[document_id] = enhanced_doc
+            self._publish_snapshot(engine, documents)
+        
+        logger.info(f"增量索引文档: {enhanced_doc.title}")
+        self._schedule_persist()
+        self._schedule_refit_if_drifted()
+        return True
+    
+    def add_documents(self, document_ids: List[int]) -> int:
+        """
+        增量索引一批文档（如批量导入），返回加入索引的文档数量
+        
+        文档按批从数据库读取并在进程池中并行准备，正文写入内容存储；提取和分词期间不持有索引锁，
+        查询和其他增量更新照常进行。全部准备完成后才加锁，在最新快照的引擎副本上一次追加，
+        只发布一次快照，变更数计入批量持久化。
+        """
+        batch_size = knowledge_config['index_batch_size']
+        db_docs = self.document_manager.iter_documents(batch_size, document_ids)
+        with self.index_lock:
+            if self.content_store is None:
+                self.content_store = ContentStore.create(self.content_dir)
+            content_store = self.content_store
+        
+        batches = []
+        for results in iter_batches(self._parallel_map(prepare_indexed_document, db_docs), batch_size):
+            batch = []
+            fts_entries = []
+            analyses = []
+            for result in filter(None, results):
+                enhanced_doc, doc_texts, fts_body, analysis = result
+                enhanced_doc.attach_content_store(content_store)
+                batch.append((enhanced_doc, doc_texts))
+                if fts_body is not None:
+                    fts_entries.append((enhanced_doc.doc_id, enhanced_doc.title, enhanced_doc.description, fts_body))
+                if analysis is not None:
+                    analyses.append(analysis)
             
-            # 技术关键词加权
-            tech_keywords = {'pxi', 'labview', 'c#', '数据采集', '测控', '简仪', 'misd', '模块'}
-            tech_score = sum(1 for keyword in tech_keywords if keyword in paragraph.lower())
+            self.document_manager.update_fts_documents(fts_entries)
+            self.document_manager.save_document_analyses(analyses)
+            if batch:
+                batches.append(batch)
+        
+        added = sum(len(batch) for batch in batches)
+        if added:
+            # 写时复制：只在克隆、追加和发布期间持有索引锁
+            with self.index_lock:
+                snapshot = self.snapshot
+                engine = snapshot.engine.copy()
+                documents = dict(snapshot.documents)
+                for batch in batches:
+                    engine.add_documents(batch)
+                    documents.update((doc.doc_id, doc) for doc, _ in batch)
+                self._publish_snapshot(engine, documents)
             
-            total_score = match_score + tech_score * 0.1
-            paragraph_scores.append((paragraph, total_score))
+            logger.info(f"批量增量索引文档: {added} 个")
+            self._schedule_persist(added)
+            self._schedule_refit_if_drifted()
+        return added
+    
+    def remove_document(self, document_id: int) -> bool:
+        """从索引中移除单个文档"""
+        with self.index_lock:
+            snapshot = self.snapshot
+            engine = snapshot.engine.copy()
+            removed = engine.remove_document(document_id)
+            if removed:
+                documents = dict(snapshot.documents)
+                documents.pop(document_id, None)
+                self._publish_snapshot(engine, documents)
         
-        # 按得分排序并返回最相关的段落
-        paragraph_scores.sort(key=lambda x: x[1], reverse=True)
+        if removed:
+            logger.info(f"从索引中移除文档: {document_id}")
+            self._schedule_persist()
+            self._schedule_refit_if_drifted()
+        return removed
+    
+    def _schedule_refit_if_drifted(self):
+        """增量变更超过阈值时在后台重新训练向量化器"""
+        if self.search_engine.drift_ratio() <= knowledge_config['refit_drift_threshold']:
+            return
+        if self.refit_thread and self.refit_thread.is_alive():
+            return
         
-        return [p[0] for p in paragraph_scores[:max_paragraphs] if p[1] > 0]
+        self.refit_thread = threading.Thread(target=self._background_refit, daemon=True)
+        self.refit_thread.start()
+    
+    def _background_refit(self):
+        """后台重新计算词表和IDF，完成后替换搜索引擎"""
+        try:
+            snapshot = self.snapshot
+            documents = snapshot.engine.live_documents()
+            
+            new_engine = create_search_engine()
+            prepared = self._parallel_map(prepare_document_texts, documents)
+            new_engine.fit_stream(iter_batches(zip(documents, prepared), knowledge_config['index_batch_size']))
+            
+            with self.index_lock:
+                # 训练期间又发布了新快照时，放弃本次结果，等待下一次触发
+                if self.snapshot is not snapshot:
+                    logger.info("后台重新训练期间索引已变更，跳过替换")
+                    return
+                self._publish_snapshot(new_engine, dict(snapshot.documents))
+            
+            new_engine.remove_stale_files()
+            logger.info(f"后台重新训练完成，文档数量: {len(documents)}")
+            self._persist_index()
+            
+        except Exception as e:
+            logger.error(f"后台重新训练失败: {e}")
     
     def refresh_index(self):
-        """刷新索引"""
-        self.documents_cache.clear()
-        self._load_and_index_documents()
+        """刷新索引（强制全量重建，重建期间继续使用旧索引）"""
+        self._load_and_index_documents(use_persisted=False)
     
     def get_document_statistics(self) -> Dict:
         """获取文档统计信息"""
         try:
-            total_docs = len(self.documents_cache)
+            snapshot = self.snapshot
+            total_docs = len(snapshot.documents)
             
             # 按类型统计
             type_stats = {}
             category_stats = {}
             
-            for doc in self.documents_cache.values():
+            for doc in snapshot.documents.values():
                 type_stats[doc.doc_type] = type_stats.get(doc.doc_type, 0) + 1
                 category_stats[doc.category] = category_stats.get(doc.category, 0) + 1
             
@@ -529,7 +2451,12 @@ class EnhancedKnowledgeBase:
                 'indexed_documents': total_docs,
                 'by_type': type_stats,
                 'by_category': category_stats,
-                'vector_engine_status': 'active' if self.vector_engine.is_fitted else 'inactive'
+                'vector_engine_status': 'active' if snapshot.engine.is_fitted else 'inactive',
+                'search_engine': snapshot.engine.engine_name,
+                'index_generation': snapshot.generation,
+                'index_state': self.get_index_state(),
+                'retrieval_cache': self.retrieval_cache.get_statistics(),
+                'content_cache': content_cache.get_statistics()
             }
             
         except Exception as e:
@@ -539,8 +2466,9 @@ class EnhancedKnowledgeBase:
                 'indexed_documents': 0,
                 'by_type': {},
                 'by_category': {},
-                'vector_engine_status': 'error'
+                'vector_engine_status': 'error',
+                'index_state': self.get_index_state()
             }
 
-# 全局增强知识库实例
+# 全局增强知识库实例（导入时不构建索引，见 EnhancedKnowledgeBase.start）
 enhanced_knowledge_base = EnhancedKnowledgeBase()
@@ -0,0 +1,165 @@
+"""
+文档内容提取缓存
+Content-hash keyed cache for extracted document text
+"""
+
+import os
+import sqlite3
+import hashlib
+import inspect
+import threading
+from functools import wraps
+from typing import Callable, Optional
+import logging
+
+from config.knowledge_config import knowledge_config
+from config.paths import data_path
+from models.extraction_sandbox import run_sandboxed
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """
+    提取结果缓存
+
+    以 (文件SHA-256, 提取器名称, 提取器版本) 为键保存提取出的文本，
+    同一文件对每个提取器版本最多解析一次。提取逻辑变化时递增提取器版本即可失效旧缓存。
+    """
+
+    def __init__(self, db_path: str = None):
+        if db_path is None:
+            db_path = data_path('extraction_cache.db')
+
+        self.db_path = db_path
+        self.hash_memo = {}
+        self.memo_lock = threading.Lock()
+        self.init_database()
+
+    def get_connection(self):
+        """获取数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_database(self):
+        """初始化缓存表"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    content_hash TEXT NOT NULL,
+                    extractor TEXT NOT NULL,
+                    extractor_version INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (content_hash, extractor, extractor_version)
+                )
+            ''')
+            conn.commit()
+        except Exception as e:
+            logger.error(f"提取缓存初始化失败: {e}")
+        finally:
+            conn.close()
+
+    def file_hash(self, file_path: str) -> str:
+        """计算文件SHA-256（按路径、大小和修改时间记忆，避免重复读取）"""
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+        with self.memo_lock:
+            cached = self.hash_memo.get(memo_key)
+        if cached:
+            return cached
+
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+
+        with self.memo_lock:
+            self.hash_memo[memo_key] = digest
+        return digest
+
+    def get(self, content_hash: str, extractor: str, version: int) -> Optional[str]:
+        """读取缓存的提取结果"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT content FROM extraction_cache
+                WHERE content_hash = ? AND extractor = ? AND extractor_version = ?
+            ''', (content_hash, extractor, version))
+
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        except Exception as e:
+            logger.error(f"读取提取缓存失败: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def put(self, content_hash: str, extractor: str, version: int, content: str):
+        """写入提取结果"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO extraction_cache
+                (content_hash, extractor, extractor_version, content)
+                VALUES (?, ?, ?, ?)
+            ''', (content_hash, extractor, version, content))
+            conn.commit()
+
+        except Exception as e:
+            logger.error(f"写入提取缓存失败: {e}")
+        finally:
+            conn.close()
+
+    def get_or_extract(self, file_path: str, extractor: str, version: int,
+                       func: Callable[..., str], *args, **kwargs) -> str:
+        """
+        命中缓存时直接返回，否则执行提取 func(*args, **kwargs) 并缓存非空结果
+
+        提取在沙箱进程中执行（见 run_sandboxed），超时、超出内存上限或进程崩溃时抛出 ExtractionFailed。
+        """
+        if not os.path.exists(file_path):
+            return func(*args, **kwargs)
+        if not knowledge_config['extraction_cache']:
+            return run_sandboxed(func, *args, **kwargs)
+
+        content_hash = self.file_hash(file_path)
+        content = self.get(content_hash, extractor, version)
+        if content is not None:
+            return content
+
+        content = run_sandboxed(func, *args, **kwargs)
+        if content:  # 提取失败返回空字符串时不缓存，下次可以重试
+            self.put(content_hash, extractor, version, content)
+        return content
+
+
+def cached_extraction(extractor: str, version: int = 1):
+    """
+    提取函数缓存装饰器
+
+    被装饰的函数需要有名为 file_path 的参数，返回提取出的文本；提取在沙箱进程中执行，
+    因此只能装饰模块级函数或静态方法（见 run_sandboxed）。
+    提取结果受配置影响时 extractor 可以是返回名称的函数（名称中包含相关配置），配置变化后旧缓存不再命中。
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            file_path = signature.bind(*args, **kwargs).arguments['file_path']
+            name = extractor() if callable(extractor) else extractor
+            return extraction_cache.get_or_extract(file_path, name, version, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# 全局提取缓存实例
+extraction_cache = ExtractionCache()
@@ -0,0 +1,207 @@
+"""
+文档提取沙箱
+Run document extraction in isolated worker processes with time and memory limits
+"""
+
+import os
+import time
+import signal
+import inspect
+import logging
+import importlib
+import threading
+from typing import Callable, Optional, Tuple
+
+from config.knowledge_config import knowledge_config
+from models.index_workers import WorkerProcess, WorkerTimeout
+
+try:
+    import resource
+except ImportError:  # Windows：没有地址空间限制
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# 父进程检查沙箱进程状态（结果、超时、内存）的间隔（秒）
+POLL_INTERVAL = 0.2
+
+# 保留的空闲沙箱进程数：沙箱进程可以复用，不必每次提取都启动解释器并导入解析库
+MAX_IDLE_WORKERS = 4
+
+MB = 1024 * 1024
+
+# 内存上限通过 /proc 读取进程内存，只在Linux上生效；其他平台（如Windows）只限制提取时间
+MEMORY_LIMIT_SUPPORTED = os.path.exists('/proc/self/statm')
+
+
+class ExtractionFailed(Exception):
+    """提取超时、超出内存上限、出错或提取进程异常退出"""
+
+
+# 空闲的沙箱进程：(进程, 首次使用时的常驻内存字节数)
+_idle_workers = []
+_idle_lock = threading.Lock()
+_memory_limit_warned = threading.Event()
+
+
+def _memory_usage(pid: int):
+    """
+    进程的 (虚拟内存, 常驻内存) 字节数，读取 /proc，平台不支持时返回 (None, None)
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            size, resident = f.read().split()[:2]
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        return int(size) * page_size, int(resident) * page_size
+    except (OSError, ValueError, AttributeError):
+        return None, None
+
+
+def _function_reference(func: Callable) -> Tuple[str, str]:
+    """沙箱中执行的函数按 (模块名, 限定名) 传递，沙箱进程导入模块后取得函数"""
+    module_name, qualname = func.__module__, func.__qualname__
+    if module_name == '__main__' or '<' in qualname:
+        raise ValueError(f"沙箱只能执行可按模块和名称导入的函数: {module_name}.{qualname}")
+    return module_name, qualname
+
+
+def _resolve_function(module_name: str, qualname: str) -> Callable:
+    """导入函数（静态方法按 类名.方法名 查找），去掉在父进程中执行的缓存装饰器"""
+    target = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        target = getattr(target, name)
+    return inspect.unwrap(target)
+
+
+def _limit_address_space(memory_mb: Optional[int]):
+    """把地址空间软上限设为当前虚拟内存加 memory_mb，返回原来的 (软上限, 硬上限)，不支持时返回None"""
+    if not memory_mb or resource is None:
+        return None
+    virtual, _ = _memory_usage(os.getpid())
+    if not virtual:
+        return None
+
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    hard = previous[1]
+    limit = virtual + memory_mb * MB
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return previous
+
+
+def _sandbox_call(task: Tuple):
+    """
+    沙箱进程中执行一次提取，返回 ('ok', 结果)、('error', 错误信息) 或 ('memory', 错误信息)
+
+    使用父进程的配置（包括运行时修改）；提取函数内部不再嵌套沙箱。
+    """
+    (module_name, qualname), args, kwargs, config, memory_mb = task
+    knowledge_config.update(config, extraction_sandbox=False)
+    try:
+        func = _resolve_function(module_name, qualname)
+        previous = _limit_address_space(memory_mb)
+        try:
+            return 'ok', func(*args, **kwargs)
+        finally:
+            if previous is not None:
+                resource.setrlimit(resource.RLIMIT_AS, previous)
+    except MemoryError:
+        return 'memory', f"内存超出上限（{memory_mb}MB）"
+    except Exception as e:
+        return 'error', f"{type(e).__name__}: {e}"
+
+
+def _acquire_worker() -> Tuple[WorkerProcess, Optional[int]]:
+    """取一个空闲的沙箱进程，没有时启动新进程（在独立进程组中，超限时连同分页提取的工作进程一起结束）"""
+    with _idle_lock:
+        while _idle_workers:
+            worker, base_resident = _idle_workers.pop()
+            if worker.process.poll() is None:
+                return worker, base_resident
+            worker.close(kill=True)
+    return WorkerProcess(new_session=True), None
+
+
+def _release_worker(worker: WorkerProcess, base_resident: Optional[int], memory_mb: Optional[int]):
+    """归还沙箱进程；常驻内存比首次使用时增长超过内存上限一半（解析库缓存、内存碎片）时关闭"""
+    if memory_mb and base_resident:
+        _, resident = _memory_usage(worker.pid)
+        if resident and resident - base_resident > memory_mb * MB // 2:
+            worker.close()
+            return
+
+    with _idle_lock:
+        if len(_idle_workers) < MAX_IDLE_WORKERS:
+            _idle_workers.append((worker, base_resident))
+            return
+    worker.close()
+
+
+def _kill_worker(worker: WorkerProcess):
+    """结束沙箱进程及其进程组中的所有进程"""
+    try:
+        os.killpg(worker.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # 平台不支持进程组（Windows）
+        pass
+    worker.close(kill=True)
+
+
+def run_sandboxed(func: Callable, *args, timeout: float = None, memory_mb: int = None, **kwargs):
+    """
+    在沙箱进程中执行 func(*args, **kwargs) 并返回结果
+
+    沙箱进程是以独立入口启动的新解释器（见 WorkerProcess），不从已运行多个线程的服务进程fork，
+    用完后保留复用。func 必须能按模块和限定名导入（模块级函数或静态方法；带缓存装饰器时在沙箱中
+    执行原函数），参数和返回值需要可序列化。运行超过 timeout 秒、常驻内存比提交时增长超过 memory_mb，
+    或出错、异常退出时抛出 ExtractionFailed；超时和超出内存时结束沙箱进程及其进程组。
+
+    内存上限只在Linux上生效（读取 /proc，并用 RLIMIT_AS 限制地址空间），Windows等平台只限制提取时间。
+    未启用沙箱时直接在当前进程中执行。
+    """
+    if not knowledge_config['extraction_sandbox']:
+        return func(*args, **kwargs)
+
+    timeout = knowledge_config['extraction_timeout'] if timeout is None else timeout
+    memory_mb = knowledge_config['extraction_memory_mb'] if memory_mb is None else memory_mb
+    if memory_mb and not MEMORY_LIMIT_SUPPORTED:
+        if not _memory_limit_warned.is_set():
+            _memory_limit_warned.set()
+            logger.warning("当前平台不支持提取内存上限，提取沙箱只限制时间")
+        memory_mb = None
+
+    task = (_function_reference(func), args, kwargs, dict(knowledge_config), memory_mb)
+    worker, base_resident = _acquire_worker()
+    _, baseline = _memory_usage(worker.pid)
+    deadline = time.monotonic() + timeout if timeout else None
+    status = None
+    try:
+        worker.submit(_sandbox_call, [task])
+        while True:
+            try:
+                [(status, payload)] = worker.result(POLL_INTERVAL)
+                break
+            except WorkerTimeout:
+                pass
+            if deadline is not None and time.monotonic() > deadline:
+                raise ExtractionFailed(f"提取超时（{timeout}秒）")
+            if memory_mb and baseline:
+                _, resident = _memory_usage(worker.pid)
+                if resident and resident - baseline > memory_mb * MB:
+                    raise ExtractionFailed(f"内存超出上限（{memory_mb}MB）")
+
+    except (RuntimeError, OSError) as e:
+        raise ExtractionFailed(f"提取进程异常退出: {e}")
+
+    finally:
+        if status in ('ok', 'error'):
+            _release_worker(worker, base_resident or baseline, memory_mb)
+        else:
+            if status is None:
+                logger.warning(f"结束提取进程: {worker.pid}")
+            _kill_worker(worker)
+
+    if status != 'ok':
+        raise ExtractionFailed(payload)
+    return payload
@@ -0,0 +1,100 @@
+"""
+文件租约
+Cross-process leases on index files and maintenance tasks shared by several application processes
+"""
+
+import os
+import shutil
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有flock，删除前不检查其他进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FileLease:
+    """
+    读租约：在租约文件上持有共享flock，直到释放或对象被回收（进程退出时由系统释放）
+
+    多个应用进程共用索引目录时，一个进程发布新索引后清理旧文件，
+    其他进程仍在使用（或清单中仍指向）的内容存储、索引代目录和分片目录由租约保护。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_SH)
+
+    def release(self):
+        """释放租约（可重复调用）"""
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def __del__(self):
+        if getattr(self, 'fd', None) is not None:
+            self.release()
+
+
+class ExclusiveLease(FileLease):
+    """
+    排他租约：非阻塞地在租约文件（不存在时创建）上取得排他flock，其他进程持有时抛出 BlockingIOError
+
+    多个应用进程共用数据库时，只应由一个进程执行的维护任务（如压缩迁移、VACUUM）据此互斥。
+    没有flock的平台（Windows）上不做跨进程互斥。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.release()
+                raise
+
+
+def remove_unleased(path: str, lease_path: str) -> bool:
+    """
+    没有读者持有 lease_path 的租约时删除 path（文件或目录），返回是否已删除
+
+    删除期间持有排他锁，同时打开的读者等待删除完成后仍可读取已打开的文件。
+    租约文件不存在（如旧版本写入的目录）时直接删除。
+    """
+    try:
+        fd = os.open(lease_path, os.O_RDONLY)
+    except FileNotFoundError:
+        fd = None
+    except OSError as e:
+        logger.warning(f"打开租约文件失败: {e}")
+        return False
+
+    try:
+        if fd is not None and fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        return True
+
+    except FileNotFoundError:
+        # 其他进程已经删除
+        return True
+
+    except OSError as e:
+        logger.warning(f"删除旧索引文件失败: {e}")
+        return False
+
+    finally:
+        if fd is not None:
+            os.close(fd)
@@ -0,0 +1,27 @@
+"""
+全文索引分词
+jieba segmentation for the SQLite FTS5 document index
+"""
+
+import re
+
+import jieba
+
+
+def segment_for_fts(text: str) -> str:
+    """用jieba搜索模式分词，以空格连接后写入FTS5（unicode61分词器按空格和标点切分）"""
+    if not text:
+        return ""
+    return " ".join(word for word in jieba.cut_for_search(text.lower()) if word.strip())
+
+
+def build_fts_query(query: str) -> str:
+    """把查询分词后构造FTS5 MATCH表达式，各词加引号转义后以OR连接"""
+    terms = []
+    for word in jieba.cut_for_search(query.lower()):
+        word = word.strip()
+        if word and re.search(r'\w', word):
+            term = '"' + word.replace('"', '""') + '"'
+            if term not in terms:
+                terms.append(term)
+    return " OR ".join(terms)
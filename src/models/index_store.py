@@ -0,0 +1,160 @@
+"""
+知识库索引持久化存储
+Persistent on-disk storage for the knowledge search index
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+import logging
+
+from models.file_leases import FileLease, remove_unleased
+
+logger = logging.getLogger(__name__)
+
+# 索引文件格式版本，格式变化时递增，旧版本索引将被忽略并重建
+INDEX_FORMAT_VERSION = 4
+
+
+class IndexStore:
+    """
+    索引存储
+
+    每次保存写入一个新的代目录（gen-<时间戳>），其中包含搜索引擎导出的
+    numpy 数组（.npy）和 JSON 元数据；写完后原子替换 manifest.json 指向新目录。
+    加载时数组以 numpy.memmap 方式打开，启动时无需重新解析和训练。
+
+    进程在最近加载或保存的代目录上持有读租约（代目录中的 metadata.json），
+    多个进程共用索引目录时，清理旧代目录不会删除其他进程正在使用的代。
+    """
+
+    MANIFEST_FILE = 'manifest.json'
+    METADATA_FILE = 'metadata.json'
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.save_lock = threading.Lock()
+        self.lease = None
+
+    def _hold_generation(self, gen_dir: str):
+        """把读租约切换到指定代目录"""
+        lease = FileLease(os.path.join(gen_dir, self.METADATA_FILE))
+        previous, self.lease = self.lease, lease
+        if previous is not None:
+            previous.release()
+
+    def _ensure_index_directory(self):
+        """确保索引目录存在"""
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir)
+
+    def read_manifest(self) -> Optional[Dict]:
+        """读取当前索引清单"""
+        manifest_path = os.path.join(self.index_dir, self.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取索引清单失败: {e}")
+            return None
+
+    def save(self, arrays: Dict[str, np.ndarray], metadata: Dict, fingerprint: str) -> bool:
+        """
+        保存索引
+
+        Args:
+            arrays: 数组名到numpy数组的映射
+            metadata: 可JSON序列化的元数据（词表、文档信息等）
+            fingerprint: 语料指纹，加载时用于判断索引是否过期
+
+        Returns:
+            是否保存成功
+        """
+        with self.save_lock:
+            generation = f"gen-{time.time_ns()}"
+            gen_dir = os.path.join(self.index_dir, generation)
+
+            try:
+                self._ensure_index_directory()
+                os.makedirs(gen_dir)
+
+                # 元数据先写入并取得租约，其他进程清理时不会删除写了一半的代目录
+                with open(os.path.join(gen_dir, self.METADATA_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, ensure_ascii=False)
+                self._hold_generation(gen_dir)
+
+                for name, array in arrays.items():
+                    np.save(os.path.join(gen_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+                manifest = {
+                    'format_version': INDEX_FORMAT_VERSION,
+                    'generation': generation,
+                    'fingerprint': fingerprint,
+                    'arrays': sorted(arrays.keys()),
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+                }
+
+                # 先写临时文件（按进程区分）再原子替换，读者不会看到写了一半的清单
+                manifest_tmp = os.path.join(self.index_dir, f"{self.MANIFEST_FILE}.{os.getpid()}.tmp")
+                with open(manifest_tmp, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+                os.replace(manifest_tmp, os.path.join(self.index_dir, self.MANIFEST_FILE))
+
+                self._remove_stale_generations(generation)
+                logger.info(f"索引已持久化: {generation}")
+                return True
+
+            except Exception as e:
+                logger.error(f"索引持久化失败: {e}")
+                shutil.rmtree(gen_dir, ignore_errors=True)
+                return False
+
+    def load(self, fingerprint: str) -> Optional[Tuple[Dict[str, np.ndarray], Dict]]:
+        """
+        加载与指纹匹配的索引
+
+        Returns:
+            (数组映射, 元数据)，索引不存在、版本不符或指纹不匹配时返回None
+        """
+        manifest = self.read_manifest()
+        if not manifest:
+            return None
+
+        if manifest.get('format_version') != INDEX_FORMAT_VERSION:
+            logger.info("索引格式版本不匹配，需要重建")
+            return None
+
+        if manifest.get('fingerprint') != fingerprint:
+            logger.info("语料指纹已变化，需要重建索引")
+            return None
+
+        gen_dir = os.path.join(self.index_dir, manifest['generation'])
+        try:
+            # 先取得租约再打开数组，其他进程此后不会删除该代目录
+            self._hold_generation(gen_dir)
+            arrays = {
+                name: np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode='r')
+                for name in manifest['arrays']
+            }
+            with open(os.path.join(gen_dir, self.METADATA_FILE), 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+            return arrays, metadata
+
+        except Exception as e:
+            logger.error(f"加载持久化索引失败: {e}")
+            return None
+
+    def _remove_stale_generations(self, current_generation: str):
+        """删除没有进程持有租约的旧代目录（仍被其他进程使用的代留到下次保存时清理）"""
+        for name in os.listdir(self.index_dir):
+            if name.startswith('gen-') and name != current_generation:
+                gen_dir = os.path.join(self.index_dir, name)
+                remove_unleased(gen_dir, os.path.join(gen_dir, self.METADATA_FILE))
@@ -0,0 +1,200 @@
+"""
+索引构建工作进程
+Index build worker processes started through their own entry point (python -m models.index_workers)
+"""
+
+import os
+import sys
+import time
+import queue
+import pickle
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 关闭工作进程时等待其退出的秒数，超时后强制结束
+SHUTDOWN_TIMEOUT = 10
+
+
+class WorkerTimeout(RuntimeError):
+    """工作进程在限定时间内没有返回结果"""
+
+
+class WorkerProcess:
+    """
+    以 python -m models.index_workers 启动的单个工作进程
+
+    后台线程持续读取工作进程的结果放入队列，取结果时可以设置超时
+    （管道读取本身不支持超时，Windows上也不能对管道使用select）。
+    new_session 为真时工作进程在新的会话和进程组中运行（POSIX），可以连同其子进程一起结束。
+    """
+
+    def __init__(self, initializer: Callable = None, initargs: tuple = (), new_session: bool = False):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        self.process = subprocess.Popen([sys.executable, '-m', __name__], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, env=env, start_new_session=new_session)
+        self.results = queue.Queue()
+        threading.Thread(target=self._read_results, daemon=True).start()
+        try:
+            self._send((initializer, initargs))
+        except Exception:
+            self.close(kill=True)
+            raise
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def _send(self, message):
+        pickle.dump(message, self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+        self.process.stdin.flush()
+
+    def _read_results(self):
+        """读取线程：结果依次放入队列，工作进程退出（输出结束）后放入 None"""
+        try:
+            while True:
+                self.results.put(pickle.load(self.process.stdout))
+        except Exception:
+            self.results.put(None)
+
+    def submit(self, func: Callable, chunk: List):
+        """提交一个分块，工作进程对其中每一项执行 func(item)"""
+        self._send((func, chunk))
+
+    def result(self, timeout: Optional[float] = None) -> List:
+        """
+        取回最早提交的分块的结果
+
+        超过 timeout 秒没有结果时抛出 WorkerTimeout（工作进程继续运行，由调用方决定是否结束）；
+        工作进程异常退出或工作函数出错时抛出 RuntimeError。
+        """
+        try:
+            message = self.results.get(timeout=timeout)
+        except queue.Empty:
+            raise WorkerTimeout(f"工作进程 {self.pid} 在 {timeout:.0f} 秒内没有返回结果")
+        if message is None:
+            raise RuntimeError(f"工作进程异常退出（退出码 {self.process.wait()}）")
+        status, value = message
+        if status != 'ok':
+            raise RuntimeError(value)
+        return value
+
+    def close(self, kill: bool = False):
+        """关闭工作进程：正常关闭时工作进程读到输入结束后退出，kill 时直接结束"""
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.process.stdin.close()
+        except OSError:
+            pass
+
+        try:
+            self.process.wait(SHUTDOWN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class IndexWorkerPool:
+    """
+    索引构建工作进程池
+
+    工作进程是以 python -m models.index_workers 启动的新解释器，只导入工作函数所在的模块：
+    不从父进程fork（父进程中入库、压缩迁移等线程持有的锁不会被带入子进程），也不重新执行启动脚本。
+    任务和结果通过标准输入输出以pickle传递，每个工作进程同时只处理一个分块，结果按提交顺序取回。
+    """
+
+    def __init__(self, workers: int, initializer: Callable = None, initargs: tuple = ()):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.workers = []
+        try:
+            for _ in range(workers):
+                self.workers.append(WorkerProcess(initializer, initargs))
+        except Exception:
+            self.shutdown(kill=True)
+            raise
+
+    def map(self, func: Callable, items: List, chunksize: int = 1, timeout: float = None) -> List:
+        """按分块分发 func(item)，返回与输入顺序一致的结果列表（见 imap）"""
+        return [result for results in self.imap(func, items, chunksize, timeout) for result in results]
+
+    def imap(self, func: Callable, items: List, chunksize: int = 1, timeout: float = None) -> Iterator[List]:
+        """
+        按分块分发 func(item)，按输入顺序逐块产出结果列表；任何分块失败时抛出 RuntimeError
+
+        每个工作进程同时只处理一个分块，在途结果最多为工作进程数个分块。提前结束迭代时
+        工作进程中可能还有未取回的结果，之后只能关闭进程池。
+        timeout 为每个分块从提交到返回结果的时间上限（秒）：超时的工作进程被结束并由新进程替换，
+        该分块改为在本进程中串行执行，一个挂起的文件不会让整个构建一直等待。
+        """
+        chunksize = max(1, chunksize)
+        chunks = (items[start:start + chunksize] for start in range(0, len(items), chunksize))
+        pending = deque()
+
+        def submit(index: int):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                self.workers[index].submit(func, chunk)
+                pending.append((index, chunk, time.monotonic() + timeout if timeout else None))
+
+        for index in range(len(self.workers)):
+            submit(index)
+
+        while pending:
+            index, chunk, deadline = pending.popleft()
+            try:
+                results = self.workers[index].result(
+                    None if deadline is None else max(0.0, deadline - time.monotonic())
+                )
+            except WorkerTimeout as e:
+                logger.warning(f"{e}，结束该进程并在本进程中串行处理该分块（{len(chunk)} 项）")
+                self.workers[index].close(kill=True)
+                self.workers[index] = WorkerProcess(self.initializer, self.initargs)
+                results = [func(item) for item in chunk]
+            submit(index)
+            yield results
+
+    def shutdown(self, kill: bool = False):
+        """关闭所有工作进程"""
+        for worker in self.workers:
+            worker.close(kill=kill)
+        self.workers = []
+
+
+def worker_main():
+    """工作进程主循环：先执行初始化函数，之后逐个处理分块直到输入结束"""
+    channel_in = sys.stdin.buffer
+    # 结果使用原标准输出，工作函数中的 print 输出改到标准错误
+    channel_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    initializer, initargs = pickle.load(channel_in)
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            func, chunk = pickle.load(channel_in)
+        except EOFError:
+            return
+        try:
+            result = ('ok', [func(item) for item in chunk])
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+        pickle.dump(result, channel_out, protocol=pickle.HIGHEST_PROTOCOL)
+        channel_out.flush()
+
+
+if __name__ == '__main__':
+    worker_main()
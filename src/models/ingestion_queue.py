@@ -0,0 +1,356 @@
+"""
+文档导入任务队列
+Background ingestion job queue for uploaded documents
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import threading
+import logging
+from typing import Dict, List, Optional
+
+from config.knowledge_config import knowledge_config
+from models.database import document_manager
+from models.bulk_import import BulkImporter, check_import_source
+from models.upload_stream import StagedUpload, stream_to_file
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# 任务类型：单个文件上传、批量导入（压缩包或服务器目录）
+JOB_TYPE_DOCUMENT = 'document'
+JOB_TYPE_BULK_IMPORT = 'bulk_import'
+
+JOB_FIELDS = ('id', 'job_type', 'filename', 'file_size', 'mime_type', 'category', 'title', 'status', 'stage',
+              'progress', 'document_id', 'result', 'error', 'created_at', 'started_at', 'finished_at')
+
+
+class IngestionQueue:
+    """
+    文档导入任务队列
+
+    上传请求只把文件写入暂存目录并登记任务，由后台工作线程完成文本提取、近似重复检测、
+    入库以及知识库索引更新（关键词和摘要在索引监听器中计算），请求耗时与文档复杂度无关。
+    任务状态保存在 ingestion_jobs 表中，多个进程共用数据库时任务由领取它的进程（owner）处理；
+    服务启动时调用 recover_jobs 重新排队中断的任务。
+    """
+
+    def __init__(self, document_manager, workers: int = None):
+        self.document_manager = document_manager
+        self.db = document_manager.db
+        self.staging_dir = os.path.join(document_manager.upload_dir, '.staging')
+        self.worker_count = max(1, workers or knowledge_config['ingestion_workers'])
+        self.jobs = queue.Queue()
+        self.workers = []
+        self.heartbeat_thread = None
+        self.lock = threading.Lock()
+        # 本队列实例的标识，记录在领取的任务上
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def staged_path_for(self, job_id: str) -> str:
+        """任务暂存文件路径（与上传目录在同一文件系统，可原子移动）"""
+        return os.path.join(self.staging_dir, f"{job_id}.part")
+
+    def submit_stream(self, stream, filename: str, user_id: int, category: str = 'general',
+                      title: str = None, description: str = None) -> Optional[str]:
+        """
+        把上传流分块写入暂存文件并提交导入任务，返回任务ID
+
+        文件不符合要求时抛出 UploadRejected；写入或登记失败时返回None。
+        """
+        job_id = uuid.uuid4().hex
+        staged = stream_to_file(stream, self.staged_path_for(job_id), filename)
+        return self.submit_staged(job_id, staged, filename, user_id, category, title, description)
+
+    def submit_staged(self, job_id: str, staged: StagedUpload, filename: str, user_id: int,
+                      category: str = 'general', title: str = None, description: str = None,
+                      job_type: str = JOB_TYPE_DOCUMENT) -> Optional[str]:
+        """登记已写入暂存文件的导入任务并放入队列"""
+        conn = self.db.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO ingestion_jobs (
+                    id, job_type, filename, staged_path, file_size, content_hash, mime_type,
+                    category, title, description, uploaded_by, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                job_id, job_type, filename, staged.path, staged.size, staged.sha256, staged.mime_type,
+                category, title, description, user_id, STATUS_QUEUED
+            ))
+            conn.commit()
+
+        except Exception as e:
+            logger.error(f"创建导入任务失败: {e}")
+            if os.path.isfile(staged.path):
+                os.remove(staged.path)
+            return None
+        finally:
+            conn.close()
+
+        self.jobs.put(job_id)
+        self.ensure_workers()
+        logger.info(f"导入任务已提交: {job_id} ({filename})")
+        return job_id
+
+    def submit_bulk_stream(self, stream, filename: str, user_id: int, category: str = 'general') -> Optional[str]:
+        """
+        把上传的zip/tar压缩包分块写入暂存文件并提交批量导入任务，返回任务ID
+
+        压缩包超过 bulk_import_max_archive_mb 或不是zip/tar格式时抛出 UploadRejected。
+        """
+        job_id = uuid.uuid4().hex
+        staged = stream_to_file(stream, self.staged_path_for(job_id), filename,
+                                max_size=knowledge_config['bulk_import_max_archive_mb'] * 1024 * 1024)
+        try:
+            check_import_source(staged.path)
+        except Exception:
+            os.remove(staged.path)
+            raise
+        return self.submit_staged(job_id, staged, filename, user_id, category, job_type=JOB_TYPE_BULK_IMPORT)
+
+    def submit_bulk_directory(self, directory: str, user_id: int, category: str = 'general') -> Optional[str]:
+        """提交服务器目录的批量导入任务（目录中的文件不会被移动或删除），返回任务ID"""
+        check_import_source(directory)
+        staged = StagedUpload(os.path.abspath(directory), None, None, None)
+        return self.submit_staged(uuid.uuid4().hex, staged, os.path.basename(staged.path), user_id, category,
+                                  job_type=JOB_TYPE_BULK_IMPORT)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """获取任务状态"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute(f'SELECT {", ".join(JOB_FIELDS)} FROM ingestion_jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            return self._job_from_row(row) if row else None
+
+        except Exception as e:
+            logger.error(f"获取导入任务失败: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def list_jobs(self, limit: int = 20, status: str = None) -> List[Dict]:
+        """最近的导入任务（按提交时间倒序）"""
+        conn = self.db.get_connection()
+        try:
+            sql = f'SELECT {", ".join(JOB_FIELDS)} FROM ingestion_jobs'
+            params = []
+            if status:
+                sql += ' WHERE status = ?'
+                params.append(status)
+            sql += ' ORDER BY created_at DESC, rowid DESC LIMIT ?'
+            params.append(limit)
+            return [self._job_from_row(row) for row in conn.execute(sql, params).fetchall()]
+
+        except Exception as e:
+            logger.error(f"获取导入任务列表失败: {e}")
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _job_from_row(row) -> Dict:
+        """任务记录转为字典（批量导入结果汇总从JSON解析）"""
+        job = dict(row)
+        if job.get('result'):
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def ensure_workers(self):
+        """按需启动工作线程和心跳线程（导入模块时不启动线程）"""
+        with self.lock:
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            while len(self.workers) < self.worker_count:
+                worker = threading.Thread(
+                    target=self._worker, name=f'document-ingestion-{len(self.workers)}', daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+            
+            if self.heartbeat_thread is None:
+                self.heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, name='document-ingestion-heartbeat', daemon=True
+                )
+                self.heartbeat_thread.start()
+
+    def wait_until_idle(self):
+        """等待队列中所有任务处理完成（用于脚本和测试）"""
+        self.jobs.join()
+
+    def recover_jobs(self):
+        """
+        恢复中断的任务（由服务启动流程调用，导入模块时不执行）
+
+        排队中的任务，以及心跳超过 ingestion_stale_seconds 秒未更新的处理中任务（所属进程已退出）：
+        暂存文件仍在的重新排队，否则标记失败。其他进程正在处理的任务不受影响；
+        同一任务同时在多个进程中排队时只有一个进程能领取（见 claim_job）。
+        """
+        # 心跳过期的处理中任务
+        stale_condition = "status = ? AND (heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))"
+        stale_params = [STATUS_PROCESSING, f"-{int(knowledge_config['ingestion_stale_seconds'])} seconds"]
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute(f'''
+                SELECT id, staged_path, status FROM ingestion_jobs
+                WHERE status = ? OR ({stale_condition}) ORDER BY created_at
+            ''', [STATUS_QUEUED] + stale_params)
+
+            requeued = []
+            for row in cursor.fetchall():
+                # 只改写读取后仍处于同一状态的任务（期间可能已被其他进程领取或更新心跳）
+                if row['status'] == STATUS_QUEUED:
+                    condition, params = "status = ?", [STATUS_QUEUED]
+                else:
+                    condition, params = stale_condition, stale_params
+
+                if row['staged_path'] and os.path.exists(row['staged_path']):
+                    updated = conn.execute(f'''
+                        UPDATE ingestion_jobs SET status = ?, stage = NULL, progress = 0, owner = NULL
+                        WHERE id = ? AND {condition}
+                    ''', [STATUS_QUEUED, row['id']] + params)
+                    if updated.rowcount:
+                        requeued.append(row['id'])
+                else:
+                    conn.execute(f'''
+                        UPDATE ingestion_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                        WHERE id = ? AND {condition}
+                    ''', [STATUS_FAILED, '服务重启，任务中断', row['id']] + params)
+            conn.commit()
+
+        except Exception as e:
+            logger.error(f"恢复导入任务失败: {e}")
+            requeued = []
+        finally:
+            conn.close()
+
+        if requeued:
+            logger.info(f"重新排队未完成的导入任务: {len(requeued)} 个")
+            for job_id in requeued:
+                self.jobs.put(job_id)
+            self.ensure_workers()
+
+    def claim_job(self, job_id: str) -> bool:
+        """把排队中的任务原子地标记为由本队列处理，任务已被其他工作线程或进程领取时返回False"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE ingestion_jobs SET status = ?, stage = ?, progress = ?, owner = ?,
+                       heartbeat_at = CURRENT_TIMESTAMP, started_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = ?
+            ''', (STATUS_PROCESSING, 'started', 5, self.owner, job_id, STATUS_QUEUED))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def _heartbeat(self):
+        """心跳线程：定期更新本队列正在处理的任务的心跳"""
+        while True:
+            time.sleep(knowledge_config['ingestion_heartbeat_interval'])
+            conn = self.db.get_connection()
+            try:
+                conn.execute('''
+                    UPDATE ingestion_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE owner = ? AND status = ?
+                ''', (self.owner, STATUS_PROCESSING))
+                conn.commit()
+
+            except Exception as e:
+                logger.error(f"更新导入任务心跳失败: {e}")
+            finally:
+                conn.close()
+
+    def _update_job(self, job_id: str, finished: bool = False, **fields):
+        """更新任务字段（同时更新心跳）"""
+        assignments = [f"{name} = ?" for name in fields] + ['heartbeat_at = CURRENT_TIMESTAMP']
+        if finished:
+            assignments.append('finished_at = CURRENT_TIMESTAMP')
+        conn = self.db.get_connection()
+        try:
+            conn.execute(f'UPDATE ingestion_jobs SET {", ".join(assignments)} WHERE id = ?',
+                         list(fields.values()) + [job_id])
+            conn.commit()
+
+        except Exception as e:
+            logger.error(f"更新导入任务失败: {e}")
+        finally:
+            conn.close()
+
+    def _worker(self):
+        """工作线程：逐个处理队列中的任务"""
+        while True:
+            job_id = self.jobs.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logger.error(f"导入任务 {job_id} 失败: {e}")
+                self._update_job(job_id, finished=True, status=STATUS_FAILED, error=str(e))
+            finally:
+                self.jobs.task_done()
+
+    def _process(self, job_id: str):
+        """处理单个导入任务（先领取，已被领取的任务跳过）"""
+        if not self.claim_job(job_id):
+            return
+
+        conn = self.db.get_connection()
+        try:
+            job = conn.execute('''
+                SELECT job_type, filename, staged_path, content_hash, mime_type, category, title, description,
+                       uploaded_by
+                FROM ingestion_jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        if job['job_type'] == JOB_TYPE_BULK_IMPORT:
+            self._process_bulk_import(job_id, job)
+            return
+
+        document_id = self.document_manager.save_document_file(
+            job['staged_path'], job['filename'], job['uploaded_by'],
+            category=job['category'] or 'general', title=job['title'], description=job['description'],
+            progress=lambda stage, percent: self._update_job(job_id, stage=stage, progress=percent),
+            content_hash=job['content_hash'], mime_type=job['mime_type']
+        )
+
+        # 提取超时或超出内存上限时文档已保存（标记为 extraction_failed），任务记为失败
+        extraction_error = self.document_manager.get_extraction_error(document_id)
+        if extraction_error:
+            self._update_job(job_id, finished=True, status=STATUS_FAILED, stage='extraction_failed',
+                             progress=100, document_id=document_id, staged_path=None, error=extraction_error)
+            logger.warning(f"导入任务文本提取失败: {job_id} -> 文档 {document_id}: {extraction_error}")
+            return
+
+        self._update_job(job_id, finished=True, status=STATUS_COMPLETED, stage='done', progress=100,
+                         document_id=document_id, staged_path=None)
+        logger.info(f"导入任务完成: {job_id} -> 文档 {document_id}")
+
+    def _process_bulk_import(self, job_id: str, job):
+        """处理批量导入任务，导入结果汇总写入任务的 result 字段；上传的压缩包处理完后删除"""
+        source = job['staged_path']
+        importer = BulkImporter(
+            self.document_manager, job['uploaded_by'], job['category'] or 'general',
+            progress=lambda stage, percent: self._update_job(job_id, stage=stage, progress=percent)
+        )
+        try:
+            summary = importer.run(source)
+        finally:
+            if os.path.dirname(source) == self.staging_dir and os.path.exists(source):
+                os.remove(source)
+
+        self._update_job(job_id, finished=True, status=STATUS_COMPLETED, stage='done', progress=100,
+                         result=json.dumps(summary, ensure_ascii=False), staged_path=None)
+        logger.info(f"批量导入任务完成: {job_id}，导入 {summary['imported']} 个文档")
+
+
+# 全局导入任务队列
+ingestion_queue = IngestionQueue(document_manager)
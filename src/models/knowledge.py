@@ -8,10 +8,10 @@ import json
 import hashlib
 from datetime import datetime
 from typing import List, Dict, Optional
-import PyPDF2
-import docx
 from werkzeug.utils import secure_filename
 
+from models.document_text import extract_pdf_text, extract_word_text
+
 class Document:
     """文档模型"""
     
@@ -84,29 +84,12 @@ class KnowledgeBase:
             print(f"保存文档失败: {e}")
     
     def extract_text_from_pdf(self, file_path: str) -> str:
-        """从PDF文件提取文本"""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text.strip()
-        except Exception as e:
-            print(f"PDF文本提取失败: {e}")
-            return ""
+        """从PDF文件提取文本（与上传时的提取共用沙箱和提取缓存）"""
+        return extract_pdf_text(file_path).strip()
     
     def extract_text_from_docx(self, file_path: str) -> str:
-        """从Word文档提取文本"""
-        try:
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
-        except Exception as e:
-            print(f"Word文档文本提取失败: {e}")
-            return ""
+        """从Word文档提取文本（与上传时的提取共用沙箱和提取缓存）"""
+        return extract_word_text(file_path).strip()
     
     def extract_text_from_txt(self, file_path: str) -> str:
         """从文本文件提取内容"""
@@ -270,40 +253,19 @@ class DatabaseKnowledgeBase:
     
     def __init__(self):
         from models.database import document_manager
+        from models.enhanced_knowledge import enhanced_knowledge_base
         self.document_manager = document_manager
+        self.enhanced_knowledge_base = enhanced_knowledge_base
     
     def search_documents(self, query: str, limit: int = 5) -> List[Dict]:
-        """搜索文档"""
-        return self.document_manager.search_documents(query, limit=limit)
+        """搜索文档（与AI问答使用同一混合检索；空查询时按上传时间列出文档）"""
+        if not query:
+            return self.document_manager.search_documents(query, limit=limit)
+        return self.enhanced_knowledge_base.search_documents(query, limit=limit)
     
     def get_relevant_content(self, question: str, max_docs: int = 3) -> str:
         """获取与问题相关的文档内容"""
-        relevant_docs = self.search_documents(question, limit=max_docs)
-        
-        if not relevant_docs:
-            return ""
-        
-        content_parts = []
-        for doc in relevant_docs:
-            # 获取文档内容
-            content = self.document_manager.get_document_content(doc['id'])
-            if content:
-                # 提取相关段落
-                paragraphs = content.split('\n')
-                relevant_paragraphs = []
-                
-                query_words = question.lower().split()
-                for paragraph in paragraphs:
-                    if any(word in paragraph.lower() for word in query_words):
-                        relevant_paragraphs.append(paragraph.strip())
-                
-                if relevant_paragraphs:
-                    content_parts.append(f"【{doc['title']}】\n" + "\n".join(relevant_paragraphs[:3]))
-                else:
-                    # 如果没有找到相关段落，取前几段
-                    content_parts.append(f"【{doc['title']}】\n" + "\n".join(paragraphs[:2]))
-        
-        return "\n\n".join(content_parts)
+        return self.enhanced_knowledge_base.get_relevant_content(question, max_docs=max_docs)
 
 # 全局知识库实例 - 使用数据库版本
 knowledge_base = DatabaseKnowledgeBase()
@@ -785,16 +785,31 @@ class LLMManager:
         self.model_selector = ModelSelector(self)
         logger.info("Model selector initialized for Ruishi Control Platform")
     
+    def resolve_provider(self, query: str, provider: Optional[str] = None,
+                         model: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        确定本次请求使用的提供商和模型
+        
+        指定了提供商时使用该提供商（未指定模型时取其默认模型）；否则由模型选择器按问题自动选择
+        （同时选择模型），没有模型选择器时使用默认提供商。
+        """
+        if not provider and self.model_selector:
+            provider, model = self.model_selector.select_model(query, None)
+            logger.info(f"Auto-selected provider: {provider}, model: {model}")
+            return provider, model
+        
+        provider = provider or self.default_provider
+        if not model and provider in self.providers:
+            model = self.providers[provider].default_model
+        return provider, model
+    
     async def generate_response(self, prompt: str, provider: Optional[str] = None, **kwargs) -> Dict[str, Any]:
         """Generate a response using the specified or auto-selected provider"""
-        # 使用模型选择器（如果可用且未指定特定提供商）
-        if self.model_selector and not provider:
-            selected_provider, selected_model = self.model_selector.select_model(prompt, None)
-            provider = selected_provider
-            kwargs['model'] = selected_model
-            logger.info(f"Auto-selected provider: {selected_provider}, model: {selected_model}")
-        else:
-            provider_name = provider or self.default_provider
+        # 未指定提供商时由模型选择器按提示词选择（调用方可先用 resolve_provider 按原始问题选择）
+        if not provider:
+            provider, selected_model = self.resolve_provider(prompt)
+            if self.model_selector:
+                kwargs['model'] = selected_model
             
         if provider not in self.providers:
             logger.error(f"Provider '{provider}' not found")
@@ -887,6 +902,10 @@ class SimpleModelSelector:
         
         return await llm_manager.generate_response(question, provider, **options)
     
+    def resolve_provider(self, question: str, provider: str = None, model: str = None) -> tuple:
+        """确定问题使用的 (提供商, 模型)，未指定提供商时自动选择（见 LLMManager.resolve_provider）"""
+        return llm_manager.resolve_provider(question, provider, model)
+    
     def get_available_providers(self) -> list:
         """获取可用的提供商列表"""
         return llm_manager.get_all_providers()
@@ -0,0 +1,111 @@
+"""
+PDF分页提取流水线
+Page-streaming PDF extraction with a process pool and in-order reassembly
+"""
+
+import os
+import logging
+from typing import Iterator, List, Tuple
+
+from config.knowledge_config import knowledge_config
+from models.index_workers import IndexWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# 支持的解析库：pdfplumber（文本和表格，知识库索引使用）、PyPDF2（纯文本，上传时使用）
+BACKENDS = ('pdfplumber', 'pypdf2')
+
+
+class PdfPage:
+    """单页提取结果：页码（从1开始）、文本和表格（行列表的列表）"""
+
+    __slots__ = ('number', 'text', 'tables')
+
+    def __init__(self, number: int, text: str, tables: List = None):
+        self.number = number
+        self.text = text
+        self.tables = tables or []
+
+
+def count_pages(file_path: str, backend: str = 'pdfplumber') -> int:
+    """PDF页数"""
+    if backend == 'pdfplumber':
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+
+    import PyPDF2
+    with open(file_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def _iter_page_range(file_path: str, backend: str, start: int, stop: int,
+                     with_tables: bool) -> Iterator[PdfPage]:
+    """逐页提取 [start, stop) 范围内的页面（页面解析完即释放其对象缓存）"""
+    if backend == 'pdfplumber':
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            for number in range(start, stop):
+                page = pdf.pages[number]
+                try:
+                    yield PdfPage(number + 1, page.extract_text() or "",
+                                  page.extract_tables() if with_tables else [])
+                finally:
+                    page.close()
+        return
+
+    import PyPDF2
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        for number in range(start, stop):
+            yield PdfPage(number + 1, reader.pages[number].extract_text() or "")
+
+
+def _extract_page_range(task: Tuple[str, str, int, int, bool]) -> List[PdfPage]:
+    """进程池的工作函数：提取一段连续页面，task 为 (文件路径, 解析库, 起始页, 结束页, 是否提取表格)"""
+    return list(_iter_page_range(*task))
+
+
+def _create_pool(page_count: int, workers: int):
+    """
+    页数足够多时创建进程池，否则返回None（串行提取）
+
+    工作进程以独立入口启动（见 IndexWorkerPool），不从调用进程fork。索引构建的工作进程把 pdf_workers
+    设为1，不会嵌套创建进程池；在提取沙箱中创建的工作进程属于沙箱的进程组，沙箱超限时一起结束。
+    """
+    if workers <= 1 or page_count < knowledge_config['pdf_parallel_min_pages']:
+        return None
+
+    try:
+        return IndexWorkerPool(workers)
+    except Exception as e:
+        logger.error(f"创建PDF提取进程池失败，改为串行提取: {e}")
+        return None
+
+
+def iter_pdf_pages(file_path: str, backend: str = 'pdfplumber', with_tables: bool = False) -> Iterator[PdfPage]:
+    """
+    按页码顺序逐页产出PDF提取结果
+
+    长文档按 pdf_pages_per_task 页一段分发到进程池，按顺序取回；每个工作进程同时只处理一段，
+    内存中只保留少量页面的结果，调用方可以边取边处理。短文档在当前进程中串行提取。
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的PDF解析库: {backend}")
+
+    page_count = count_pages(file_path, backend)
+    workers = knowledge_config['pdf_workers'] or os.cpu_count() or 1
+    pool = _create_pool(page_count, workers)
+    if pool is None:
+        yield from _iter_page_range(file_path, backend, 0, page_count, with_tables)
+        return
+
+    pages_per_task = max(1, knowledge_config['pdf_pages_per_task'])
+    tasks = [(file_path, backend, start, min(start + pages_per_task, page_count), with_tables)
+             for start in range(0, page_count, pages_per_task)]
+    try:
+        for pages in pool.imap(_extract_page_range, tasks):
+            yield from pages[0]
+    finally:
+        # 调用方提前停止时工作进程中可能还有未取回的页面，直接结束
+        pool.shutdown(kill=True)
@@ -0,0 +1,86 @@
+"""
+检索结果缓存
+LRU cache for knowledge retrieval results
+"""
+
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询文本：全角转半角（NFKC）、统一小写、合并空白
+
+    例如 "ＰＸＩｅ－5110  采样率" 与 "pxie-5110 采样率" 规范化后相同。
+    """
+    if not query:
+        return ""
+    return " ".join(unicodedata.normalize('NFKC', query).lower().split())
+
+
+class RetrievalCache:
+    """
+    检索结果LRU缓存
+
+    键中应包含索引代数（每次索引变化时递增），索引更新后旧结果自然失效，
+    无需主动清理；旧条目会随LRU淘汰。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        读取缓存
+
+        Returns:
+            (是否命中, 缓存值)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.time() - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if self.max_entries <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_statistics(self) -> dict:
+        """获取缓存统计"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
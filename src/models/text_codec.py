@@ -0,0 +1,81 @@
+"""
+大文本列透明压缩
+Transparent compression for large TEXT columns with a per-row codec marker
+"""
+
+import zlib
+import logging
+from typing import Optional, Union
+
+from config.knowledge_config import knowledge_config
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 压缩后的值以BLOB存储：标记头 + 编码器ID（1字节）+ 压缩数据；
+# 短文本、压缩收益不足的文本和压缩功能启用前的旧数据仍以TEXT存储，读取时原样返回
+MAGIC = b'\x00RC'
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+HEADER_SIZE = len(MAGIC) + 1
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# 压缩后至少比原文小这个比例才以压缩形式存储
+MIN_SAVING_RATIO = 0.1
+
+if knowledge_config['text_compression_codec'] == 'zstd' and zstandard is None:
+    logger.warning("配置使用zstd压缩，但未安装zstandard，改用zlib")
+
+
+def compress_text(text: Optional[str]) -> Union[str, bytes, None]:
+    """
+    按配置压缩写入数据库的文本
+
+    压缩关闭、文本短于 text_compression_min_bytes 或压缩收益不足时原样返回字符串。
+    """
+    if text is None or not knowledge_config['text_compression']:
+        return text
+
+    data = text.encode('utf-8')
+    if len(data) < knowledge_config['text_compression_min_bytes']:
+        return text
+
+    if knowledge_config['text_compression_codec'] == 'zstd' and zstandard is not None:
+        packed = MAGIC + CODEC_ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        packed = MAGIC + CODEC_ZLIB + zlib.compress(data, ZLIB_LEVEL)
+
+    if len(packed) > len(data) * (1 - MIN_SAVING_RATIO):
+        return text
+    return packed
+
+
+def decompress_text(value) -> Optional[str]:
+    """读取可能被压缩的列值：带标记头的BLOB按其编码器解压，TEXT原样返回"""
+    if value is None or isinstance(value, str):
+        return value
+
+    value = bytes(value)
+    if not value.startswith(MAGIC):
+        return value.decode('utf-8')
+
+    codec = value[len(MAGIC):HEADER_SIZE]
+    payload = value[HEADER_SIZE:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("数据使用zstd压缩，但未安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    raise ValueError(f"未知的文本压缩编码: {codec!r}")
+
+
+def is_compressed(value) -> bool:
+    """列值是否为压缩格式"""
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:len(MAGIC)]) == MAGIC
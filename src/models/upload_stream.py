@@ -0,0 +1,117 @@
+"""
+上传文件流式写入
+Stream uploads to disk in fixed-size chunks with incremental hashing and MIME sniffing
+"""
+
+import os
+import hashlib
+import mimetypes
+from typing import Optional
+
+# 每次从请求流读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 上传文件大小上限（与 MAX_CONTENT_LENGTH 一致）
+MAX_UPLOAD_SIZE = 16 * 1024 * 1024
+
+# 判断文件类型时读取的文件头长度
+SNIFF_SIZE = 8192
+
+# Office文件的文件头魔数：2007及以后为ZIP容器，97-2003为OLE复合文档
+ZIP_MAGIC = b'PK\x03\x04'
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+OOXML_EXTENSIONS = {'.docx', '.xlsx', '.pptx'}
+OLE_EXTENSIONS = {'.doc', '.xls', '.ppt'}
+TEXT_EXTENSIONS = {'.txt', '.md'}
+
+# 允许上传和批量导入的文件类型
+ALLOWED_EXTENSIONS = {'.pdf', '.doc', '.docx', '.txt', '.md', '.ppt', '.pptx', '.xls', '.xlsx'}
+
+
+class UploadRejected(ValueError):
+    """上传文件不符合要求（超出大小限制、内容与扩展名不符等），消息可直接返回给用户"""
+
+
+class StagedUpload:
+    """已写入暂存文件的上传：路径、大小、SHA-256和嗅探到的MIME类型"""
+
+    __slots__ = ('path', 'size', 'sha256', 'mime_type')
+
+    def __init__(self, path: str, size: int, sha256: str, mime_type: Optional[str]):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+
+def sniff_mime_type(head: bytes, filename: str) -> Optional[str]:
+    """
+    根据文件头判断MIME类型
+
+    二进制格式（PDF、Office）的文件头必须与扩展名一致，否则抛出 UploadRejected；
+    文本文件不检查编码，按扩展名返回类型。
+    """
+    file_ext = os.path.splitext(filename)[1].lower()
+    guessed, _ = mimetypes.guess_type(filename)
+
+    if file_ext == '.pdf':
+        # PDF规范允许 %PDF 前有少量字节
+        if b'%PDF-' not in head[:1024]:
+            raise UploadRejected('文件内容不是有效的PDF')
+        return 'application/pdf'
+    if file_ext in OOXML_EXTENSIONS:
+        if not head.startswith(ZIP_MAGIC):
+            raise UploadRejected(f'文件内容与扩展名不符: {file_ext}')
+        return guessed
+    if file_ext in OLE_EXTENSIONS:
+        if not head.startswith(OLE_MAGIC):
+            raise UploadRejected(f'文件内容与扩展名不符: {file_ext}')
+        return guessed
+    if file_ext in TEXT_EXTENSIONS:
+        return guessed or 'text/plain'
+    return guessed
+
+
+def stream_to_file(stream, path: str, filename: str, max_size: int = MAX_UPLOAD_SIZE,
+                   chunk_size: int = UPLOAD_CHUNK_SIZE) -> StagedUpload:
+    """
+    按固定大小的块把上传流写入文件
+
+    边写边计算大小和SHA-256，第一块到达时嗅探文件类型；超出大小限制或类型不符时
+    删除已写入的部分并抛出 UploadRejected。每个上传的内存占用与文件大小无关。
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    head = b''
+    mime_type = None
+
+    try:
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(f'文件大小不能超过{max_size // (1024 * 1024)}MB')
+
+                if len(head) < SNIFF_SIZE:
+                    head += chunk[:SNIFF_SIZE - len(head)]
+                    if len(head) >= SNIFF_SIZE:
+                        mime_type = sniff_mime_type(head, filename)
+
+                sha256.update(chunk)
+                f.write(chunk)
+
+        if size == 0:
+            raise UploadRejected('上传的文件为空')
+        if len(head) < SNIFF_SIZE:
+            mime_type = sniff_mime_type(head, filename)
+
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    return StagedUpload(path, size, sha256.hexdigest(), mime_type)
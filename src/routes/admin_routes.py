@@ -10,6 +10,11 @@ import json
 import logging
 from models.database import user_manager, document_manager, db_manager
 from models.ai_conversation import ai_conversation_manager
+from models.ingestion_queue import ingestion_queue
+from models.upload_stream import ALLOWED_EXTENSIONS, UploadRejected
+from models.bulk_import import is_allowed_directory
+from models.text_codec import decompress_text
+from config.knowledge_config import knowledge_config
 
 logger = logging.getLogger(__name__)
 
@@ -130,7 +135,7 @@ def get_documents():
 @admin_bp.route('/documents/upload', methods=['POST'])
 @require_admin
 def upload_document():
-    """上传文档"""
+    """上传文档（文本提取和索引在后台导入任务中完成，立即返回任务ID）"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': '没有选择文件'}), 400
@@ -144,20 +149,14 @@ def upload_document():
         title = request.form.get('title')
         description = request.form.get('description')
         
-        # 检查文件大小（16MB限制）
-        file_data = file.read()
-        if len(file_data) > 16 * 1024 * 1024:
-            return jsonify({'error': '文件大小不能超过16MB'}), 400
-        
         # 检查文件类型
-        allowed_extensions = {'.pdf', '.doc', '.docx', '.txt', '.md', '.ppt', '.pptx', '.xls', '.xlsx'}
         file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_EXTENSIONS:
             return jsonify({'error': f'不支持的文件类型: {file_ext}'}), 400
         
-        # 保存文档
-        document_id = document_manager.save_document(
-            file_data=file_data,
+        # 分块写入暂存文件（边写边检查16MB限制、计算SHA-256并嗅探文件类型），然后提交导入任务
+        job_id = ingestion_queue.submit_stream(
+            stream=file.stream,
             filename=file.filename,
             user_id=request.current_user['id'],
             category=category,
@@ -165,19 +164,105 @@ def upload_document():
             description=description
         )
         
-        if document_id:
+        if job_id:
             return jsonify({
                 'success': True,
-                'message': '文档上传成功',
-                'document_id': document_id
-            })
+                'message': '文档已上传，正在后台处理',
+                'job_id': job_id
+            }), 202
         else:
             return jsonify({'error': '文档保存失败'}), 500
             
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"文档上传失败: {e}")
         return jsonify({'error': '文档上传失败，请稍后重试'}), 500
 
+@admin_bp.route('/documents/import', methods=['POST'])
+@require_admin
+def bulk_import_documents():
+    """批量导入文档：上传zip/tar压缩包（file字段），或导入服务器上允许的目录（directory字段），立即返回任务ID"""
+    try:
+        # 压缩包不受单个文件16MB的限制，上限由 bulk_import_max_archive_mb 配置
+        request.max_content_length = knowledge_config['bulk_import_max_archive_mb'] * 1024 * 1024
+        
+        if request.is_json:
+            data = request.json or {}
+            category = data.get('category', 'general')
+            directory = data.get('directory')
+        else:
+            category = request.form.get('category', 'general')
+            directory = request.form.get('directory')
+        
+        if directory:
+            if not is_allowed_directory(directory):
+                return jsonify({'error': '该目录不在允许导入的目录范围内'}), 403
+            job_id = ingestion_queue.submit_bulk_directory(directory, request.current_user['id'], category)
+        elif 'file' in request.files and request.files['file'].filename:
+            file = request.files['file']
+            job_id = ingestion_queue.submit_bulk_stream(
+                stream=file.stream,
+                filename=file.filename,
+                user_id=request.current_user['id'],
+                category=category
+            )
+        else:
+            return jsonify({'error': '请上传压缩包或指定导入目录'}), 400
+        
+        if job_id:
+            return jsonify({
+                'success': True,
+                'message': '批量导入已开始，正在后台处理',
+                'job_id': job_id
+            }), 202
+        else:
+            return jsonify({'error': '创建批量导入任务失败'}), 500
+            
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"批量导入失败: {e}")
+        return jsonify({'error': '批量导入失败，请稍后重试'}), 500
+
+@admin_bp.route('/documents/jobs', methods=['GET'])
+@require_admin
+def get_ingestion_jobs():
+    """获取最近的文档导入任务"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        status = request.args.get('status')
+        
+        jobs = ingestion_queue.list_jobs(limit, status)
+        
+        return jsonify({
+            'success': True,
+            'jobs': jobs
+        })
+        
+    except Exception as e:
+        logger.error(f"获取导入任务列表失败: {e}")
+        return jsonify({'error': '获取导入任务列表失败'}), 500
+
+@admin_bp.route('/documents/jobs/<job_id>', methods=['GET'])
+@require_admin
+def get_ingestion_job(job_id):
+    """获取文档导入任务状态（阶段、进度、文档ID或失败原因）"""
+    try:
+        job = ingestion_queue.get_job(job_id)
+        
+        if job:
+            return jsonify({
+                'success': True,
+                'job': job
+            })
+        else:
+            return jsonify({'error': '导入任务不存在'}), 404
+            
+    except Exception as e:
+        logger.error(f"获取导入任务失败: {e}")
+        return jsonify({'error': '获取导入任务失败'}), 500
+
 @admin_bp.route('/documents/<int:document_id>', methods=['DELETE'])
 @require_admin
 def delete_document(document_id):
@@ -197,6 +282,41 @@ def delete_document(document_id):
         logger.error(f"删除文档失败: {e}")
         return jsonify({'error': '删除文档失败'}), 500
 
+@admin_bp.route('/database/vacuum', methods=['POST'])
+@require_admin
+def vacuum_database():
+    """收缩数据库文件（VACUUM，执行期间其他请求不能写入数据库），可指定空闲页占比下限 min_ratio"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = db_manager.reclaim_free_pages(float(data.get('min_ratio', 0)))
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+        
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"收缩数据库失败: {e}")
+        return jsonify({'error': '收缩数据库失败'}), 500
+
+@admin_bp.route('/documents/collect-files', methods=['POST'])
+@require_admin
+def collect_unreferenced_files():
+    """清理不再被有效文档引用的上传文件（已删除文档的原文件不能再下载）"""
+    try:
+        result = document_manager.collect_unreferenced_blobs()
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+        
+    except Exception as e:
+        logger.error(f"清理上传文件失败: {e}")
+        return jsonify({'error': '清理上传文件失败'}), 500
+
 @admin_bp.route('/documents/search', methods=['GET'])
 @require_admin
 def search_documents():
@@ -269,6 +389,9 @@ def get_statistics():
         cursor = conn.execute('SELECT COUNT(*) as total FROM users WHERE is_active = 1')
         stats['total_users'] = cursor.fetchone()['total']
         
+        # 数据库连接池
+        stats['database_pool'] = db_manager.pool_stats()
+        
         # 使用新的AI对话管理器获取统计
         ai_stats = ai_conversation_manager.get_conversation_statistics()
         stats.update(ai_stats)
@@ -503,7 +626,7 @@ def get_detailed_conversations():
             # 获取关联文档的原始文件名
             try:
                 if row['related_documents']:
-                    related_docs = json.loads(row['related_documents'])
+                    related_docs = json.loads(decompress_text(row['related_documents']))
                     if related_docs:
                         # 获取文档的原始文件名
                         doc_ids = [str(doc.get('id')) for doc in related_docs if doc.get('id')]
@@ -11,6 +11,7 @@ from models.llm_models import model_selector
 from models.enhanced_knowledge import enhanced_knowledge_base
 from models.ai_conversation import ai_conversation_manager
 from config.jytek_prompts import build_enhanced_prompt, get_prompt_template
+from models.context_assembler import token_budget_for
 
 # Create blueprint
 llm_bp = Blueprint('llm', __name__, url_prefix='/api/llm')
@@ -46,8 +47,17 @@ def ask_question():
         options = data.get('options', {})
         context_type = data.get('context_type', 'company')  # 新增：上下文类型
         
-        # 获取知识库相关内容
-        relevant_content = enhanced_knowledge_base.get_relevant_content(question, max_docs=3)
+        # 先确定提供商和模型（未指定时按问题自动选择），上下文按其令牌预算组装
+        provider, model = model_selector.resolve_provider(question, provider, model)
+        
+        # 获取知识库相关内容（混合检索，索引首次构建完成前由数据库全文检索或LIKE匹配提供结果），
+        # 按所选提供商/模型的令牌预算组装并去除近似重复的片段
+        knowledge_context = enhanced_knowledge_base.assemble_context(
+            question, max_docs=3, token_budget=token_budget_for(provider, model)
+        )
+        relevant_content = knowledge_context.text
+        # 来源文档即上下文入选片段所属的文档，不再单独检索；知识库来源数和对话记录共用
+        source_docs = knowledge_context.sources
         print(f"DEBUG: 知识库搜索结果长度: {len(relevant_content) if relevant_content else 0}")
         if relevant_content:
             print(f"DEBUG: 知识库内容预览: {relevant_content[:200]}...")
@@ -69,7 +79,7 @@ def ask_question():
         enhanced_question = build_enhanced_prompt(
             question=question,
             context_type=context_type,
-            additional_context=f"相关知识库内容：\n{relevant_content}" if relevant_content else ""
+            knowledge_context=knowledge_context
         )
         
         # 记录开始时间
@@ -89,7 +99,7 @@ def ask_question():
         # 添加知识库信息到响应
         response['has_knowledge_base_content'] = bool(relevant_content)
         if relevant_content:
-            response['knowledge_base_sources'] = len(enhanced_knowledge_base.search_documents(question, limit=3))
+            response['knowledge_base_sources'] = len(source_docs)
         
         # 记录AI对话到数据库
         try:
@@ -110,20 +120,17 @@ def ask_question():
                     user_type = 'registered'
             
             # 获取相关文档列表
-            related_docs = []
-            if relevant_content:
-                docs = enhanced_knowledge_base.search_documents(question, limit=3)
-                related_docs = [
-                    {
-                        'id': doc.get('id'),
-                        'filename': doc.get('original_filename', ''),
-                        'title': doc.get('title', ''),
-                        'category': doc.get('category', ''),
-                        'file_type': doc.get('file_type', ''),
-                        'relevance_score': doc.get('relevance_score', 0)
-                    }
-                    for doc in docs if doc.get('id')  # 确保有有效的文档ID
-                ]
+            related_docs = [
+                {
+                    'id': doc.get('id'),
+                    'filename': doc.get('original_filename', ''),
+                    'title': doc.get('title', ''),
+                    'category': doc.get('category', ''),
+                    'file_type': doc.get('file_type', ''),
+                    'relevance_score': doc.get('relevance_score', 0)
+                }
+                for doc in source_docs if doc.get('id')  # 确保有有效的文档ID
+            ]
             
             # 记录对话
             conversation_id = ai_conversation_manager.record_conversation(
@@ -436,9 +436,16 @@ async function handleUpload(event) {
         const data = await response.json();
         
         if (data.success) {
-            statusText.textContent = '上传成功！';
-            showNotification(data.message, 'success');
+            // 文件已上传，等待后台导入任务完成提取和索引
             resetUploadForm();
+            const job = await pollIngestionJob(data.job_id, progressBar, statusText);
+            if (job.status === 'failed') {
+                throw new Error(job.error || '文档处理失败');
+            }
+            
+            progressBar.style.width = '100%';
+            statusText.textContent = '上传成功！';
+            showNotification('文档上传成功', 'success');
             
             // 如果当前在文档管理页面，刷新列表
             if (!document.getElementById('documents-section').classList.contains('hidden')) {
@@ -462,6 +469,35 @@ async function handleUpload(event) {
     }
 }
 
+// 导入任务阶段说明
+const INGESTION_STAGES = {
+    started: '正在处理...',
+    extracting: '正在提取文本...',
+    analyzing: '正在分析内容...',
+    saving: '正在保存...',
+    indexing: '正在更新知识库索引...'
+};
+
+// 轮询导入任务状态，直到完成或失败
+async function pollIngestionJob(jobId, progressBar, statusText) {
+    while (true) {
+        const response = await fetch(`/admin/documents/jobs/${jobId}`);
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || '获取处理进度失败');
+        }
+        
+        const job = data.job;
+        if (job.status === 'completed' || job.status === 'failed') {
+            return job;
+        }
+        
+        progressBar.style.width = `${job.progress || 0}%`;
+        statusText.textContent = INGESTION_STAGES[job.stage] || '等待处理...';
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // 重置上传表单
 function resetUploadForm() {
     document.getElementById('upload-form').reset();
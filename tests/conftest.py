@@ -0,0 +1,48 @@
+"""
+测试公共配置
+Shared test setup: import path, temporary data directory and database fixtures
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+# 在导入任何模型模块之前指定数据目录：模块导入时创建的全局管理器使用临时目录，不读写仓库中的数据库
+TEST_DATA_DIR = tempfile.mkdtemp(prefix='ruishi-test-')
+os.environ['RUISHI_DATA_DIR'] = TEST_DATA_DIR
+
+from config.knowledge_config import knowledge_config  # noqa: E402
+
+knowledge_config['index_dir'] = os.path.join(TEST_DATA_DIR, 'index')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """单个测试的数据目录（数据库和上传目录都在其中）"""
+    return tmp_path
+
+
+@pytest.fixture
+def db_manager(data_dir):
+    """临时目录中的数据库"""
+    from models.database import DatabaseManager
+    manager = DatabaseManager(str(data_dir / 'ruishi_platform.db'))
+    yield manager
+    manager.pool.close_all()
+
+
+@pytest.fixture
+def document_manager(db_manager, data_dir):
+    """使用临时数据库和上传目录的文档管理器"""
+    from models.database import DocumentManager
+    return DocumentManager(db_manager, upload_dir=str(data_dir / 'uploads'))
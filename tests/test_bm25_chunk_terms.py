@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+测试BM25文档索引与片段索引共用词表
+Test BM25 queries containing terms that only occur in chunk texts
+"""
+
+from models.enhanced_knowledge import EnhancedDocument, BM25SearchEngine
+
+
+def make_document(doc_id: int, content: str) -> EnhancedDocument:
+    """构造测试文档（关键词和摘要直接给出，不做分词）"""
+    return EnhancedDocument(doc_id, f'doc{doc_id}.txt', content, 'txt',
+                            keywords=[], summary='')
+
+
+def prepared_texts(doc_text: str, chunk_texts: list) -> tuple:
+    """构造 prepare_document_texts 形式的索引文本，片段偏移覆盖整个正文"""
+    return doc_text, chunk_texts, [(0, 1)] * len(chunk_texts)
+
+
+def test_chunk_only_terms():
+    """只出现在片段中的词（如分块边界切出的词）不影响文档搜索，片段搜索能命中"""
+    engine = BM25SearchEngine()
+    engine.fit_documents(
+        [make_document(1, 'LabVIEW 数据采集'), make_document(2, 'PXI 机箱')],
+        [prepared_texts('labview 数据 采集', ['labview 示波器']),
+         prepared_texts('pxi 机箱', ['pxi 机箱'])]
+    )
+    assert engine.is_fitted
+
+    results = engine.search('LabVIEW 示波器')
+    assert [doc.doc_id for doc, _ in results] == [1]
+    chunks = engine.search_chunks('示波器')
+    assert [doc.doc_id for doc, _, _ in chunks] == [1]
+
+    # 增量添加的文档同样只在片段中带来新词
+    engine.add_document(make_document(3, 'PXI 触发'), prepared_texts('pxi 触发', ['pxi 同步']))
+    results = engine.search('PXI 同步')
+    assert sorted(doc.doc_id for doc, _ in results) == [2, 3]
+    assert engine.doc_index.term_freqs.shape[1] == len(engine.vocabulary)
+    assert engine.chunk_index.term_freqs.shape[1] == len(engine.vocabulary)
+
+    # 列数少于词表的索引（旧版本持久化的索引）跳过缺少的词
+    rows, _ = engine.doc_index.score([engine.vocabulary['labview'], len(engine.vocabulary)])
+    assert list(rows) == [0]
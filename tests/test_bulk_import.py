@@ -0,0 +1,81 @@
+"""
+测试文档批量导入
+Test bulk import from zip archives: GBK entry names, filtering and skipping already imported files
+"""
+
+import zipfile
+
+from models.bulk_import import BulkImporter, iter_import_entries, zip_entry_name
+
+GBK_NAME = '测试报告.txt'
+
+
+def write_zip(path, entries, gbk_entries=()):
+    """
+    写入zip；gbk_entries 中的文件名按GBK编码写入且不设UTF-8标志（模拟Windows压缩工具）
+
+    zipfile 写入非ASCII文件名时总是使用UTF-8，这里先写入同样字节长度的ASCII占位名再替换为GBK字节。
+    """
+    placeholders = {}
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+        for index, (name, data) in enumerate(gbk_entries):
+            encoded = name.encode('gbk')
+            placeholder = f'{index}'.encode('ascii').rjust(len(encoded), b'~')
+            placeholders[placeholder] = encoded
+            archive.writestr(placeholder.decode('ascii'), data)
+
+    raw = path.read_bytes()
+    for placeholder, encoded in placeholders.items():
+        raw = raw.replace(placeholder, encoded)
+    path.write_bytes(raw)
+
+
+def test_zip_entry_names(tmp_path):
+    path = tmp_path / 'names.zip'
+    write_zip(path, [('手册/说明.txt', b'utf-8 name'), ('dir\\win.txt', b'backslash')],
+              gbk_entries=[(GBK_NAME, b'gbk name')])
+
+    with zipfile.ZipFile(path) as archive:
+        names = [zip_entry_name(info) for info in archive.infolist()]
+    assert names == ['手册/说明.txt', 'dir/win.txt', GBK_NAME]
+
+
+def test_iter_entries_skips_metadata_and_unsupported(tmp_path):
+    path = tmp_path / 'mixed.zip'
+    write_zip(path, [
+        ('docs/a.txt', b'a'),
+        ('docs/.hidden.txt', b'hidden'),
+        ('__MACOSX/docs/._a.txt', b'resource fork'),
+        ('docs/image.png', b'png'),
+        ('docs/b.md', b'b'),
+    ], gbk_entries=[(GBK_NAME, b'gbk')])
+
+    assert [name for name, _, _ in iter_import_entries(str(path))] == ['docs/a.txt', 'docs/b.md', GBK_NAME]
+
+
+def test_import_skips_duplicates_and_reimports(tmp_path, document_manager):
+    body = 'PXIe机箱的背板触发总线用于多卡同步。'.encode('utf-8')
+    path = tmp_path / 'import.zip'
+    write_zip(path, [
+        ('a/manual.txt', body),
+        # 文件名和内容都相同：视为同一文件跳过
+        ('b/manual.txt', body),
+        # 内容相同但文件名不同：单独导入
+        ('b/copy.txt', body),
+        ('b/bad.pdf', b'not a pdf'),
+    ], gbk_entries=[(GBK_NAME, '数字万用表测量直流电压。'.encode('utf-8'))])
+
+    summary = BulkImporter(document_manager, user_id=1, workers=2).run(str(path))
+    assert {key: summary[key] for key in ('total', 'imported', 'skipped', 'failed')} == \
+        {'total': 5, 'imported': 3, 'skipped': 1, 'failed': 1}
+    assert summary['errors'][0]['file'] == 'b/bad.pdf'
+
+    # 内容相同的 copy.txt 作为近似重复取代了 manual.txt，但两者都已入库
+    filenames = {filename for filename, _ in document_manager.get_document_keys()}
+    assert filenames == {'manual.txt', 'copy.txt', GBK_NAME}
+
+    # 重新导入同一个压缩包不产生重复文档
+    again = BulkImporter(document_manager, user_id=1, workers=2).run(str(path))
+    assert (again['imported'], again['skipped']) == (0, 4)
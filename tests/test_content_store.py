@@ -0,0 +1,55 @@
+"""
+测试正文内容存储的片段读取和缓存计量
+Test byte-offset chunk reads from the content store and byte accounting of the content cache
+"""
+
+import pytest
+
+from models.content_store import ContentCache, ContentStore, content_cache
+from models.enhanced_knowledge import EnhancedDocument, byte_spans, split_into_chunks
+
+CONTENT = '第一行：PXIe机箱\nsecond line with ASCII\n第三行：触发总线和参考时钟\n' * 20
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore.create(str(tmp_path / 'content'))
+    yield store
+    store.lease.release()
+
+
+def test_byte_spans_match_char_slices():
+    spans = split_into_chunks(CONTENT, 60, 20)
+    encoded = CONTENT.encode('utf-8')
+
+    assert len(spans) > 1
+    for (start, end), (byte_start, byte_end) in zip(spans, byte_spans(CONTENT, spans)):
+        assert encoded[byte_start:byte_end].decode('utf-8') == CONTENT[start:end]
+
+
+def test_chunk_read_decodes_only_the_slice(store):
+    doc = EnhancedDocument(1, 'a.txt', CONTENT, 'text', keywords=[], summary='')
+    doc.attach_content_store(store)
+    spans = split_into_chunks(CONTENT, 60, 20)
+
+    for (start, end), (byte_start, byte_end) in zip(spans, byte_spans(CONTENT, spans)):
+        assert doc.content_slice(byte_start, byte_end) == CONTENT[start:end]
+    # 片段读取不把整篇正文放入缓存
+    assert content_cache.get((store.path, doc.content_offset)) is None
+    assert doc.content == CONTENT
+
+
+def test_cache_counts_encoded_bytes():
+    cache = ContentCache(max_bytes=100)
+    text = '触发' * 10  # 20个字符，60字节
+
+    cache.put('a', text, len(text.encode('utf-8')))
+    assert cache.get_statistics() == {'entries': 1, 'cached_bytes': 60, 'max_bytes': 100}
+
+    cache.put('b', text, len(text.encode('utf-8')))
+    assert cache.get('a') is None
+    assert cache.get('b') == text
+    assert cache.get_statistics()['cached_bytes'] == 60
+
+    cache.put('c', text * 2, 120)
+    assert cache.get('c') is None
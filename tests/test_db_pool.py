@@ -0,0 +1,102 @@
+"""
+测试SQLite连接池
+Test connection reuse, pragmas, transaction rollback on release and behavior after fork
+"""
+
+import os
+import json
+import sqlite3
+
+import pytest
+
+from models.db_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.commit()
+    conn.close()
+    yield pool
+    pool.close_all()
+
+
+def count_items(pool) -> int:
+    conn = pool.acquire()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_reuses_connections_with_pragmas(pool):
+    first = pool.acquire()
+    raw = first._conn
+    assert first.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert first.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    first.close()
+    first.close()  # 重复归还无影响
+
+    second = pool.acquire()
+    assert second._conn is raw
+    second.close()
+
+    stats = pool.stats()
+    assert (stats['created'], stats['reused'], stats['in_use'], stats['idle']) == (1, 2, 0, 1)
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute('SELECT 1')
+
+
+def test_release_rolls_back_and_caps_idle(pool):
+    conn = pool.acquire()
+    conn.execute("INSERT INTO items (name) VALUES ('uncommitted')")
+    conn.close()
+    assert count_items(pool) == 0
+
+    # 同时借出的连接超过 size 时新建，归还时超出部分关闭
+    borrowed = [pool.acquire() for _ in range(4)]
+    assert pool.stats()['peak_in_use'] == 4
+    for conn in borrowed:
+        conn.close()
+    stats = pool.stats()
+    assert (stats['idle'], stats['in_use']) == (2, 0)
+    assert stats['discarded'] == 2
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要fork')
+def test_child_process_does_not_reuse_parent_connections(pool):
+    parent_idle = pool.acquire()
+    borrowed = pool.acquire()  # fork时仍借出的连接
+    parent_raw = parent_idle._conn
+    parent_idle.close()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            conn = pool.acquire()
+            result = {'fresh': conn._conn not in (parent_raw, borrowed._conn)}
+            conn.execute("INSERT INTO items (name) VALUES ('from child')")
+            conn.commit()
+            conn.close()
+            # fork前借出的连接在子进程中归还时不进入空闲队列
+            borrowed.close()
+            result['idle'] = pool.stats()['idle']
+            result['in_use'] = pool.stats()['in_use']
+            os.write(write_fd, json.dumps(result).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        result = json.loads(f.read())
+    os.waitpid(pid, 0)
+
+    assert result == {'fresh': True, 'idle': 1, 'in_use': 0}
+    # 父进程的连接池不受影响，能读到子进程提交的数据
+    assert pool.stats()['in_use'] == 1
+    borrowed.close()
+    assert count_items(pool) == 1
+    assert pool.stats()['idle'] == 2
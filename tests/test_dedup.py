@@ -0,0 +1,85 @@
+"""
+测试近似重复文档检测
+Test MinHash similarity estimates, LSH banding and supersede thresholds at upload
+"""
+
+import pytest
+
+from config.knowledge_config import knowledge_config
+from models.dedup import (LSH_BANDS, estimate_similarity, lsh_buckets, minhash_signature, shingle_hashes,
+                          signature_from_blob, signature_to_blob)
+
+BASE = "".join(f"第{idx}节：PXI模块{idx}的采样率为{idx * 10}kS/s，支持星型触发同步。\n" for idx in range(60))
+# 改动一行：与 BASE 的shingle集合Jaccard相似度约0.97
+NEAR = BASE.replace("第30节：PXI模块30的采样率为300kS/s", "第30节：PXIe模块30的采样率为320kS/s")
+# 只保留前半部分：Jaccard相似度约0.5
+HALF = BASE[:len(BASE) // 2]
+OTHER = "".join(f"数字万用表第{idx}档测量直流电压，分辨率{idx}位半。\n" for idx in range(60))
+
+
+def jaccard(text_a: str, text_b: str) -> float:
+    a, b = set(shingle_hashes(text_a).tolist()), set(shingle_hashes(text_b).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_signature_basics():
+    signature = minhash_signature(BASE)
+    assert minhash_signature("   ") is None
+    assert estimate_similarity(signature, minhash_signature(BASE)) == 1.0
+    # 大小写和空白不影响签名
+    assert estimate_similarity(signature, minhash_signature(BASE.upper().replace("\n", " "))) == 1.0
+    assert (signature_from_blob(signature_to_blob(signature)) == signature).all()
+
+
+@pytest.mark.parametrize('other', [NEAR, HALF, OTHER])
+def test_estimate_tracks_jaccard(other):
+    estimate = estimate_similarity(minhash_signature(BASE), minhash_signature(other))
+    assert abs(estimate - jaccard(BASE, other)) < 0.12
+
+
+def test_lsh_bands():
+    buckets = lsh_buckets(minhash_signature(BASE))
+    assert [band for band, _ in buckets] == list(range(LSH_BANDS))
+
+    shared = set(buckets) & set(lsh_buckets(minhash_signature(NEAR)))
+    assert len(shared) >= LSH_BANDS // 2
+    assert not set(buckets) & set(lsh_buckets(minhash_signature(OTHER)))
+
+
+def superseded_by(document_manager, document_id: int):
+    conn = document_manager.db.get_connection()
+    try:
+        return conn.execute('SELECT superseded_by FROM documents WHERE id = ?', (document_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_near_duplicate_supersedes_old_document(document_manager):
+    old = document_manager.save_document(BASE.encode('utf-8'), 'v1.txt', user_id=1)
+    other = document_manager.save_document(OTHER.encode('utf-8'), 'dmm.txt', user_id=1)
+    half = document_manager.save_document(HALF.encode('utf-8'), 'half.txt', user_id=1)
+    assert superseded_by(document_manager, old) is None
+
+    new = document_manager.save_document(NEAR.encode('utf-8'), 'v2.txt', user_id=1)
+    assert superseded_by(document_manager, old) == new
+    # 相似度低于阈值的文档不受影响
+    assert superseded_by(document_manager, other) is None
+    assert superseded_by(document_manager, half) is None
+    assert old not in [row['id'] for row in document_manager.search_documents('采样率')]
+
+
+def test_lower_threshold_supersedes_partial_overlap(document_manager, monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'dedup_threshold', 0.4)
+    old = document_manager.save_document(BASE.encode('utf-8'), 'v1.txt', user_id=1)
+    other = document_manager.save_document(OTHER.encode('utf-8'), 'dmm.txt', user_id=1)
+
+    half = document_manager.save_document(HALF.encode('utf-8'), 'half.txt', user_id=1)
+    assert superseded_by(document_manager, old) == half
+    assert superseded_by(document_manager, other) is None
+
+
+def test_dedup_disabled(document_manager, monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'dedup_enabled', False)
+    old = document_manager.save_document(BASE.encode('utf-8'), 'v1.txt', user_id=1)
+    document_manager.save_document(NEAR.encode('utf-8'), 'v2.txt', user_id=1)
+    assert superseded_by(document_manager, old) is None
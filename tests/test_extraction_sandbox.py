@@ -0,0 +1,80 @@
+"""
+测试文档提取沙箱
+Test the extraction sandbox: results, worker reuse, timeout and memory limits
+"""
+
+import os
+import time
+
+import docx
+import pytest
+
+from config.knowledge_config import knowledge_config
+from models import document_text
+from models.extraction_sandbox import run_sandboxed, ExtractionFailed, MEMORY_LIMIT_SUPPORTED
+
+
+def current_pid() -> int:
+    return os.getpid()
+
+
+def sleep_for(seconds: float) -> str:
+    time.sleep(seconds)
+    return 'done'
+
+
+def allocate(megabytes: int) -> int:
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def fail() -> str:
+    raise ValueError('无法解析')
+
+
+@pytest.fixture(autouse=True)
+def sandbox_enabled(monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'extraction_sandbox', True)
+
+
+def test_runs_in_reused_worker_process():
+    pid = run_sandboxed(current_pid)
+    assert pid != os.getpid()
+    assert run_sandboxed(current_pid) == pid
+
+
+def test_error_is_reported_and_worker_kept():
+    pid = run_sandboxed(current_pid)
+    with pytest.raises(ExtractionFailed, match='ValueError'):
+        run_sandboxed(fail)
+    assert run_sandboxed(current_pid) == pid
+
+
+def test_timeout_kills_worker():
+    pid = run_sandboxed(current_pid)
+    started = time.monotonic()
+    with pytest.raises(ExtractionFailed, match='超时'):
+        run_sandboxed(sleep_for, 60, timeout=1)
+    assert time.monotonic() - started < 30
+    assert run_sandboxed(current_pid) != pid
+
+
+@pytest.mark.skipif(not MEMORY_LIMIT_SUPPORTED, reason='内存上限只在Linux上生效')
+def test_memory_limit_kills_worker():
+    pid = run_sandboxed(current_pid)
+    with pytest.raises(ExtractionFailed, match='内存'):
+        run_sandboxed(allocate, 512, memory_mb=64)
+    assert run_sandboxed(current_pid) != pid
+    assert run_sandboxed(allocate, 16, memory_mb=64) == 16 * 1024 * 1024
+
+
+def test_cached_extractor_runs_undecorated_function(tmp_path, monkeypatch):
+    """带缓存装饰器的提取函数在沙箱中执行原函数；闭包等不能按名称导入的函数不能在沙箱中执行"""
+    monkeypatch.setitem(knowledge_config, 'extraction_cache', False)
+    path = str(tmp_path / 'manual.docx')
+    document = docx.Document()
+    document.add_paragraph('PXI机箱触发总线')
+    document.save(path)
+
+    assert document_text.extract_word_text(path) == 'PXI机箱触发总线\n'
+    with pytest.raises(ValueError):
+        run_sandboxed(lambda: 'closure')
@@ -0,0 +1,43 @@
+"""
+测试索引构建工作进程池
+Test the index worker pool, including the per-chunk timeout
+"""
+
+import os
+import time
+
+from models.index_workers import IndexWorkerPool
+
+# 测试进程的PID：工作进程导入本模块时从环境变量继承，据此区分工作进程和测试进程
+TEST_PID = int(os.environ.setdefault('INDEX_WORKERS_TEST_PID', str(os.getpid())))
+
+
+def square_or_hang(item):
+    """整数返回平方；'hang' 在工作进程中挂起，在测试进程中（超时后的串行执行）直接返回"""
+    if item == 'hang':
+        if os.getpid() != TEST_PID:
+            time.sleep(600)
+        return 'serial'
+    return item * item
+
+
+def test_map_keeps_input_order():
+    pool = IndexWorkerPool(2)
+    try:
+        assert pool.map(square_or_hang, list(range(10)), chunksize=3) == [i * i for i in range(10)]
+    finally:
+        pool.shutdown()
+
+
+def test_timed_out_chunk_runs_serially():
+    """分块超时后结束挂起的工作进程，该分块在本进程中执行，其余分块和之后的任务照常由工作进程处理"""
+    pool = IndexWorkerPool(1)
+    try:
+        hung_pid = pool.workers[0].pid
+        started = time.monotonic()
+        assert pool.map(square_or_hang, [2, 'hang', 3], timeout=3) == [4, 'serial', 9]
+        assert time.monotonic() - started < 60
+        assert pool.workers[0].pid != hung_pid
+        assert pool.map(square_or_hang, [4, 5]) == [16, 25]
+    finally:
+        pool.shutdown()
@@ -0,0 +1,88 @@
+"""
+测试文档导入任务队列
+Test ingestion job claiming, state transitions and recovery of interrupted jobs
+"""
+
+import io
+import os
+import uuid
+
+import pytest
+
+from models.ingestion_queue import (IngestionQueue, STATUS_QUEUED, STATUS_PROCESSING, STATUS_COMPLETED,
+                                    STATUS_FAILED)
+
+
+@pytest.fixture
+def ingestion_queue(document_manager):
+    return IngestionQueue(document_manager, workers=1)
+
+
+def insert_job(queue: IngestionQueue, status: str, staged: bool = True, heartbeat: str = None,
+               owner: str = None) -> str:
+    """直接登记一个任务（模拟其他进程提交或处理中的任务）"""
+    job_id = uuid.uuid4().hex
+    staged_path = queue.staged_path_for(job_id)
+    if staged:
+        with open(staged_path, 'wb') as f:
+            f.write(f'任务 {job_id} 的测试文档内容'.encode('utf-8'))
+    conn = queue.db.get_connection()
+    try:
+        conn.execute('''
+            INSERT INTO ingestion_jobs (id, filename, staged_path, uploaded_by, status, owner, heartbeat_at)
+            VALUES (?, ?, ?, 1, ?, ?, ?)
+        ''', (job_id, f'{job_id}.txt', staged_path, status, owner, heartbeat))
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def test_job_completes(ingestion_queue):
+    job_id = ingestion_queue.submit_stream(io.BytesIO('PXI机箱触发总线'.encode('utf-8')), 'pxi.txt', user_id=1)
+    ingestion_queue.wait_until_idle()
+
+    job = ingestion_queue.get_job(job_id)
+    assert job['status'] == STATUS_COMPLETED
+    assert job['stage'] == 'done' and job['progress'] == 100
+    assert ingestion_queue.document_manager.get_document_content(job['document_id']) == 'PXI机箱触发总线'
+    assert not os.path.exists(ingestion_queue.staged_path_for(job_id))
+
+
+def test_claim_is_atomic(ingestion_queue, document_manager):
+    """同一任务只能被一个队列（进程）领取"""
+    other = IngestionQueue(document_manager, workers=1)
+    job_id = insert_job(ingestion_queue, STATUS_QUEUED)
+
+    assert ingestion_queue.claim_job(job_id)
+    assert not other.claim_job(job_id)
+    assert not ingestion_queue.claim_job(job_id)
+    assert ingestion_queue.get_job(job_id)['status'] == STATUS_PROCESSING
+
+
+def test_recover_only_stale_jobs(ingestion_queue):
+    """只恢复心跳过期或排队中的任务，其他进程正在处理的任务不受影响"""
+    stale = insert_job(ingestion_queue, STATUS_PROCESSING, heartbeat='2000-01-01 00:00:00', owner='gone:1:x')
+    lost = insert_job(ingestion_queue, STATUS_PROCESSING, staged=False, heartbeat='2000-01-01 00:00:00')
+    queued = insert_job(ingestion_queue, STATUS_QUEUED)
+    active = insert_job(ingestion_queue, STATUS_PROCESSING, owner='alive:2:y')
+    conn = ingestion_queue.db.get_connection()
+    try:
+        conn.execute('UPDATE ingestion_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?', (active,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    ingestion_queue.recover_jobs()
+    ingestion_queue.wait_until_idle()
+
+    assert ingestion_queue.get_job(stale)['status'] == STATUS_COMPLETED
+    assert ingestion_queue.get_job(queued)['status'] == STATUS_COMPLETED
+    assert ingestion_queue.get_job(lost)['status'] == STATUS_FAILED
+    assert ingestion_queue.get_job(active)['status'] == STATUS_PROCESSING
+
+
+def test_queue_does_not_recover_on_construction(ingestion_queue, document_manager):
+    job_id = insert_job(ingestion_queue, STATUS_PROCESSING, heartbeat='2000-01-01 00:00:00')
+    IngestionQueue(document_manager, workers=1)
+    assert ingestion_queue.get_job(job_id)['status'] == STATUS_PROCESSING
@@ -0,0 +1,65 @@
+"""
+测试多进程构建知识库索引
+Test knowledge index builds with several index worker processes
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# 构建超时（秒）：导入或构建挂起时测试失败而不是一直等待
+BUILD_TIMEOUT = 600
+
+# 在独立进程中导入知识库模块并同步构建索引，最后一行输出构建结果
+BUILD_SCRIPT = '''
+import json
+from config.knowledge_config import knowledge_config
+knowledge_config.update({'index_workers': %d, 'index_dir': %r, 'background_build': False, 'persist_index': False})
+from models.enhanced_knowledge import enhanced_knowledge_base
+started_on_import = enhanced_knowledge_base.started
+enhanced_knowledge_base.start()
+snapshot = enhanced_knowledge_base.snapshot
+print(json.dumps({
+    'started_on_import': started_on_import,
+    'status': enhanced_knowledge_base.get_index_state()['status'],
+    'documents': {str(doc_id): doc.keywords for doc_id, doc in snapshot.documents.items()}
+}, ensure_ascii=False))
+'''
+
+# 测试文档：内容互不相似，避免被近似重复检测取代
+DOCUMENTS = {
+    'pxi_chassis.txt': 'PXI机箱提供背板触发总线和参考时钟，适用于多通道同步采集系统。',
+    'labview_daq.txt': 'LabVIEW数据采集程序使用DAQmx驱动配置采样率、缓冲区和触发方式。',
+    'oscilloscope.txt': 'Oscilloscope bandwidth and sample rate determine the fastest edge that can be measured.',
+    'signal_generator.txt': '任意波形发生器输出调制信号，支持频率扫描和外部参考输入。',
+    'switch_matrix.txt': 'Switch matrix modules route instrument channels to the device under test.',
+    'thermocouple.txt': '热电偶测量需要冷端补偿，采集卡内置补偿传感器并提供开路检测。',
+}
+
+
+def build_index(data_dir, workers: int) -> dict:
+    """用指定的工作进程数在临时数据目录上构建索引，返回构建结果"""
+    result = subprocess.run(
+        [sys.executable, '-c', BUILD_SCRIPT % (workers, str(data_dir / 'index'))],
+        cwd=SRC_DIR, env=dict(os.environ, RUISHI_DATA_DIR=str(data_dir)),
+        capture_output=True, text=True, timeout=BUILD_TIMEOUT
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_parallel_index_build(document_manager, data_dir):
+    """index_workers > 1 时导入模块不构建索引，构建完成且结果与串行构建相同"""
+    for filename, text in DOCUMENTS.items():
+        document_manager.save_document(text.encode('utf-8'), filename, user_id=1)
+
+    serial = build_index(data_dir, 1)
+    parallel = build_index(data_dir, 2)
+
+    assert not parallel['started_on_import']
+    assert parallel['status'] == 'ready'
+    assert len(parallel['documents']) == len(DOCUMENTS)
+    assert parallel['documents'] == serial['documents']
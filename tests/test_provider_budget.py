@@ -0,0 +1,43 @@
+"""
+测试问答请求的提供商解析和上下文令牌预算
+Test that the provider and model are resolved before the context token budget is looked up
+"""
+
+import pytest
+
+pytest.importorskip('requests')
+
+from config.knowledge_config import knowledge_config  # noqa: E402
+from models.context_assembler import token_budget_for  # noqa: E402
+from models.llm_models import ClaudeProvider, LLMManager, VolcesDeepseekProvider  # noqa: E402
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'context_token_budgets', {'claude': 3000, 'volcesDeepseek': 1500})
+    manager = LLMManager()
+    manager.register_provider('claude', ClaudeProvider())
+    manager.register_provider('volcesDeepseek', VolcesDeepseekProvider())
+    return manager
+
+
+def test_auto_selected_provider_gets_its_budget(manager):
+    manager.initialize_model_selector()
+    provider, model = manager.resolve_provider('PXI机箱的背板触发总线如何同步多块板卡？')
+
+    assert provider in ('claude', 'volcesDeepseek')
+    assert model == manager.providers[provider].default_model
+    assert token_budget_for(provider, model) == knowledge_config['context_token_budgets'][provider]
+
+
+def test_explicit_provider_uses_its_default_model(manager):
+    manager.initialize_model_selector()
+    assert manager.resolve_provider('问题', 'volcesDeepseek') == \
+        ('volcesDeepseek', manager.providers['volcesDeepseek'].default_model)
+    assert manager.resolve_provider('问题', 'claude', 'claude-3-opus') == ('claude', 'claude-3-opus')
+
+
+def test_default_provider_without_selector(manager):
+    provider, model = manager.resolve_provider('问题')
+    assert (provider, model) == ('claude', manager.providers['claude'].default_model)
+    assert token_budget_for(provider, model) == 3000
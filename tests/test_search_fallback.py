@@ -0,0 +1,48 @@
+"""
+测试索引就绪前的文档搜索
+Test that document search falls back to the database while the index is not ready, regardless of hybrid_search
+"""
+
+import pytest
+
+from config.knowledge_config import knowledge_config
+from models.enhanced_knowledge import EnhancedKnowledgeBase
+
+
+@pytest.fixture
+def knowledge_base(document_manager, monkeypatch):
+    """使用临时数据库、尚未构建索引的知识库（不启动后台构建）"""
+    monkeypatch.setattr(EnhancedKnowledgeBase, 'document_manager', property(lambda self: document_manager))
+    monkeypatch.setitem(knowledge_config, 'hybrid_search', False)
+    base = EnhancedKnowledgeBase()
+    base.started = True
+    return base
+
+
+@pytest.fixture
+def documents(document_manager):
+    trigger = document_manager.save_document('PXIe机箱的背板触发总线用于多卡同步。'.encode('utf-8'),
+                                             'trigger.txt', user_id=1, title='触发总线')
+    other = document_manager.save_document('数字万用表测量直流电压和电阻。'.encode('utf-8'),
+                                           'dmm.txt', user_id=1, title='万用表')
+    return trigger, other
+
+
+@pytest.mark.parametrize('status', ['building', 'failed'])
+def test_search_uses_database_before_index_ready(knowledge_base, documents, status):
+    knowledge_base.index_state['status'] = status
+
+    results = knowledge_base.search_documents('触发总线')
+    assert [result['id'] for result in results] == [documents[0]]
+
+
+def test_search_falls_back_to_like_without_fts(knowledge_base, documents, document_manager, monkeypatch):
+    monkeypatch.setattr(document_manager.db, 'fts_enabled', False)
+
+    results = knowledge_base.search_documents('万用表')
+    assert [result['id'] for result in results] == [documents[1]]
+
+
+def test_context_uses_summaries_before_index_ready(knowledge_base, documents):
+    context = knowledge_base.assemble_context('触发总线')
+    assert [source['id'] for source in context.sources] == [documents[0]]
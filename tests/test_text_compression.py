@@ -0,0 +1,87 @@
+"""
+测试大文本列透明压缩
+Test text_codec round trips, the magic header and the compression migration
+"""
+
+import zlib
+
+import pytest
+
+from config.knowledge_config import knowledge_config, DEFAULT_KNOWLEDGE_CONFIG
+from models.text_codec import compress_text, decompress_text, is_compressed, MAGIC, CODEC_ZLIB
+
+LONG_TEXT = 'PXI机箱提供背板触发总线和参考时钟。' * 200
+
+
+@pytest.fixture
+def compression(monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'text_compression', True)
+    monkeypatch.setitem(knowledge_config, 'text_compression_codec', 'zlib')
+    monkeypatch.setitem(knowledge_config, 'text_compression_min_bytes', 512)
+
+
+def test_disabled_by_default(monkeypatch):
+    assert DEFAULT_KNOWLEDGE_CONFIG['text_compression'] is False
+    monkeypatch.setitem(knowledge_config, 'text_compression', False)
+    assert compress_text(LONG_TEXT) == LONG_TEXT
+
+
+def test_round_trip(compression):
+    packed = compress_text(LONG_TEXT)
+    assert isinstance(packed, bytes) and packed.startswith(MAGIC + CODEC_ZLIB)
+    assert is_compressed(packed)
+    assert decompress_text(packed) == LONG_TEXT
+    assert decompress_text(memoryview(packed)) == LONG_TEXT
+
+
+def test_short_text_stays_text(compression):
+    assert compress_text('短文本') == '短文本'
+    assert compress_text(None) is None
+
+
+def test_magic_header_handling():
+    """TEXT 原样返回；没有标记头的BLOB按UTF-8解码；未知编码器报错"""
+    assert decompress_text('旧数据') == '旧数据'
+    assert decompress_text('旧数据'.encode('utf-8')) == '旧数据'
+    assert not is_compressed('旧数据'.encode('utf-8'))
+    with pytest.raises(ValueError):
+        decompress_text(MAGIC + b'?' + zlib.compress(b'data'))
+
+
+def test_migration_compresses_existing_rows(db_manager, compression, monkeypatch):
+    monkeypatch.setitem(knowledge_config, 'text_compression', False)
+    conn = db_manager.get_connection()
+    try:
+        conn.execute('''
+            INSERT INTO documents (filename, original_filename, file_path, content_text)
+            VALUES ('a.txt', 'a.txt', 'a.txt', ?)
+        ''', (LONG_TEXT,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    monkeypatch.setitem(knowledge_config, 'text_compression', True)
+    db_manager.start_compression_migration()
+    db_manager.compression_thread.join()
+
+    conn = db_manager.get_connection()
+    try:
+        value = conn.execute('SELECT content_text FROM documents').fetchone()[0]
+        assert is_compressed(value) and decompress_text(value) == LONG_TEXT
+    finally:
+        conn.close()
+
+
+def test_maintenance_lease_is_exclusive(db_manager, compression):
+    lease = db_manager.acquire_maintenance_lease()
+    try:
+        assert db_manager.acquire_maintenance_lease() is None
+        db_manager.start_compression_migration()
+        assert db_manager.compression_thread is None
+        with pytest.raises(RuntimeError):
+            db_manager.reclaim_free_pages()
+    finally:
+        lease.release()
+
+    result = db_manager.reclaim_free_pages()
+    assert result['vacuumed']
@@ -0,0 +1,73 @@
+"""
+测试内容寻址的上传文件存储
+Test reference counting of content-addressed upload files and explicit collection
+"""
+
+import os
+
+CONTENT = 'PXI机箱提供背板触发总线和参考时钟。'.encode('utf-8')
+
+
+def blob_state(document_manager, document_id: int):
+    """文档引用的存储文件路径和引用计数"""
+    conn = document_manager.db.get_connection()
+    try:
+        filename = conn.execute('SELECT filename FROM documents WHERE id = ?', (document_id,)).fetchone()[0]
+        row = conn.execute('SELECT ref_count FROM upload_blobs WHERE filename = ?', (filename,)).fetchone()
+    finally:
+        conn.close()
+    return os.path.join(document_manager.upload_dir, filename), row[0] if row else None
+
+
+def test_identical_uploads_share_one_file(document_manager):
+    first = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    second = document_manager.save_document(CONTENT, 'b.txt', user_id=1)
+
+    path, ref_count = blob_state(document_manager, first)
+    assert blob_state(document_manager, second)[0] == path
+    assert ref_count == 2
+    assert [name for name in os.listdir(document_manager.upload_dir) if not name.startswith('.')] == \
+        [os.path.basename(path)]
+
+
+def test_delete_keeps_file_until_collected(document_manager):
+    first = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    second = document_manager.save_document(CONTENT, 'b.txt', user_id=1)
+    path, _ = blob_state(document_manager, first)
+
+    assert document_manager.delete_document(first)
+    assert blob_state(document_manager, first) == (path, 1)
+    assert document_manager.collect_unreferenced_blobs()['removed_files'] == 0
+    assert os.path.exists(path)
+
+    # 没有有效文档引用后文件仍保留（软删除），直到显式清理
+    assert document_manager.delete_document(second)
+    assert blob_state(document_manager, second) == (path, 0)
+    assert os.path.exists(path)
+
+    assert document_manager.collect_unreferenced_blobs() == {'removed_files': 1, 'freed_bytes': len(CONTENT)}
+    assert not os.path.exists(path)
+    assert blob_state(document_manager, second) == (path, None)
+
+
+def test_collect_skips_rereferenced_file(document_manager):
+    first = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    path, _ = blob_state(document_manager, first)
+    document_manager.delete_document(first)
+
+    again = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    assert blob_state(document_manager, again) == (path, 1)
+    assert document_manager.collect_unreferenced_blobs()['removed_files'] == 0
+    assert os.path.exists(path)
+
+
+def test_upload_after_collect_recreates_file(document_manager):
+    first = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    document_manager.delete_document(first)
+    document_manager.collect_unreferenced_blobs()
+
+    again = document_manager.save_document(CONTENT, 'a.txt', user_id=1)
+    path, ref_count = blob_state(document_manager, again)
+    assert ref_count == 1
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
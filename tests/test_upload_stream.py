@@ -0,0 +1,77 @@
+"""
+测试上传文件流式写入
+Test chunked upload streaming: size limit, hashing and MIME sniff rejection
+"""
+
+import io
+import hashlib
+
+import pytest
+
+from models.upload_stream import OLE_MAGIC, SNIFF_SIZE, ZIP_MAGIC, UploadRejected, sniff_mime_type, stream_to_file
+
+
+class CountingStream(io.BytesIO):
+    """记录每次读取长度的请求流"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def test_streams_in_chunks_and_hashes(tmp_path):
+    data = b'%PDF-1.7\n' + bytes(range(256)) * 200
+    stream = CountingStream(data)
+    path = str(tmp_path / 'upload.part')
+
+    staged = stream_to_file(stream, path, 'manual.pdf', chunk_size=4096)
+
+    assert staged.size == len(data)
+    assert staged.sha256 == hashlib.sha256(data).hexdigest()
+    assert staged.mime_type == 'application/pdf'
+    assert set(stream.reads) == {4096}
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_rejects_oversize_and_removes_partial_file(tmp_path):
+    path = tmp_path / 'upload.part'
+    stream = CountingStream(b'a' * 10000)
+
+    with pytest.raises(UploadRejected):
+        stream_to_file(stream, str(path), 'notes.txt', max_size=4096, chunk_size=1024)
+    assert not path.exists()
+    # 超出上限后不再继续读取
+    assert len(stream.reads) == 5
+
+
+def test_rejects_empty_upload(tmp_path):
+    path = tmp_path / 'upload.part'
+    with pytest.raises(UploadRejected):
+        stream_to_file(io.BytesIO(b''), str(path), 'notes.txt')
+    assert not path.exists()
+
+
+@pytest.mark.parametrize('filename, head', [
+    ('manual.pdf', b'<html>not a pdf</html>'),
+    ('report.docx', OLE_MAGIC + b'\x00' * 64),
+    ('report.doc', ZIP_MAGIC + b'\x00' * 64),
+    ('sheet.xlsx', b'plain text pretending to be a workbook'),
+])
+def test_rejects_content_that_does_not_match_extension(tmp_path, filename, head):
+    path = tmp_path / 'upload.part'
+    with pytest.raises(UploadRejected):
+        stream_to_file(io.BytesIO(head + b'\x00' * (SNIFF_SIZE * 2)), str(path), filename, chunk_size=1024)
+    assert not path.exists()
+
+
+def test_sniff_accepts_matching_headers():
+    assert sniff_mime_type(b'\x00\x00%PDF-1.4', 'a.pdf') == 'application/pdf'
+    # OOXML类型按系统MIME表返回（可能为None），只要求不拒绝
+    sniff_mime_type(ZIP_MAGIC, 'a.docx')
+    assert sniff_mime_type(OLE_MAGIC, 'a.xls') == 'application/vnd.ms-excel'
+    assert sniff_mime_type('中文'.encode('gbk'), 'a.txt') == 'text/plain'
@@ -0,0 +1,115 @@
+"""
+测试TF-IDF向量搜索引擎的增量添加
+Test incremental appends to the TF-IDF engine: pending row blocks, row lookup and export
+"""
+
+import pytest
+
+from models.content_store import ContentStore
+from models.enhanced_knowledge import EnhancedDocument, VectorSearchEngine, prepare_document_texts
+
+TOPICS = ['PXIe机箱背板触发总线', '数字万用表直流电压测量', '示波器采样率和带宽', '信号发生器任意波形输出']
+
+
+def make_document(doc_id: int, store: ContentStore = None) -> EnhancedDocument:
+    topic = TOPICS[doc_id % len(TOPICS)]
+    doc = EnhancedDocument(doc_id, f'doc{doc_id}.txt', f'{topic}，文档编号{doc_id}。\n' * 5, 'text',
+                           keywords=[], summary='')
+    if store is not None:
+        doc.attach_content_store(store)
+    return doc
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore.create(str(tmp_path / 'content'))
+    yield store
+    store.lease.release()
+
+
+@pytest.fixture
+def engine(store):
+    engine = VectorSearchEngine()
+    documents = [make_document(doc_id, store) for doc_id in range(8)]
+    engine.fit_documents(documents)
+    return engine
+
+
+def prepared(doc_id: int, store: ContentStore):
+    """(文档, 索引文本)：先准备索引文本再把正文写入内容存储"""
+    doc = make_document(doc_id)
+    texts = prepare_document_texts(doc)
+    doc.attach_content_store(store)
+    return doc, texts
+
+
+def search_ids(engine, query: str):
+    return [(doc.doc_id, round(score, 6)) for doc, score in engine.search(query, top_k=20)]
+
+
+def chunk_ids(engine, query: str):
+    return [(doc.doc_id, text, round(score, 6)) for doc, text, score in engine.search_chunks(query, top_k=50)]
+
+
+def test_appends_keep_blocks_logarithmic(engine, store):
+    for doc_id in range(8, 40):
+        engine.add_document(make_document(doc_id, store))
+
+    assert len(engine.pending_blocks) <= 6
+    assert sum(docs.shape[0] for docs, _ in engine.pending_blocks) == 32
+    assert sum(chunks.shape[0] for _, chunks in engine.pending_blocks) + engine.chunk_vectors.shape[0] == \
+        len(engine.chunk_doc_rows)
+
+    # 与一次性合并矩阵的结果相同
+    merged = engine.copy()
+    merged.document_vectors, merged.chunk_vectors = engine._merged_vectors()
+    merged.pending_blocks = []
+    for query in ('触发总线', '万用表 电压', '文档编号'):
+        assert search_ids(engine, query) == search_ids(merged, query)
+        assert chunk_ids(engine, query) == chunk_ids(merged, query)
+
+
+def test_find_row_tracks_readds_and_removals(engine, store):
+    engine.add_document(make_document(3, store))
+    assert engine._find_row(3) == len(engine.documents) - 1
+    assert 3 in engine.tombstones
+
+    assert engine.remove_document(3)
+    assert engine._find_row(3) is None
+    assert 3 not in {doc.doc_id for doc, _ in engine.search(TOPICS[3], top_k=20)}
+
+    engine.add_documents([prepared(doc_id, store) for doc_id in (3, 20)])
+    assert engine._find_row(3) == len(engine.documents) - 2
+    assert engine._find_row(20) == len(engine.documents) - 1
+
+
+def test_copy_does_not_share_appends(engine, store):
+    published = engine.copy()
+    engine.add_document(make_document(30, store))
+
+    assert published._find_row(30) is None
+    assert not published.pending_blocks
+    assert 30 in {doc.doc_id for doc, _ in engine.search(TOPICS[2], top_k=20)}
+    assert 30 not in {doc.doc_id for doc, _ in published.search(TOPICS[2], top_k=20)}
+
+
+def test_export_merges_pending_blocks(engine, store):
+    for doc_id in range(8, 14):
+        engine.add_document(make_document(doc_id, store))
+    engine.remove_document(2)
+
+    arrays, metadata = engine.export_state()
+    restored = VectorSearchEngine.from_state(arrays, metadata, store)
+
+    assert not restored.pending_blocks
+    assert restored._find_row(13) == len(restored.documents) - 1
+    for query in ('触发总线', '示波器 带宽'):
+        assert search_ids(restored, query) == search_ids(engine, query)
+        assert chunk_ids(restored, query) == chunk_ids(engine, query)
+
+
+def test_add_documents_appends_one_block(engine, store):
+    engine.add_documents([prepared(doc_id, store) for doc_id in (50, 51)])
+
+    assert [docs.shape[0] for docs, _ in engine.pending_blocks] == [2]
+    assert {50, 51} <= {doc.doc_id for doc, _ in engine.search(f'{TOPICS[2]} {TOPICS[3]}', top_k=20)}